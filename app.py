@@ -1,20 +1,43 @@
 import streamlit as st
 import os, sys
 import math
-import requests
-from typing import List
-from io import BytesIO
-from utils.session import update_request, SessionState
-from utils.crawling.midjourney import crawl_midjourney, login_to_midjourney
-from utils.crawling.openart_ai import crawl_openartai, crawl_openartai_similar_images
-from utils.data_classes import MidjourneyImage, CrawlingTargetPage
-from llm_few_shot_gen.generators import MidjourneyPromptGenerator
+import time
+import hashlib
+from typing import TYPE_CHECKING, List, Iterable, Optional, Set, Tuple, Union
+from utils.session import update_request, is_debug, is_crawl_force_refresh, is_generation_cache_bypassed, set_session_state_if_not_exists, SessionState
+from utils.crawling import crawl_midjourney, login_to_midjourney, stream_midjourney, crawl_openartai, crawl_openartai_similar_images, stream_openartai, get_driver_pool, get_adaptive_timeouts, get_circuit_breaker
+from utils.crawling.fan_out import fan_out_crawl, TermStatus
+from utils.data_classes import MidjourneyImage, CrawlingTargetPage, CrawlingData, CrawlingBackend, CrawlReport
+from utils.crawling.cache import get_crawl_cache
+from utils.crawling.jobs import get_crawl_job_queue, CrawlJob, CrawlJobStatus, CrawlJobQueueFull
+from utils.cache import CacheStats
+from utils.image_service import get_image_service, ImageServiceStats
+from utils.prompt_generation import create_llm, generate_midjourney_prompts_batch, stream_midjourney_prompts, PromptGenerationUpdate
+from utils.generation_cache import get_generation_cache
+from utils.prompt_corpus import get_prompt_corpus, PromptCorpusStats
+from utils.tracing import get_tracer, span, traced
+from utils.few_shot_selection import select_few_shot_examples
+from utils.columnar import ColumnarFormat, serialize_midjourney_images, deserialize_midjourney_images
 from llm_few_shot_gen.models.output import ImagePromptOutputModel
-from langchain.chat_models.openai import ChatOpenAI
+
+if TYPE_CHECKING:
+    from langchain.base_language import BaseLanguageModel
+    from utils.driver_pool import DriverPoolStats
 
 os.environ["OPENAI_API_KEY"] = st.secrets["open_ai_api_key"]
 
 MAX_IMAGES_PER_ROW = 4
+MAX_STREAMING_IMAGES = 200
+CRAWL_JOB_TIMEOUT_SEC = 120
+CRAWL_JOB_POLL_SEC = 0.5
+MAX_FAN_OUT_CONCURRENCY = int(os.environ.get("FAN_OUT_CONCURRENCY", 2))
+MAX_FAN_OUT_IMAGES_PER_TERM = 50
+MAX_PROMPT_GEN_CONCURRENCY = int(os.environ.get("PROMPT_GEN_CONCURRENCY", 4))
+# about the width of one grid column in wide layout
+THUMBNAIL_WIDTH = 384
+# images per page of the results grid (multiple of MAX_IMAGES_PER_ROW)
+GRID_PAGE_SIZE = int(os.environ.get("GRID_PAGE_SIZE", 24))
+GRID_ROW_CACHE_ENTRIES = 256
 
 st.set_page_config(
     page_title="Midjourney Prompt Generator",
@@ -22,54 +45,235 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-@st.cache_data
-def image_url2image_bytes_io(image_url: str) -> BytesIO:
-    response = requests.get(image_url)
-    return BytesIO(response.content)
+def midjourney_images_hash(midjourney_images: Iterable[MidjourneyImage]) -> str:
+    """Content hash of image urls and prompts"""
+    content_hash = hashlib.sha1()
+    for midjourney_image in midjourney_images:
+        content_hash.update(f"{midjourney_image.image_url}\0{midjourney_image.prompt}\0".encode("utf-8"))
+    return content_hash.hexdigest()
+
+
+@st.cache_resource(max_entries=GRID_ROW_CACHE_ENTRIES, show_spinner=False)
+def load_grid_row(row_hash: str, _midjourney_images: Tuple[MidjourneyImage, ...]) -> List[Union[bytes, str]]:
+    """ Images of one grid row, memoized by the content hash of the row (the row itself is not hashed by streamlit).
+    Falls back to the original image url, if a thumbnail could not be created.
+    """
+    with span("image_service.thumbnails"):
+        thumbnails = get_image_service().get_thumbnails([img.image_url for img in _midjourney_images], THUMBNAIL_WIDTH)
+    return [thumbnail if thumbnail is not None else midjourney_image.image_url
+            for midjourney_image, thumbnail in zip(_midjourney_images, thumbnails)]
 
-def split_list(list_obj, split_size):
-    return [list_obj[i:i+split_size] for i in range(0, len(list_obj), split_size)]
 
-def display_midjourney_images(midjourney_images: List[MidjourneyImage], tab, make_collapsable=False):
+@traced()
+def display_midjourney_images(midjourney_images: List[MidjourneyImage], tab, make_collapsable=False,
+                              selected_prompts: Optional[Set[int]] = None, key: str = "crawling"):
     """ Displays already crawled midjourney images with prompts to frontend.
+    Only one page of GRID_PAGE_SIZE images is rendered, so that a rerun costs the same for any number of images.
+    Rows are memoized by their content hash, a changed selection only changes the highlighted captions.
     """
+    selected_prompts = selected_prompts or set()
+    page_count = max(1, math.ceil(len(midjourney_images) / GRID_PAGE_SIZE))
+    page_key = f"grid_page_{key}"
+    # results can shrink (e.g. a new crawl), the page number must stay in range
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
 
     with tab:
-        expander = st.expander("Collapse Midjourney images", expanded=True) if make_collapsable else st
-        progress_text = "Display crawling results..."
-        crawling_progress_bar = expander.progress(89, text=progress_text)
-        display_images = expander.empty()
-        display_cols = display_images.columns(MAX_IMAGES_PER_ROW)
-        for j, midjourney_images_splitted_list in enumerate(split_list(midjourney_images, MAX_IMAGES_PER_ROW)):
-            for i, midjourney_image in enumerate(midjourney_images_splitted_list):
-                crawling_progress_bar.progress(math.ceil(89 + (10 / len(midjourney_images) * ((j * MAX_IMAGES_PER_ROW) + i)) + 1),
-                                               text=progress_text)
-                #image_bytes_io: BytesIO = image_url2image_bytes_io(midjourney_image.image_url)
-                #display_cols[i].image(image_bytes_io)
-                display_cols[i].image(midjourney_image.image_url)
-                #color = "black" if not midjourney_image.selected else "green"
-                #display_cols[i].markdown(f":{color}[{(j * MAX_IMAGES_PER_ROW) + i + 1}. {mba_product.title}]")
-                display_cols[i].write(f"{(j * MAX_IMAGES_PER_ROW) + i + 1}: {midjourney_image.prompt}")
+        container = st.expander("Collapse Midjourney images", expanded=True) if make_collapsable else st.container()
+        page = 1
+        if page_count > 1:
+            page = container.number_input(f"Page (of {page_count}, {len(midjourney_images)} images)", min_value=1,
+                                          max_value=page_count, step=1, key=page_key)
+        page_start = (page - 1) * GRID_PAGE_SIZE
+        for row_start in range(page_start, min(page_start + GRID_PAGE_SIZE, len(midjourney_images)), MAX_IMAGES_PER_ROW):
+            row_images = tuple(midjourney_images[row_start:min(row_start + MAX_IMAGES_PER_ROW, page_start + GRID_PAGE_SIZE)])
+            display_cols = container.columns(MAX_IMAGES_PER_ROW)
+            for i, (midjourney_image, image) in enumerate(zip(row_images, load_grid_row(midjourney_images_hash(row_images), row_images))):
+                image_nr = row_start + i + 1
+                display_cols[i].image(image)
+                if image_nr in selected_prompts:
+                    display_cols[i].success(f"{image_nr}: {midjourney_image.prompt}")
+                else:
+                    display_cols[i].write(f"{image_nr}: {midjourney_image.prompt}")
 
+
+def display_midjourney_images_stream(midjourney_image_batches: Iterable[List[MidjourneyImage]], tab, target_count: int) -> List[MidjourneyImage]:
+    """ Displays midjourney images batch by batch while they are crawled.
+        Returns all displayed midjourney images.
+    """
+    midjourney_images: List[MidjourneyImage] = []
+    with tab:
+        progress_text = "Crawling Midjourney images"
+        crawling_progress_bar = st.progress(0, text=progress_text)
+        live_images = st.empty()
+        display_cols = live_images.container().columns(MAX_IMAGES_PER_ROW)
+        for midjourney_image_batch in midjourney_image_batches:
+            # only the first page is displayed live, the paginated grid displays all images afterwards
+            live_batch = midjourney_image_batch[:max(0, GRID_PAGE_SIZE - len(midjourney_images))]
+            thumbnails = get_image_service().get_thumbnails([img.image_url for img in live_batch], THUMBNAIL_WIDTH)
+            for i, (midjourney_image, thumbnail) in enumerate(zip(live_batch, thumbnails), start=len(midjourney_images)):
+                display_cols[i % MAX_IMAGES_PER_ROW].image(thumbnail if thumbnail is not None else midjourney_image.image_url)
+                display_cols[i % MAX_IMAGES_PER_ROW].write(f"{i + 1}: {midjourney_image.prompt}")
+            midjourney_images.extend(midjourney_image_batch)
+            crawling_progress_bar.progress(min(100, int(100 * len(midjourney_images) / target_count)),
+                                           text=progress_text + f": {len(midjourney_images)} images...")
         crawling_progress_bar.empty()
+        live_images.empty()
+    return midjourney_images
 
 
-def display_prompt_generation_tab(midjourney_images, selected_prompts, tab_prompt_gen, tab_crawling):
-    # make sure crawling page is displayed as well
-    display_midjourney_images(midjourney_images, tab_crawling, make_collapsable=False)
+def crawl_streaming(tab_crawling, target_page: CrawlingTargetPage):
+    """ Crawls until MAX_STREAMING_IMAGES images are found (infinite scrolling) and displays them while they arrive.
+    """
+    set_session_state_if_not_exists()
+    session_state: SessionState = st.session_state["session_state"]
+    search_term = session_state.crawling_request.search_term
+    report = CrawlReport()
+    if target_page == CrawlingTargetPage.OPENART:
+        midjourney_image_batches = stream_openartai(search_term, target_count=MAX_STREAMING_IMAGES,
+                                                    force_refresh=is_crawl_force_refresh(),
+                                                    backend=session_state.crawling_request.backend, report=report)
+    else:
+        midjourney_image_batches = stream_midjourney(search_term, session_state.midjourney_cookies,
+                                                     target_count=MAX_STREAMING_IMAGES,
+                                                     force_refresh=is_crawl_force_refresh(), report=report,
+                                                     account=session_state.midjourney_account)
+    midjourney_images = display_midjourney_images_stream(midjourney_image_batches, tab_crawling, MAX_STREAMING_IMAGES)
+    if not report.completed:
+        tab_crawling.warning(f"Crawling was not completed: {report.summary()}")
+    session_state.crawling_data = CrawlingData(midjourney_images=midjourney_images)
+
+
+def crawl_fan_out(tab_crawling, target_page: CrawlingTargetPage):
+    """ Crawls all comma separated search terms in parallel and displays the merged results while they arrive.
+    """
+    set_session_state_if_not_exists()
+    session_state: SessionState = st.session_state["session_state"]
+    search_terms = st.session_state.get("fan_out_search_terms", "").split(",")
+    progress_bars = {}
+    with tab_crawling:
+        progress_container = st.container()
+        live_images = st.empty()
+        display_cols = live_images.container().columns(MAX_IMAGES_PER_ROW)
+    image_count = 0
+    for update in fan_out_crawl(target_page, search_terms, cookies=session_state.midjourney_cookies, account=session_state.midjourney_account,
+                                max_concurrency=MAX_FAN_OUT_CONCURRENCY, target_count_per_term=MAX_FAN_OUT_IMAGES_PER_TERM,
+                                force_refresh=is_crawl_force_refresh(), backend=session_state.crawling_request.backend):
+        if update.search_term not in progress_bars:
+            progress_bars[update.search_term] = progress_container.progress(0, text=update.search_term)
+        progress_value = 100 if update.status in (TermStatus.DONE, TermStatus.FAILED) else min(100, int(100 * update.image_count / MAX_FAN_OUT_IMAGES_PER_TERM))
+        progress_bars[update.search_term].progress(progress_value, text=f"{update.search_term}: {update.image_count} images ({update.status})")
+        if update.error:
+            tab_crawling.warning(f"Crawling of '{update.search_term}' failed: {update.error}")
+        elif update.report is not None and update.report.partial:
+            tab_crawling.warning(f"Crawling of '{update.search_term}' was not completed: {update.report.summary()}")
+        # only the first page is displayed live, the paginated grid displays all images afterwards
+        live_batch = update.new_images[:max(0, GRID_PAGE_SIZE - image_count)]
+        thumbnails = get_image_service().get_thumbnails([img.image_url for img in live_batch], THUMBNAIL_WIDTH)
+        for midjourney_image, thumbnail in zip(live_batch, thumbnails):
+            display_cols[image_count % MAX_IMAGES_PER_ROW].image(thumbnail if thumbnail is not None else midjourney_image.image_url)
+            display_cols[image_count % MAX_IMAGES_PER_ROW].write(f"{image_count + 1}: {midjourney_image.prompt} ({midjourney_image.search_term})")
+            image_count += 1
+        session_state.crawling_data = update.crawling_data
+    live_images.empty()
+
+
+def import_crawling_data():
+    """ Adds the midjourney images of an uploaded results file (Arrow or Parquet) to the crawling results of this session.
+    """
+    uploaded_file = st.session_state.get("crawling_data_upload")
+    if uploaded_file is None:
+        return
+    set_session_state_if_not_exists()
+    session_state: SessionState = st.session_state["session_state"]
+    try:
+        session_state.crawling_data.midjourney_images.extend(deserialize_midjourney_images(uploaded_file.getvalue()))
+    except Exception as e:
+        st.sidebar.error(f"Could not import crawling results: {e}")
+
 
+def display_crawling_data_export():
+    """ Offers the crawling results of this session as Parquet file, which can be imported in another session.
+    The file is only created on request, so that reruns do not serialize all results.
+    """
+    session_state: SessionState = st.session_state["session_state"]
+    if st.sidebar.button("Export crawling results", key="button_crawling_data_export"):
+        st.sidebar.download_button("Download crawling results",
+                                   serialize_midjourney_images(session_state.crawling_data.midjourney_images, ColumnarFormat.PARQUET),
+                                   file_name="midjourney_images.parquet", key="button_crawling_data_download")
+
+
+def start_crawl_job(target_page: CrawlingTargetPage):
+    """ Starts a crawl in a background worker (or joins an identical running crawl).
+    """
+    set_session_state_if_not_exists()
+    session_state: SessionState = st.session_state["session_state"]
+    try:
+        st.session_state["crawl_job"] = get_crawl_job_queue().submit(target_page, session_state.crawling_request.search_term,
+                                                                    cookies=session_state.midjourney_cookies,
+                                                                    account=session_state.midjourney_account,
+                                                                    timeout_sec=CRAWL_JOB_TIMEOUT_SEC,
+                                                                    target_count=MAX_STREAMING_IMAGES,
+                                                                    backend=session_state.crawling_request.backend)
+    except CrawlJobQueueFull as e:
+        st.error(str(e))
+
+
+def cancel_crawl_job():
+    if "crawl_job" in st.session_state:
+        get_crawl_job_queue().cancel(st.session_state.pop("crawl_job"))
+
+
+def poll_crawl_job(tab_crawling) -> bool:
+    """ Displays the current progress of the crawl job of this session without waiting for it.
+        Returns True if a crawl job finished successfully.
+    """
+    crawl_job: CrawlJob = st.session_state.get("crawl_job")
+    if crawl_job is None:
+        return False
+    if not crawl_job.done:
+        # refreshed by rerun_while_crawl_job_running
+        tab_crawling.progress(crawl_job.progress_value, text=crawl_job.progress_text)
+        return False
+    del st.session_state["crawl_job"]
+    if crawl_job.status != CrawlJobStatus.DONE:
+        tab_crawling.error(f"Crawling {crawl_job.status.value}: {crawl_job.error}")
+        return False
+    if crawl_job.report.partial:
+        tab_crawling.warning(f"Crawling was not completed: {crawl_job.report.summary()}")
+    session_state: SessionState = st.session_state["session_state"]
+    session_state.crawling_data = crawl_job.result
+    return True
+
+
+def rerun_while_crawl_job_running():
+    """ Reruns the script every CRAWL_JOB_POLL_SEC while the crawl job of this session is running, so that its progress is refreshed.
+        Must be called at the end of the script, nothing after it is rendered.
+    """
+    crawl_job: Optional[CrawlJob] = st.session_state.get("crawl_job")
+    if crawl_job is not None and not crawl_job.done:
+        time.sleep(CRAWL_JOB_POLL_SEC)
+        st.experimental_rerun()
+
+
+def display_prompt_generation_tab(midjourney_images, selected_prompts, tab_prompt_gen, tab_crawling):
     # Few Shot learning
+    selected_prompts = get_selected_prompts(midjourney_images, selected_prompts)
     prompts = [mid_img.prompt for i, mid_img in enumerate(midjourney_images) if (i + 1) in selected_prompts]
 
-    with tab_prompt_gen:
-        with st.spinner('Wait for prompt generation'):
-            llm_output: ImagePromptOutputModel = generate_midjourney_prompts(prompts)
-
-    tab_prompt_gen.subheader("Generated Prompts")
-    #if tab_prompt_gen.button("Regenerate Prompt"):
-    #    llm_output = generate_midjourney_prompts(prompts)
-    #print("llm_output", llm_output)
-    tab_prompt_gen.write(llm_output.image_prompts)
+    if st.session_state.get("prompt_gen_streaming", True):
+        tab_prompt_gen.subheader("Generated Prompts")
+        llm_output: ImagePromptOutputModel = generate_midjourney_prompts_streaming(prompts, tab_prompt_gen.empty())
+    else:
+        with tab_prompt_gen:
+            with st.spinner('Wait for prompt generation'):
+                llm_output: ImagePromptOutputModel = generate_midjourney_prompts(prompts)
+
+        tab_prompt_gen.subheader("Generated Prompts")
+        #if tab_prompt_gen.button("Regenerate Prompt"):
+        #    llm_output = generate_midjourney_prompts(prompts)
+        #print("llm_output", llm_output)
+        tab_prompt_gen.write(llm_output.image_prompts)
     tab_prompt_gen.subheader("Detected Art Styles")
     tab_prompt_gen.write(llm_output.few_shot_styles)
     tab_prompt_gen.subheader("Detected Artists")
@@ -79,14 +283,110 @@ def display_prompt_generation_tab(midjourney_images, selected_prompts, tab_promp
     tab_prompt_gen.subheader("Selected Midjourney Images")
     selected_midjourney_images = [mid_img for i, mid_img in enumerate(midjourney_images) if
                                   (i + 1) in selected_prompts]
-    display_midjourney_images(selected_midjourney_images, tab_prompt_gen, make_collapsable=True)
+    display_midjourney_images(selected_midjourney_images, tab_prompt_gen, make_collapsable=True, key="prompt_gen")
+
+def get_selected_prompts(midjourney_images, selected_prompts) -> Set[int]:
+    """ Returns the numbers (starting at 1) of the selected midjourney images.
+    In auto selection mode the most relevant and diverse examples for the prompt generation input are selected.
+    """
+    if st.session_state.get("few_shot_auto_selection", False):
+        selected_indices = select_few_shot_examples(midjourney_images, st.session_state["prompt_gen_input"],
+                                                    k=st.session_state.get("few_shot_count", 5))
+        return {i + 1 for i in selected_indices}
+    return set(selected_prompts)
+
+
+def display_driver_pool_stats():
+    """ Displays utilisation of the process wide selenium driver pool, crawl cache, page readiness waits, image cache, generation cache and prompt corpus in the sidebar.
+    """
+    stats: DriverPoolStats = get_driver_pool().stats()
+    with st.sidebar.expander("Browser Pool"):
+        st.write(f"Leased drivers: {stats.leased}/{stats.max_size} (idle: {stats.idle})")
+        st.write(f"Driver wait time: avg {stats.wait_time_avg_sec:.2f}s, max {stats.wait_time_max_sec:.2f}s")
+        st.write(f"Recycled drivers: {stats.recycled_total} (crashed or above memory limit)")
+        for target_page in CrawlingTargetPage:
+            st.write(f"Circuit {target_page.value}: {get_circuit_breaker(target_page).state.value}")
+    crawl_cache_stats: CacheStats = get_crawl_cache().stats()
+    with st.sidebar.expander("Crawl Cache"):
+        st.write(f"Hits: {crawl_cache_stats.hits}, misses: {crawl_cache_stats.misses} (hit rate {crawl_cache_stats.hit_rate:.0%})")
+        st.write(f"Cached crawls: {crawl_cache_stats.entries}")
+    with st.sidebar.expander("Page Readiness"):
+        for step, latency in get_adaptive_timeouts().stats().items():
+            st.write(f"{step}: avg {latency.mean_sec:.2f}s ({latency.observations} waits, {latency.timeouts} timeouts)")
+    image_stats: ImageServiceStats = get_image_service().stats()
+    with st.sidebar.expander("Image Cache"):
+        st.write(f"Memory hits: {image_stats.memory_hits}, disk hits: {image_stats.disk_hits}, fetches: {image_stats.fetches} ({image_stats.fetch_errors} errors)")
+        st.write(f"Memory cache: {image_stats.memory_bytes / 1024 / 1024:.1f} MB")
+    generation_cache_stats: CacheStats = get_generation_cache().stats()
+    with st.sidebar.expander("Generation Cache"):
+        st.write(f"Hits: {generation_cache_stats.hits}, misses: {generation_cache_stats.misses} (hit rate {generation_cache_stats.hit_rate:.0%})")
+        st.write(f"Cached generations: {generation_cache_stats.entries}")
+    prompt_corpus_stats: PromptCorpusStats = get_prompt_corpus().stats()
+    with st.sidebar.expander("Prompt Corpus"):
+        st.write(f"Indexed prompts: {prompt_corpus_stats.prompts}")
+        st.write(f"Searches: {prompt_corpus_stats.searches} (avg {prompt_corpus_stats.search_time_avg_sec * 1000:.1f}ms)")
+
 
+def display_tracing_stats():
+    """ Displays latency percentiles per pipeline step and the most recent traces in the sidebar.
+    """
+    tracer = get_tracer()
+    with st.sidebar.expander("Tracing"):
+        tracer.enabled = st.checkbox("Enable tracing", value=tracer.enabled, key="tracing_enabled")
+        histograms = tracer.histograms()
+        if not histograms:
+            st.write("No spans recorded yet")
+            return
+        st.table([{"step": name, "count": histogram.count, "p50 (s)": round(histogram.percentile(0.5), 3),
+                   "p95 (s)": round(histogram.percentile(0.95), 3)} for name, histogram in sorted(histograms.items())])
+        for trace in reversed(tracer.recent_traces()[-3:]):
+            st.text("\n".join(f"{'  ' * finished_span.depth}{finished_span.name}: {finished_span.duration_sec:.3f}s"
+                              f"{' (' + finished_span.error + ')' if finished_span.error else ''}" for finished_span in trace))
+        st.download_button("Prometheus metrics", tracer.export_prometheus(), file_name="metrics.txt")
+        st.download_button("JSON metrics", tracer.export_json(), file_name="metrics.json")
+
+
+@st.cache_resource
+def get_llm(temperature: float) -> "BaseLanguageModel":
+    """ One llm client per temperature and process, so that reruns and sessions reuse the client and its http connections.
+    """
+    return create_llm(temperature)
+
+
+@traced()
 def generate_midjourney_prompts(prompts) -> ImagePromptOutputModel:
-    llm = ChatOpenAI(temperature=st.session_state["temperature"], model_name="gpt-3.5-turbo")
-    midjourney_prompt_gen = MidjourneyPromptGenerator(llm, pydantic_cls=ImagePromptOutputModel)
-    midjourney_prompt_gen.set_few_shot_examples(prompts)
-    llm_output = midjourney_prompt_gen.generate(text=st.session_state["prompt_gen_input"])
-    return llm_output
+    return generate_midjourney_prompts_batch(prompts, [st.session_state["prompt_gen_input"]],
+                                             llm=get_llm(st.session_state["temperature"]),
+                                             use_cache=False if is_generation_cache_bypassed() else None)[0]
+
+
+@traced()
+def generate_midjourney_prompts_streaming(prompts, placeholder) -> ImagePromptOutputModel:
+    """ Displays the generated image prompts in placeholder while the llm streams them.
+    """
+    placeholder.info("Wait for prompt generation...")
+    update: PromptGenerationUpdate
+    for update in stream_midjourney_prompts(prompts, st.session_state["prompt_gen_input"],
+                                            llm=get_llm(st.session_state["temperature"]),
+                                            use_cache=False if is_generation_cache_bypassed() else None):
+        placeholder.write(update.image_prompts)
+    return update.llm_output
+
+
+def display_batch_prompt_generation_tab(midjourney_images, selected_prompts, tab_prompt_gen):
+    """ Generates prompts for every line of the batch input with the same selected few shot examples.
+    """
+    selected_prompts = set(selected_prompts)
+    prompts = [mid_img.prompt for i, mid_img in enumerate(midjourney_images) if (i + 1) in selected_prompts]
+    texts = [text.strip() for text in st.session_state["prompt_gen_inputs"].split("\n") if text.strip()]
+    with tab_prompt_gen:
+        with st.spinner(f'Wait for prompt generation of {len(texts)} inputs'):
+            llm_outputs: List[ImagePromptOutputModel] = generate_midjourney_prompts_batch(
+                prompts, texts, llm=get_llm(st.session_state["temperature"]), max_concurrency=MAX_PROMPT_GEN_CONCURRENCY,
+                use_cache=False if is_generation_cache_bypassed() else None)
+    for text, llm_output in zip(texts, llm_outputs):
+        tab_prompt_gen.subheader(f"Generated Prompts: {text}")
+        tab_prompt_gen.write(llm_output.image_prompts)
 
 
 def main():
@@ -115,32 +415,66 @@ def main():
     #     st.sidebar.text_input("Midjourney Email", value=os.environ.get("user_name", ""), key="mid_email")
     #     st.sidebar.text_input("Midjourney Password", type="password", value=os.environ.get("password", ""), key="mid_password")
     #     st.sidebar.button("Login", on_click=login_to_midjourney, key="button_midjourney_login")
+    # else:
+    #     st.sidebar.selectbox("Crawling backend", options=[CrawlingBackend.SELENIUM.value, CrawlingBackend.HTTP.value, CrawlingBackend.CORPUS.value], key="crawling_backend", on_change=update_request)
     #
     # st.sidebar.subheader("2. Midjourney Crawling")
     # st.sidebar.text_input("Search Term (e.g. art style)", key="search_term", on_change=update_request)
+    # st.sidebar.checkbox("Force refresh (ignore cached crawling results)", key="crawl_force_refresh")
+    # if st.sidebar.button("Start Deep Crawling (infinite scrolling)", key="button_midjourney_crawling_streaming"):
+    #     crawl_streaming(tab_crawling, target_page)
+    #     tab_crawling.info('Please go to "Prompt Generation" tab')
+    # st.sidebar.button("Start Background Crawling", on_click=start_crawl_job, args=(target_page, ), key="button_midjourney_crawling_job")
+    # st.sidebar.text_input("Search Terms (comma separated, crawled in parallel)", key="fan_out_search_terms")
+    # if st.sidebar.button("Start Multi Term Crawling", key="button_midjourney_crawling_fan_out"):
+    #     crawl_fan_out(tab_crawling, target_page)
+    #     tab_crawling.info('Please go to "Prompt Generation" tab')
+    # if "crawl_job" in st.session_state:
+    #     st.sidebar.button("Cancel Crawling", on_click=cancel_crawl_job, key="button_cancel_crawling_job")
+    # poll_crawl_job(tab_crawling)
     # if st.sidebar.button("Start Crawling", on_click=crawl_openartai if target_page == CrawlingTargetPage.OPENART else crawl_midjourney, args=(tab_crawling, ), key="button_midjourney_crawling"):
-    #     session_state: SessionState = st.session_state["session_state"]
-    #     display_midjourney_images(session_state.crawling_data.midjourney_images, tab_crawling, make_collapsable=False)
     #     tab_crawling.info('Please go to "Prompt Generation" tab')
     #
+    # st.sidebar.file_uploader("Import crawling results", type=["parquet", "arrow"], key="crawling_data_upload", on_change=import_crawling_data)
+    # if "session_state" in st.session_state and len(st.session_state["session_state"].crawling_data.midjourney_images) > 0:
+    #     display_crawling_data_export()
+    #
     # # Crawl similar images
     # if target_page == CrawlingTargetPage.OPENART and "session_state" in st.session_state and len(st.session_state["session_state"].crawling_data.midjourney_images) > 0:
     #     session_state: SessionState = st.session_state["session_state"]
     #     deep_crawl_image_nr = st.sidebar.selectbox("(optional) Crawl Similar Images",
-    #                                       [i + 1 for i in range(len(session_state.crawling_data.midjourney_images))], on_change=display_midjourney_images, args=(session_state.crawling_data.midjourney_images, tab_crawling, False, ))
-    #     if st.sidebar.button("Start Similar Image Crawling", on_click=crawl_openartai_similar_images, args=(tab_crawling, deep_crawl_image_nr - 1, ), key="button_midjourney_crawling_similar_images"):
-    #         display_midjourney_images(session_state.crawling_data.midjourney_images, tab_crawling,
-    #                                   make_collapsable=False)
+    #                                       [i + 1 for i in range(len(session_state.crawling_data.midjourney_images))])
+    #     st.sidebar.number_input("Similar image crawl depth (hops from the selected image)", min_value=1, max_value=5, value=1, key="similar_crawl_depth")
+    #     st.sidebar.number_input("Max. number of images to open", min_value=1, max_value=100, value=1, key="similar_crawl_max_nodes")
+    #     st.sidebar.checkbox("Open most relevant images first", value=True, key="similar_crawl_best_first")
+    #     st.sidebar.button("Start Similar Image Crawling", on_click=crawl_openartai_similar_images, args=(tab_crawling, deep_crawl_image_nr - 1, ), key="button_midjourney_crawling_similar_images")
     #
     # if "session_state" in st.session_state:
     #     session_state: SessionState = st.session_state["session_state"]
     #     st.sidebar.subheader("3. Prompt Generation")
     #     midjourney_images = session_state.crawling_data.midjourney_images
     #     st.sidebar.number_input("LLM Temperature", value=0.7, max_value=1.0, min_value=0.0, key="temperature")
-    #     selected_prompts = st.sidebar.multiselect("Select Designs for prompt generation:", [i+1 for i in range(len(midjourney_images))], on_change=display_midjourney_images, args=(session_state.crawling_data.midjourney_images,tab_crawling,False,), key='selected_prompts')
+    #     selected_prompts = st.sidebar.multiselect("Select Designs for prompt generation:", [i+1 for i in range(len(midjourney_images))], key='selected_prompts')
+    #     st.sidebar.checkbox("Select examples automatically (most relevant for prompt gen input)", key="few_shot_auto_selection")
+    #     st.sidebar.number_input("Number of auto selected examples", value=5, min_value=1, max_value=20, key="few_shot_count")
     #     st.sidebar.text_input("Prompt Gen Input", key="prompt_gen_input")
+    #     st.sidebar.checkbox("Stream generated prompts", value=True, key="prompt_gen_streaming")
+    #     st.sidebar.checkbox("Bypass generation cache (cache is used for temperature 0 only)", key="generation_cache_bypass")
     #     st.sidebar.button("Prompt Generation", on_click=display_prompt_generation_tab, args=(midjourney_images, selected_prompts, tab_prompt_gen, tab_crawling, ), key="button_prompt_generation")
+    #     st.sidebar.text_area("Batch Prompt Gen Inputs (one per line)", key="prompt_gen_inputs")
+    #     st.sidebar.button("Batch Prompt Generation", on_click=display_batch_prompt_generation_tab, args=(midjourney_images, selected_prompts, tab_prompt_gen, ), key="button_batch_prompt_generation")
+    #
+    # # results grid is rendered once per rerun (after all callbacks changed the session state)
+    # if "session_state" in st.session_state:
+    #     session_state: SessionState = st.session_state["session_state"]
+    #     display_midjourney_images(session_state.crawling_data.midjourney_images, tab_crawling,
+    #                               selected_prompts=set(st.session_state.get("selected_prompts", [])))
+    #
+    # if is_debug():
+    #     display_driver_pool_stats()
+    #     display_tracing_stats()
     #
+    # rerun_while_crawl_job_running()
 
 
 
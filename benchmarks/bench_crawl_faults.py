@@ -0,0 +1,108 @@
+""" Benchmarks the crawl engine against a local stub of openart.ai, which injects faults:
+error pages (503), hanging pages (answered after the step timeout) and crashed browsers (killed while the page is opened).
+Every scenario is crawled without retries (one attempt, like the crawlers before the engine) and with the engine defaults.
+Reports completed / partial / failed crawls, p50 / p99 latency, error counts and recycled drivers.
+Requires a local Chrome installation.
+
+Run: python -m benchmarks.bench_crawl_faults [--crawls 20] [--card-count 100] [--step-timeout-sec 5]
+"""
+import os
+import time
+import random
+import signal
+import argparse
+import statistics
+
+from collections import Counter
+from selenium.webdriver.common.by import By
+from typing import List
+
+from benchmarks.fixtures import openart_discovery_html
+from benchmarks.stub_server import StubServer, RecordedResponse, FaultInjector
+from utils.driver_pool import DriverPool
+from utils.selenium_fns import process_tree_pids
+from utils.crawling.engine import CrawlEngine, CircuitBreaker, RetryPolicy
+from utils.crawling.openart_ai import iter_midjourney_images
+from utils.data_classes import CrawlingTargetPage, CrawlReport
+
+# (name, error rate, hang rate, crash rate)
+SCENARIOS = [
+    ("no faults", 0.0, 0.0, 0.0),
+    ("10% error pages", 0.1, 0.0, 0.0),
+    ("10% hanging pages", 0.0, 0.1, 0.0),
+    ("10% browser crashes", 0.0, 0.0, 0.1),
+    ("30% mixed faults", 0.1, 0.1, 0.1),
+]
+
+
+def kill_browser(driver):
+    """Kills all browser processes of driver, chromedriver itself keeps running (like a crashed chrome)"""
+    for pid in process_tree_pids(driver.service.process.pid)[1:]:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            continue
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_scenario(server: StubServer, crawls: int, card_count: int, step_timeout_sec: float, time_budget_sec: float,
+                 error_rate: float, hang_rate: float, crash_rate: float, retry_policy: RetryPolicy) -> str:
+    server.on_request = FaultInjector(error_rate=error_rate, hang_rate=hang_rate, hang_sec=step_timeout_sec * 4, path_prefix="/openart/")
+    crash_random = random.Random(42)
+    driver_pool = DriverPool(max_size=1, min_idle=1, headless=True)
+    driver_pool.warm_up()
+    # the circuit must not open, otherwise the scenarios with many faults would measure rejected crawls only
+    engine = CrawlEngine(CrawlingTargetPage.OPENART, retry_policy=retry_policy, circuit_breaker=CircuitBreaker(failure_threshold=crawls * 10),
+                         driver_pool=driver_pool, step_timeout_sec=step_timeout_sec)
+
+    def open_page(driver, waiter):
+        if crash_random.random() < crash_rate:
+            kill_browser(driver)
+        driver.get(f"{server.base_url}/openart/discovery/{card_count}")
+        waiter.element_count_at_least("bench_search_results", (By.CLASS_NAME, "MuiCard-root"), max_timeout_sec=step_timeout_sec, raise_on_timeout=True)
+
+    def iter_images(driver, waiter, remaining_sec):
+        return iter_midjourney_images(driver, target_count=card_count, time_budget_sec=remaining_sec, waiter=waiter)
+
+    durations_sec, outcomes, errors = [], Counter(), Counter()
+    try:
+        for _ in range(crawls):
+            report = CrawlReport()
+            start = time.perf_counter()
+            for _ in engine.stream(open_page, iter_images, time_budget_sec=time_budget_sec, report=report):
+                pass
+            durations_sec.append(time.perf_counter() - start)
+            outcomes["completed" if report.completed else ("partial" if report.partial else "failed")] += 1
+            errors.update(report.errors)
+        recycled = driver_pool.stats().recycled_total
+    finally:
+        driver_pool.shutdown()
+    error_text = ", ".join(f"{count} {kind}" for kind, count in errors.most_common()) or "-"
+    return (f"{outcomes['completed']:>10}{outcomes['partial']:>9}{outcomes['failed']:>8}{statistics.median(durations_sec):>9.1f}s"
+            f"{percentile(durations_sec, 0.99):>9.1f}s{recycled:>10}   {error_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crawls", type=int, default=20)
+    parser.add_argument("--card-count", type=int, default=100)
+    parser.add_argument("--step-timeout-sec", type=float, default=5)
+    parser.add_argument("--time-budget-sec", type=float, default=30)
+    args = parser.parse_args()
+
+    responses = {f"/openart/discovery/{args.card_count}": RecordedResponse(body=openart_discovery_html(args.card_count).encode("utf-8"))}
+    with StubServer(responses) as server:
+        print(f"{'scenario':<24}{'retries':<10}{'completed':>10}{'partial':>9}{'failed':>8}{'p50':>10}{'p99':>10}{'recycled':>10}   errors")
+        for name, error_rate, hang_rate, crash_rate in SCENARIOS:
+            for retries_name, retry_policy in [("none", RetryPolicy(max_attempts=1)), ("engine", RetryPolicy())]:
+                result = run_scenario(server, args.crawls, args.card_count, args.step_timeout_sec, args.time_budget_sec,
+                                      error_rate, hang_rate, crash_rate, retry_policy)
+                print(f"{name:<24}{retries_name:<10}{result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+""" Benchmarks the crawler extractors against HTML snapshots served by a local stub server.
+Synthetic snapshots of the openart.ai discovery page, the openart.ai similar images view and the midjourney feed
+are generated for every card count. Recorded snapshots in benchmarks/recordings are benchmarked as well.
+Reports wall time, number of WebDriver commands and peak RSS (python process and browser process tree, linux only).
+Requires a local Chrome installation.
+
+Run: python -m benchmarks.bench_extractors [--card-counts 50 500 5000] [--per-element-max-cards 500]
+"""
+import os
+import time
+import resource
+import argparse
+
+from collections import Counter
+from selenium.webdriver.common.by import By
+from typing import Callable, Optional
+
+from benchmarks.fixtures import openart_discovery_html, midjourney_feed_html, example_prompt
+from benchmarks.stub_server import StubServer, RecordedResponse, load_recordings
+from utils.selenium_fns import init_selenium_driver, process_tree_pids, read_proc_status_kb
+from utils.data_classes import MidjourneyImageCollection
+from utils.crawling import openart_ai, midjourney
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+DEFAULT_CARD_COUNTS = [50, 500, 5000]
+# element by element extraction needs several WebDriver commands per card and takes minutes for large pages
+DEFAULT_PER_ELEMENT_MAX_CARDS = 500
+
+
+class NullProgressBar:
+    def progress(self, value, text=None):
+        pass
+
+
+class CommandCounter:
+    """Counts the WebDriver commands (http requests to chromedriver) sent by driver and its web elements"""
+
+    def __init__(self, driver):
+        self.counts: Counter = Counter()
+        execute = driver.execute
+
+        def counting_execute(driver_command, params=None):
+            self.counts[driver_command] += 1
+            return execute(driver_command, params)
+        # web elements send their commands via the execute method of the driver as well
+        driver.execute = counting_execute
+
+    def reset(self):
+        self.counts.clear()
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def browser_peak_rss_mb(driver) -> Optional[float]:
+    """Sum of the peak RSS of chromedriver and all browser processes (None if not available)"""
+    if not os.path.isdir("/proc"):
+        return None
+    peak_rss_kb = 0
+    for pid in process_tree_pids(driver.service.process.pid):
+        try:
+            peak_rss_kb += read_proc_status_kb(pid, "VmHWM")
+        except OSError:
+            continue
+    return peak_rss_kb / 1024
+
+
+def python_peak_rss_mb() -> float:
+    # linux reports kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(label: str, card_count: int, driver, command_counter: CommandCounter, url: str, extract_fn: Callable[[], int]):
+    driver.get(url)
+    command_counter.reset()
+    start = time.perf_counter()
+    result_count = extract_fn()
+    duration_sec = time.perf_counter() - start
+    browser_rss_mb = browser_peak_rss_mb(driver)
+    print(f"{label:<36}{card_count:>6}{result_count:>8}{duration_sec:>10.2f}s{command_counter.total():>10}"
+          f"{python_peak_rss_mb():>11.0f}MB{browser_rss_mb if browser_rss_mb is not None else float('nan'):>11.0f}MB")
+
+
+def extract_openart(driver, bulk: bool) -> int:
+    return len(openart_ai.extract_midjourney_images(driver, NullProgressBar(), 0, bulk=bulk))
+
+
+def expand_and_extract_openart(driver) -> int:
+    openart_ai.expand_prompt_text(driver)
+    return extract_openart(driver, bulk=True)
+
+
+def check_full_prompts(midjourney_images) -> int:
+    """The synthetic midjourney feed only shows the full prompt in the hover overlay, the alt text of the images is truncated"""
+    for midjourney_image in midjourney_images:
+        assert midjourney_image.prompt == example_prompt(int(midjourney_image.prompt.split(" ", 1)[0])), f"not the full prompt: {midjourney_image.prompt}"
+    return len(midjourney_images)
+
+
+def extend_midjourney_by_gridcells(driver) -> int:
+    midjourney_images = MidjourneyImageCollection()
+    midjourney.extend_midjourney_images_by_gridcells(midjourney_images, driver.find_elements(By.CSS_SELECTOR, 'div[role="gridcell"]'), driver)
+    return check_full_prompts(midjourney_images)
+
+
+def extract_midjourney(driver, check_prompts=True) -> int:
+    midjourney_images = midjourney.extract_midjourney_images(driver, bulk=True)
+    return check_full_prompts(midjourney_images) if check_prompts else len(midjourney_images)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--card-counts", type=int, nargs="+", default=DEFAULT_CARD_COUNTS)
+    parser.add_argument("--per-element-max-cards", type=int, default=DEFAULT_PER_ELEMENT_MAX_CARDS)
+    args = parser.parse_args()
+
+    responses = load_recordings(RECORDINGS_DIR) if os.path.isdir(RECORDINGS_DIR) else {}
+    recorded_paths = sorted(responses.keys())
+    for card_count in args.card_counts:
+        responses[f"/openart/discovery/{card_count}"] = RecordedResponse(body=openart_discovery_html(card_count).encode("utf-8"))
+        responses[f"/openart/discovery_truncated/{card_count}"] = RecordedResponse(
+            body=openart_discovery_html(card_count, truncated=True).encode("utf-8"))
+        responses[f"/openart/similar/{card_count}"] = RecordedResponse(
+            body=openart_discovery_html(card_count, presentation_view=True).encode("utf-8"))
+        responses[f"/midjourney/feed/{card_count}"] = RecordedResponse(body=midjourney_feed_html(card_count).encode("utf-8"))
+
+    driver = init_selenium_driver(headless=True)
+    command_counter = CommandCounter(driver)
+    try:
+        with StubServer(responses) as server:
+            print(f"{'benchmark':<36}{'cards':>6}{'images':>8}{'wall time':>11}{'commands':>10}{'python rss':>13}{'browser rss':>13}")
+            for path in recorded_paths:
+                url = server.base_url + path
+                if path.startswith("/app/feed"):
+                    run(f"midjourney recorded {path}", 0, driver, command_counter, url, lambda: extract_midjourney(driver, check_prompts=False))
+                else:
+                    run(f"openart recorded {path}", 0, driver, command_counter, url, lambda: extract_openart(driver, bulk=True))
+            for card_count in args.card_counts:
+                per_element = card_count <= args.per_element_max_cards
+                url = f"{server.base_url}/openart/discovery/{card_count}"
+                run("openart extract (bulk)", card_count, driver, command_counter, url, lambda: extract_openart(driver, bulk=True))
+                if per_element:
+                    run("openart extract (per element)", card_count, driver, command_counter, url, lambda: extract_openart(driver, bulk=False))
+                run("openart expand_prompt_text + extract", card_count, driver, command_counter,
+                    f"{server.base_url}/openart/discovery_truncated/{card_count}", lambda: expand_and_extract_openart(driver))
+                run("openart similar images (bulk)", card_count, driver, command_counter,
+                    f"{server.base_url}/openart/similar/{card_count}", lambda: extract_openart(driver, bulk=True))
+                url = f"{server.base_url}/midjourney/feed/{card_count}"
+                run("midjourney extract (bulk)", card_count, driver, command_counter, url, lambda: extract_midjourney(driver))
+                if per_element:
+                    run("midjourney extend by gridcells", card_count, driver, command_counter, url, lambda: extend_midjourney_by_gridcells(driver))
+    finally:
+        driver.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+""" Measures embedding and MMR selection of few shot examples for growing memory mapped corpora.
+
+Run: python -m benchmarks.bench_few_shot_selection
+"""
+import time
+import tempfile
+
+from benchmarks.fixtures import example_prompt
+from utils.few_shot_selection import PromptEmbeddingIndex
+
+CORPUS_SIZES = [10000, 100000, 300000]
+QUERIES = ["watercolor grandma", "cyberpunk city at night, neon", "portrait of a cat by greg rutkowski"]
+REPEAT = 5
+
+
+def main():
+    print(f"{'prompts':>8}{'embedding':>12}{'p50 select':>14}{'max select':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        index = PromptEmbeddingIndex(directory)
+        for corpus_size in CORPUS_SIZES:
+            start = time.perf_counter()
+            ids = list(range(len(index) + 1, corpus_size + 1))
+            index.add(ids, [f"{example_prompt(i)} subject {i % 4999}" for i in ids])
+            embedding_sec = time.perf_counter() - start
+            durations = []
+            for _ in range(REPEAT):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    index.select(query, k=8)
+                    durations.append(time.perf_counter() - start)
+            durations.sort()
+            print(f"{corpus_size:>8}{embedding_sec:>11.1f}s{durations[len(durations) // 2] * 1000:>12.1f}ms{durations[-1] * 1000:>12.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
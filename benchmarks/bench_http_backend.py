@@ -0,0 +1,47 @@
+""" Measures latency and memory of the openart.ai http backend against a local stub server.
+Replays recorded responses from benchmarks/recordings if available, otherwise synthetic search pages.
+
+Run: python -m benchmarks.bench_http_backend
+"""
+import os
+import time
+import tracemalloc
+
+from benchmarks.fixtures import openart_next_data_html
+from benchmarks.stub_server import StubServer, RecordedResponse, load_recordings
+from utils.crawling.openart_ai_http import crawl_openartai_http, get_http_session
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), "recordings")
+SEARCH_TERM = "watercolor"
+CARD_COUNTS = [50, 500, 5000]
+REPEAT = 20
+
+
+def bench(responses, search_term: str, label: str):
+    with StubServer(responses) as server:
+        session = get_http_session()
+        # warm up connection pool
+        crawl_openartai_http(search_term, base_url=server.base_url, session=session)
+        durations = []
+        tracemalloc.start()
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            result_count = len(crawl_openartai_http(search_term, base_url=server.base_url, session=session))
+            durations.append(time.perf_counter() - start)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    durations.sort()
+    print(f"{label:<22}{result_count:>7}{durations[len(durations) // 2] * 1000:>12.1f}ms{durations[-1] * 1000:>12.1f}ms{peak_bytes / 1024 / 1024:>12.1f}MB")
+
+
+def main():
+    print(f"{'fixture':<22}{'images':>7}{'p50':>14}{'max':>14}{'peak memory':>14}")
+    if os.path.isdir(RECORDINGS_DIR):
+        bench(load_recordings(RECORDINGS_DIR), SEARCH_TERM, "recorded")
+    for card_count in CARD_COUNTS:
+        responses = {f"/search/{SEARCH_TERM}": RecordedResponse(body=openart_next_data_html(card_count).encode("utf-8"))}
+        bench(responses, SEARCH_TERM, "synthetic")
+
+
+if __name__ == "__main__":
+    main()
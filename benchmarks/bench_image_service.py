@@ -0,0 +1,72 @@
+""" Measures fetching and thumbnailing of result grid images against a local stub server,
+which serves synthetic 1024x1024 images with simulated CDN latency.
+
+Run: python -m benchmarks.bench_image_service
+"""
+import time
+import random
+import tempfile
+
+import requests
+from io import BytesIO
+from PIL import Image
+
+from benchmarks.stub_server import StubServer, RecordedResponse
+from utils.cache import SqliteLRUCache
+from utils.image_service import ImageService
+
+IMAGE_COUNT = 48
+IMAGE_SIZE = 1024
+THUMBNAIL_WIDTH = 384
+LATENCY_SEC = 0.15
+
+
+def synthetic_image(seed: int) -> bytes:
+    rng = random.Random(seed)
+    image = Image.effect_noise((IMAGE_SIZE, IMAGE_SIZE), 40 + seed % 20).convert("RGB")
+    image.paste((rng.randrange(256), rng.randrange(256), rng.randrange(256)), (0, 0, IMAGE_SIZE // 2, IMAGE_SIZE // 2))
+    output = BytesIO()
+    image.save(output, format="WEBP", quality=90)
+    return output.getvalue()
+
+
+def simulate_latency(path: str):
+    time.sleep(LATENCY_SEC)
+    return None
+
+
+def report(label: str, duration_sec: float, byte_count: int):
+    print(f"{label:<28}{duration_sec * 1000:>10.0f}ms{byte_count / 1024 / 1024:>12.1f}MB")
+
+
+def main():
+    responses = {f"/images/{i}.webp": RecordedResponse(body=synthetic_image(i), content_type="image/webp")
+                 for i in range(IMAGE_COUNT)}
+    with StubServer(responses) as server:
+        server.on_request = simulate_latency
+        image_urls = [f"{server.base_url}/images/{i}.webp" for i in range(IMAGE_COUNT)]
+        print(f"{IMAGE_COUNT} images, {LATENCY_SEC * 1000:.0f}ms latency per request")
+        print(f"{'':<28}{'duration':>12}{'to browser':>14}")
+
+        # previous behaviour: sequential full size downloads without connection pooling
+        start = time.perf_counter()
+        original_bytes = sum(len(requests.get(image_url).content) for image_url in image_urls)
+        report("sequential full size", time.perf_counter() - start, original_bytes)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            disk_cache = SqliteLRUCache(f"{cache_dir}/image_cache.sqlite", max_entries=10000, max_bytes=256 * 1024 * 1024)
+            image_service = ImageService(disk_cache=disk_cache)
+            for label in ["concurrent thumbnails", "memory cache"]:
+                start = time.perf_counter()
+                thumbnails = image_service.get_thumbnails(image_urls, THUMBNAIL_WIDTH)
+                report(label, time.perf_counter() - start, sum(len(thumbnail) for thumbnail in thumbnails))
+
+            # new process: empty memory cache, warm disk cache
+            image_service = ImageService(disk_cache=disk_cache)
+            start = time.perf_counter()
+            thumbnails = image_service.get_thumbnails(image_urls, THUMBNAIL_WIDTH)
+            report("disk cache", time.perf_counter() - start, sum(len(thumbnail) for thumbnail in thumbnails))
+
+
+if __name__ == "__main__":
+    main()
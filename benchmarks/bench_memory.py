@@ -0,0 +1,98 @@
+""" Measures the memory of crawling results and the cost of moving them between processes (pickle vs Arrow IPC vs Parquet)
+for synthetic crawls of 10k and 100k images.
+Memory is measured with tracemalloc on top of the url and prompt strings, which all representations share.
+
+Run: python -m benchmarks.bench_memory [--image-counts 10000 100000]
+"""
+import time
+import pickle
+import random
+import argparse
+import tracemalloc
+
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from utils.data_classes import MidjourneyImage, MidjourneyImageCollection, normalize_image_url, normalize_prompt
+from utils.columnar import ColumnarFormat, midjourney_images_to_table, serialize_midjourney_images, deserialize_midjourney_images
+
+DEFAULT_IMAGE_COUNTS = [10000, 100000]
+WORDS = ["portrait", "cinematic", "lighting", "octane", "render", "watercolor", "cyberpunk", "city", "night", "neon",
+         "highly", "detailed", "illustration", "fantasy", "landscape", "mountains", "sunset", "by", "greg", "rutkowski",
+         "studio", "ghibli", "style", "8k", "unreal", "engine", "trending", "on", "artstation", "vibrant", "colors"]
+SEARCH_TERMS = ["cat", "dog", "castle", "robot", "forest"]
+
+
+@dataclass
+class DictMidjourneyImage:
+    """Dict backed record like MidjourneyImage before it was slotted"""
+    image_url: str
+    prompt: str
+    search_term: Optional[str] = None
+
+
+def synthetic_crawl(image_count: int) -> List[Tuple[str, str, str]]:
+    rng = random.Random(42)
+    rows = []
+    for i in range(image_count):
+        # midjourney jobs have 4 images in one cdn directory
+        image_url = f"https://cdn.midjourney.com/{rng.getrandbits(128):032x}/0_{i % 4}_640_N.webp"
+        prompt = " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))) + f" --seed {i}"
+        rows.append((image_url, prompt, SEARCH_TERMS[i % len(SEARCH_TERMS)]))
+    return rows
+
+
+def traced_memory_mb(build: Callable[[], object]) -> Tuple[float, object]:
+    tracemalloc.start()
+    result = build()
+    current_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current_bytes / 1024 / 1024, result
+
+
+def dict_collection(rows):
+    """List of dict backed records with an index of the normalized strings (like MidjourneyImageCollection before)"""
+    midjourney_images, image_urls, prompts = [], set(), set()
+    for image_url, prompt, search_term in rows:
+        midjourney_images.append(DictMidjourneyImage(image_url, prompt, search_term))
+        image_urls.add(normalize_image_url(image_url))
+        prompts.add(normalize_prompt(prompt))
+    return midjourney_images, image_urls, prompts
+
+
+def timed_ms(fn: Callable[[], object]) -> Tuple[float, object]:
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image-counts", type=int, nargs="+", default=DEFAULT_IMAGE_COUNTS)
+    args = parser.parse_args()
+
+    for image_count in args.image_counts:
+        rows = synthetic_crawl(image_count)
+        string_mb = sum(len(image_url) + len(prompt) for image_url, prompt, _ in rows) / 1024 / 1024
+        print(f"{image_count} images ({string_mb:.1f}MB url and prompt text)")
+        dict_mb, _ = traced_memory_mb(lambda: dict_collection(rows))
+        print(f"  {'dict records + string index':<36}{dict_mb:>10.1f}MB")
+        slotted_mb, midjourney_images = traced_memory_mb(
+            lambda: MidjourneyImageCollection(MidjourneyImage(image_url, prompt, search_term) for image_url, prompt, search_term in rows))
+        print(f"  {'slotted records + hash index':<36}{slotted_mb:>10.1f}MB")
+        table = midjourney_images_to_table(midjourney_images)
+        print(f"  {'arrow table':<36}{table.nbytes / 1024 / 1024:>10.1f}MB (incl. text)")
+
+        print(f"  {'export':<36}{'size':>10}{'write':>10}{'read':>10}")
+        write_ms, data = timed_ms(lambda: pickle.dumps(list(midjourney_images), protocol=pickle.HIGHEST_PROTOCOL))
+        read_ms, _ = timed_ms(lambda: MidjourneyImageCollection(pickle.loads(data)))
+        print(f"  {'pickle':<36}{len(data) / 1024 / 1024:>8.1f}MB{write_ms:>8.0f}ms{read_ms:>8.0f}ms")
+        for columnar_format in ColumnarFormat:
+            write_ms, data = timed_ms(lambda: serialize_midjourney_images(midjourney_images, columnar_format))
+            read_ms, restored_images = timed_ms(lambda: deserialize_midjourney_images(data))
+            assert len(restored_images) == len(midjourney_images)
+            print(f"  {columnar_format.value:<36}{len(data) / 1024 / 1024:>8.1f}MB{write_ms:>8.0f}ms{read_ms:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
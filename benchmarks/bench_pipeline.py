@@ -0,0 +1,65 @@
+""" Benchmarks the headless pipeline with the corpus backend (no browser) and a local fake llm.
+A synthetic prompt corpus is indexed in a temporary CACHE_DIR. Measures throughput for several generation concurrencies,
+a resumed run after all items were generated and a resumed run after a crash in the middle of the output file.
+
+Run: python -m benchmarks.bench_pipeline [--search-terms 20] [--texts-per-term 10] [--latency-ms 200]
+"""
+import os
+import argparse
+import tempfile
+
+from benchmarks.fake_llm import FakeMidjourneyChatModel
+from benchmarks.fixtures import example_prompt
+from utils.data_classes import CrawlingBackend, MidjourneyImage
+from utils.prompt_corpus import get_prompt_corpus
+from utils.pipeline import PipelineConfig, PipelineItem, load_checkpoint, run_pipeline
+
+SEARCH_TERM_PROMPTS = 50
+
+
+def create_items(search_terms: int, texts_per_term: int):
+    return [PipelineItem(f"term{term}", f"subject {term}-{i}") for term in range(search_terms) for i in range(texts_per_term)]
+
+
+def index_corpus(search_terms: int):
+    get_prompt_corpus().add([MidjourneyImage(image_url=f"https://cdn.midjourney.com/term{term}/{i}_N.webp", prompt=f"term{term} {example_prompt(i)}")
+                             for term in range(search_terms) for i in range(SEARCH_TERM_PROMPTS)], source="benchmark")
+
+
+def run(label: str, items, output_path: str, config: PipelineConfig, llm):
+    stats = run_pipeline(items, output_path, config, llm=llm)
+    print(f"{label:<34}{stats.generated:>10}{stats.skipped:>9}{stats.duration_sec:>10.2f}s{stats.items_per_sec:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--search-terms", type=int, default=20)
+    parser.add_argument("--texts-per-term", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["CACHE_DIR"] = cache_dir
+        index_corpus(args.search_terms)
+        items = create_items(args.search_terms, args.texts_per_term)
+        llm = FakeMidjourneyChatModel(latency_sec=args.latency_ms / 1000)
+        print(f"{len(items)} items, {args.search_terms} search terms, {args.latency_ms:.0f}ms llm latency")
+        print(f"{'run':<34}{'generated':>10}{'skipped':>9}{'duration':>11}{'items/s':>10}")
+        for generation_concurrency in [1, 4, 16]:
+            output_path = os.path.join(cache_dir, f"results_{generation_concurrency}.jsonl")
+            config = PipelineConfig(backend=CrawlingBackend.CORPUS, generation_concurrency=generation_concurrency, use_generation_cache=False)
+            run(f"generation concurrency {generation_concurrency}", items, output_path, config, llm)
+        run("resume (all generated)", items, output_path, config, llm)
+
+        # crash in the middle of the output file: half of the lines and a truncated line are left
+        with open(output_path, encoding="utf-8") as f:
+            lines = f.readlines()
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.writelines(lines[:len(lines) // 2])
+            f.write(lines[len(lines) // 2][:20])
+        run("resume (after crash)", items, output_path, config, llm)
+        assert load_checkpoint(output_path) == {item.item_id for item in items}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+""" Compares generating prompts for many inputs one by one (new generator per input)
+with the batch api against a local fake llm. Measures time to first prompt of the streaming api.
+
+Run: python -m benchmarks.bench_prompt_generation
+"""
+import time
+
+from benchmarks.fake_llm import FakeMidjourneyChatModel
+from benchmarks.fixtures import example_prompt
+from utils.prompt_generation import create_midjourney_prompt_generator, generate_midjourney_prompts_batch, stream_midjourney_prompts
+
+FEW_SHOT_PROMPTS = [example_prompt(i) for i in range(8)]
+TEXTS = [f"subject {i}" for i in range(24)]
+LATENCY_SEC = 0.2
+
+
+def main():
+    print(f"{len(TEXTS)} inputs, {LATENCY_SEC * 1000:.0f}ms llm latency")
+    llm = FakeMidjourneyChatModel(latency_sec=LATENCY_SEC)
+    start = time.perf_counter()
+    for text in TEXTS:
+        create_midjourney_prompt_generator(llm, FEW_SHOT_PROMPTS).generate(text=text)
+    print(f"{'sequential':<22}{(time.perf_counter() - start) * 1000:>10.0f}ms")
+    for max_concurrency in [4, 8]:
+        start = time.perf_counter()
+        llm_outputs = generate_midjourney_prompts_batch(FEW_SHOT_PROMPTS, TEXTS, llm=llm, max_concurrency=max_concurrency)
+        assert len(llm_outputs) == len(TEXTS)
+        print(f"{f'batch (concurrency {max_concurrency})':<22}{(time.perf_counter() - start) * 1000:>10.0f}ms")
+
+    start = time.perf_counter()
+    update = None
+    for update in stream_midjourney_prompts(FEW_SHOT_PROMPTS, TEXTS[0], llm=llm):
+        pass
+    print(f"{'streaming':<22}{(time.perf_counter() - start) * 1000:>10.0f}ms (first prompt after {update.time_to_first_prompt_sec * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+""" Compares page load time and browser memory of openart.ai snapshots with and without the resource blocking crawl profile.
+Images and fonts are served by the local stub server. Requires a local Chrome installation.
+
+Run: python -m benchmarks.bench_resource_blocking
+"""
+import time
+
+from io import BytesIO
+from PIL import Image
+
+from benchmarks.fixtures import openart_discovery_html
+from benchmarks.stub_server import StubServer, RecordedResponse
+from benchmarks.bench_extractors import NullProgressBar, browser_peak_rss_mb
+from utils.selenium_fns import init_selenium_driver
+from utils.data_classes import CrawlingTargetPage
+from utils.crawling import openart_ai
+from utils.crawling.resource_blocking import apply_crawl_profile
+
+CARD_COUNTS = [50, 500]
+IMAGE_SIZE = 512
+
+
+def synthetic_image() -> bytes:
+    image = Image.effect_noise((IMAGE_SIZE, IMAGE_SIZE), 60).convert("RGB")
+    output = BytesIO()
+    image.save(output, format="WEBP", quality=90)
+    return output.getvalue()
+
+
+def main():
+    image_response = RecordedResponse(body=synthetic_image(), content_type="image/webp")
+    font_response = RecordedResponse(body=b"\0" * 50000, content_type="font/woff2")
+    responses = {}
+    with StubServer(responses) as server:
+        # every image url returns the same image
+        server.on_request = lambda path: image_response if path.startswith("/uploads/") else font_response if path.startswith("/fonts/") else None
+        for card_count in CARD_COUNTS:
+            html = openart_discovery_html(card_count, base_url=server.base_url)
+            html = html.replace("<head>", f"<head><style>@font-face {{ font-family: bench; src: url('{server.base_url}/fonts/bench.woff2'); }} "
+                                          f"body {{ font-family: bench; }}</style>", 1)
+            server.responses[f"/openart/discovery/{card_count}"] = RecordedResponse(body=html.encode("utf-8"))
+
+        print(f"{'profile':<12}{'cards':>6}{'page load':>12}{'extract':>10}{'requests':>10}{'browser rss':>13}")
+        for blocking in [False, True]:
+            # new driver per profile, so that peak memory and http cache are not shared
+            driver = init_selenium_driver(headless=True)
+            try:
+                if blocking:
+                    apply_crawl_profile(driver, CrawlingTargetPage.OPENART)
+                for card_count in CARD_COUNTS:
+                    request_count = server.request_count
+                    start = time.perf_counter()
+                    driver.get(f"{server.base_url}/openart/discovery/{card_count}")
+                    load_sec = time.perf_counter() - start
+                    start = time.perf_counter()
+                    image_count = len(openart_ai.extract_midjourney_images(driver, NullProgressBar(), 0))
+                    extract_sec = time.perf_counter() - start
+                    print(f"{'blocking' if blocking else 'full':<12}{image_count:>6}{load_sec:>11.2f}s{extract_sec:>9.2f}s"
+                          f"{server.request_count - request_count:>10}{browser_peak_rss_mb(driver):>11.0f}MB")
+            finally:
+                driver.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+""" Measures the cold start of the app: import time and peak RSS of a fresh python process, which imports app.py
+(like streamlit does on the first request), and which heavy packages are loaded by that.
+Afterwards the first use of the crawler and llm facades is measured in the same process.
+
+Run: python -m benchmarks.bench_startup [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["selenium", "langchain", "llm_few_shot_gen.generators", "openai", "numpy", "PIL", "cryptography"]
+
+# runs in a fresh interpreter with the repository on sys.path and a dummy streamlit secret in the working directory
+STARTUP_SCRIPT = """
+import sys, json, time, resource
+start = time.perf_counter()
+import app
+import_sec = time.perf_counter() - start
+import_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+
+start = time.perf_counter()
+import utils.crawling.openart_ai, utils.crawling.midjourney
+crawler_first_use_sec = time.perf_counter() - start
+start = time.perf_counter()
+from utils.prompt_generation import create_llm
+create_llm(0.7)
+llm_first_use_sec = time.perf_counter() - start
+print(json.dumps({"import_sec": import_sec, "import_rss_mb": import_rss_mb, "loaded": loaded,
+                  "crawler_first_use_sec": crawler_first_use_sec, "llm_first_use_sec": llm_first_use_sec,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def measure_startup(working_dir: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONWARNINGS="ignore")
+    output = subprocess.run([sys.executable, "-c", f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + STARTUP_SCRIPT],
+                            cwd=working_dir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_dir:
+        os.makedirs(os.path.join(working_dir, ".streamlit"))
+        with open(os.path.join(working_dir, ".streamlit", "secrets.toml"), "w") as f:
+            f.write('open_ai_api_key = "benchmark"\n')
+        # first run warms the file system cache and writes the byte code
+        measure_startup(working_dir)
+        results = [measure_startup(working_dir) for _ in range(args.runs)]
+
+    def median(key: str) -> float:
+        return statistics.median(result[key] for result in results)
+    print(f"{'import app':<28}{median('import_sec') * 1000:>10.0f}ms{median('import_rss_mb'):>10.0f}MB peak rss")
+    print(f"{'first crawler use':<28}{median('crawler_first_use_sec') * 1000:>10.0f}ms")
+    print(f"{'first llm use':<28}{median('llm_first_use_sec') * 1000:>10.0f}ms{median('rss_mb'):>10.0f}MB peak rss")
+    print(f"heavy modules loaded by app import: {', '.join(results[-1]['loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+""" Local stand-in for the OpenAI chat model, which answers like the midjourney prompt generator expects
+after a simulated latency. Can be passed as llm to utils.prompt_generation.
+"""
+import re
+import json
+import time
+
+from typing import Any, Iterator, List, Optional
+from langchain.chat_models.base import SimpleChatModel
+from langchain.schema import BaseMessage
+from langchain.schema.messages import AIMessageChunk
+from langchain.schema.output import ChatGenerationChunk
+
+TOKEN_LENGTH = 4
+
+
+class FakeMidjourneyChatModel(SimpleChatModel):
+    latency_sec: float = 0.5
+    # streaming: latency until the first token and between two tokens
+    token_latency_sec: float = 0.01
+    prompt_count: int = 5
+    call_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-midjourney-chat-model"
+
+    def _output(self, messages: List[BaseMessage]) -> str:
+        self.call_count += 1
+        # the last message asks for prompts 'with the content "<text>"'
+        match = re.search(r'with the content "(.*?)"', messages[-1].content)
+        text = match.group(1) if match else "image"
+        return json.dumps({
+            "few_shot_styles": ["watercolor", "cinematic lighting"],
+            "few_shot_artists": ["greg rutkowski"],
+            "image_prompts": [f"{text}, variation {i}, highly detailed, 8k --ar 16:9" for i in range(self.prompt_count)],
+        })
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self.latency_sec)
+        return self._output(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        output = self._output(messages)
+        time.sleep(self.latency_sec)
+        for i in range(0, len(output), TOKEN_LENGTH):
+            time.sleep(self.token_latency_sec)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=output[i:i + TOKEN_LENGTH]))
@@ -0,0 +1,88 @@
+""" Synthetic HTML snapshots which reproduce the markup the crawlers rely on.
+All image urls point to the local stub server: base_url is the base url of the StubServer, by default urls are relative
+and resolve to the server which serves the page. Therefore benchmarks with fixtures do not send any requests to the internet.
+"""
+import os
+import json
+from typing import List
+
+PROMPT_WORDS = ["portrait", "cyberpunk", "watercolor", "city", "neon", "grandma", "cat", "forest", "ukiyo-e",
+                "synthwave", "octane render", "cinematic lighting", "highly detailed", "8k", "by greg rutkowski"]
+
+
+def example_prompt(i: int) -> str:
+    words = [PROMPT_WORDS[(i * 7 + j * 3) % len(PROMPT_WORDS)] for j in range(6)]
+    return f"{i} " + ", ".join(words)
+
+
+def openart_prompt_html(i: int, truncated: bool) -> str:
+    if not truncated:
+        return example_prompt(i)
+    # long prompts are cut and expanded by clicking on [more]
+    return f"""{example_prompt(i)[:30]}... <span data-prompt="{example_prompt(i)}" onclick="this.parentElement.innerText = this.dataset.prompt">[more]</span>"""
+
+
+def openart_image_url(i: int, base_url: str = "") -> str:
+    return f"{base_url}/uploads/image_{i}_512.webp"
+
+
+def midjourney_image_url(i: int, base_url: str = "") -> str:
+    return f"{base_url}/cdn/{i:08d}-0000-0000-0000-000000000000/0_0_32_N.webp"
+
+
+def openart_discovery_html(card_count: int, column_count: int = 4, presentation_view: bool = False, truncated: bool = False,
+                           base_url: str = "") -> str:
+    """openart.ai discovery page: masonry grid with flex columns of MuiCard elements"""
+    columns: List[List[str]] = [[] for _ in range(column_count)]
+    for i in range(card_count):
+        columns[i % column_count].append(f"""
+            <div class="MuiPaper-root MuiCard-root">
+                <img src="{openart_image_url(i, base_url)}" style="width: 200px; height: 200px; display: block">
+                <p class="MuiTypography-root MuiTypography-body2">{openart_prompt_html(i, truncated)}</p>
+            </div>""")
+    grid = "".join(f'<div style="display: flex; flex-direction: column">{"".join(cards)}</div>' for cards in columns)
+    grid = f'<div style="display: flex">{grid}</div>'
+    if presentation_view:
+        grid = f'<div role="presentation">{grid}</div>'
+    return f"<html><head><title>openart.ai</title></head><body>{grid}</body></html>"
+
+
+def openart_next_data_html(card_count: int, base_url: str = "") -> str:
+    """openart.ai search page as delivered by the server: results are embedded as Next.js __NEXT_DATA__ json"""
+    items = [{"id": str(i), "image_url": openart_image_url(i, base_url), "prompt": example_prompt(i),
+              "ai_model": "midjourney", "user": {"username": f"user_{i % 17}"}} for i in range(card_count)]
+    next_data = {"props": {"pageProps": {"initialData": {"items": items}}}, "page": "/search/[query]"}
+    return (f"<html><head><title>openart.ai</title></head><body><div id=\"__next\"></div>"
+            f"<script id=\"__NEXT_DATA__\" type=\"application/json\">{json.dumps(next_data)}</script></body></html>")
+
+
+def midjourney_feed_html(gridcell_count: int, base_url: str = "") -> str:
+    """midjourney.com community feed: gridcells with thumbnail link and image. The alt text of the image is a truncated prompt,
+    the full prompt is only shown by the overlay of the hovered gridcell."""
+    gridcells = "".join(f"""
+        <div role="gridcell" data-prompt="{example_prompt(i)}" style="width: 200px; height: 200px">
+            <link href="{midjourney_image_url(i, base_url)}">
+            <img alt="{example_prompt(i)[:20]}..." src="{midjourney_image_url(i, base_url)}" style="width: 200px; height: 200px">
+        </div>""" for i in range(gridcell_count))
+    # the prompt overlay is rendered once, positioned on top of the hovered gridcell and filled with its prompt
+    hover_script = """
+        <script>
+        document.querySelectorAll('div[role="gridcell"]').forEach(gridcell => gridcell.addEventListener("mouseover", () => {
+            const overlay = document.querySelector("p._promptText_");
+            const rect = gridcell.getBoundingClientRect();
+            overlay.style.left = (rect.left + window.scrollX) + "px";
+            overlay.style.top = (rect.top + window.scrollY) + "px";
+            overlay.innerText = gridcell.dataset.prompt;
+        }));
+        </script>"""
+    return (f'<html><head><title>Midjourney</title></head><body><p class="_promptText_" style="position: absolute; width: 200px; margin: 0"></p>'
+            f'<div>{gridcells}</div>{hover_script}</body></html>')
+
+
+def write_fixture(directory: str, file_name: str, html: str) -> str:
+    """Writes html to directory and returns a file url, which can be opened by selenium"""
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, file_name)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return "file://" + os.path.abspath(file_path)
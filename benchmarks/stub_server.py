@@ -0,0 +1,148 @@
+""" Local http server, which replays recorded responses (e.g. openart.ai pages) for offline benchmarks.
+
+Record a response: python -m benchmarks.stub_server record https://openart.ai/discovery benchmarks/recordings
+"""
+import os
+import sys
+import time
+import random
+import threading
+
+import requests
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from urllib.parse import quote, unquote, urlsplit
+
+
+@dataclass
+class RecordedResponse:
+    body: bytes
+    status: int = 200
+    content_type: str = "text/html; charset=utf-8"
+    delay_sec: float = 0.0  # response is sent after this delay (e.g. to simulate a hanging page)
+
+
+class StubServer:
+    """ Serves recorded responses by request path (incl. query), falls back to the path without query.
+    Usage: with StubServer(responses) as server: requests.get(server.base_url + "/discovery")
+    """
+
+    def __init__(self, responses: Optional[Dict[str, RecordedResponse]] = None, port: int = 0):
+        self.responses: Dict[str, RecordedResponse] = dict(responses or {})
+        # optional hook, which can replace the response of a request path (e.g. to inject faults)
+        self.on_request: Optional[Callable[[str], Optional[RecordedResponse]]] = None
+        self.request_count = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        stub_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub_server.request_count += 1
+                response = stub_server.get_response(self.path)
+                if response is None:
+                    response = RecordedResponse(body=b"not recorded", status=404, content_type="text/plain")
+                if response.delay_sec:
+                    time.sleep(response.delay_sec)
+                self.send_response(response.status)
+                self.send_header("Content-Type", response.content_type)
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                self.wfile.write(response.body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def get_response(self, path: str) -> Optional[RecordedResponse]:
+        if self.on_request is not None:
+            response = self.on_request(path)
+            if response is not None:
+                return response
+        return self.responses.get(path) or self.responses.get(urlsplit(path).path)
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class FaultInjector:
+    """ on_request hook of StubServer, which fails a share of the requests of paths starting with path_prefix:
+    error_rate of the requests get a 503 error page, hang_rate of the requests are answered after hang_sec.
+    """
+
+    def __init__(self, error_rate: float = 0.0, hang_rate: float = 0.0, hang_sec: float = 60.0, path_prefix: str = "/", seed: int = 42):
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_sec = hang_sec
+        self.path_prefix = path_prefix
+        self.errors = 0
+        self.hangs = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, path: str) -> Optional[RecordedResponse]:
+        if not path.startswith(self.path_prefix):
+            return None
+        with self._lock:
+            value = self._random.random()
+            if value < self.error_rate:
+                self.errors += 1
+                return RecordedResponse(body=b"<html><body>Service Unavailable</body></html>", status=503)
+            if value < self.error_rate + self.hang_rate:
+                self.hangs += 1
+                return RecordedResponse(body=b"<html><body>Too late</body></html>", delay_sec=self.hang_sec)
+        return None
+
+
+def recording_file_name(path: str) -> str:
+    return quote(path, safe="") + ".html"
+
+
+def load_recordings(directory: str) -> Dict[str, RecordedResponse]:
+    """Loads all responses saved by record()"""
+    responses = {}
+    for file_name in os.listdir(directory):
+        with open(os.path.join(directory, file_name), "rb") as f:
+            responses[unquote(file_name[:-len(".html")])] = RecordedResponse(body=f.read())
+    return responses
+
+
+def record(url: str, directory: str) -> str:
+    """Fetches url and saves the response body, so that it can be replayed by StubServer"""
+    os.makedirs(directory, exist_ok=True)
+    split_url = urlsplit(url)
+    path = split_url.path + (f"?{split_url.query}" if split_url.query else "")
+    response = requests.get(url, timeout=30, headers={"User-Agent": "Mozilla/5.0"})
+    response.raise_for_status()
+    file_path = os.path.join(directory, recording_file_name(path))
+    with open(file_path, "wb") as f:
+        f.write(response.content)
+    return file_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "record":
+        print("Usage: python -m benchmarks.stub_server record <url> <directory>")
+        sys.exit(1)
+    print(record(sys.argv[2], sys.argv[3]))
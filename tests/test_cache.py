@@ -0,0 +1,98 @@
+import time
+
+import pytest
+
+from utils.cache import SqliteLRUCache
+from utils.crawling.cache import CrawlCache, CrawlMode
+from utils.data_classes import CrawlingBackend, CrawlingData, CrawlingTargetPage, MidjourneyImage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, sec: float):
+        self.now += sec
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = FakeClock()
+    monkeypatch.setattr(time, "time", fake_clock)
+    return fake_clock
+
+
+def create_cache(tmp_path, **kwargs) -> SqliteLRUCache:
+    return SqliteLRUCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def test_get_set(tmp_path, clock):
+    cache = create_cache(tmp_path)
+    assert cache.get("a") is None
+    cache.set("a", b"value")
+    assert cache.get("a") == b"value"
+    stats = cache.stats()
+    assert stats.hits == 1 and stats.misses == 1 and stats.entries == 1 and stats.size_bytes == 5
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = create_cache(tmp_path, ttl_sec=60)
+    cache.set("a", b"value")
+    clock.advance(59)
+    assert cache.get("a") == b"value"
+    clock.advance(2)
+    assert cache.get("a") is None
+    assert cache.stats().entries == 0
+
+
+def test_expired_entries_are_removed_on_set(tmp_path, clock):
+    cache = create_cache(tmp_path, ttl_sec=60)
+    cache.set("a", b"value")
+    clock.advance(61)
+    cache.set("b", b"value")
+    assert cache.stats().entries == 1
+
+
+def test_least_recently_used_entries_are_evicted_above_max_entries(tmp_path, clock):
+    cache = create_cache(tmp_path, max_entries=2)
+    cache.set("a", b"1")
+    clock.advance(1)
+    cache.set("b", b"2")
+    clock.advance(1)
+    # reading a makes b the least recently used entry
+    assert cache.get("a") == b"1"
+    clock.advance(1)
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1" and cache.get("c") == b"3"
+    assert cache.stats().entries == 2
+
+
+def test_least_recently_used_entries_are_evicted_above_max_bytes(tmp_path, clock):
+    cache = create_cache(tmp_path, max_bytes=25)
+    for key in "abc":
+        cache.set(key, b"x" * 10)
+        clock.advance(1)
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
+    assert cache.stats().size_bytes == 20
+
+
+def test_crawl_cache_key_contains_crawl_parameters(tmp_path):
+    crawl_cache = CrawlCache(str(tmp_path / "crawl_cache.sqlite"))
+    crawling_data = CrawlingData(midjourney_images=[MidjourneyImage(image_url="https://cdn.openart.ai/a.webp", prompt="a cat")])
+    crawl_cache.set(CrawlingTargetPage.OPENART, "Watercolor", crawling_data, mode=CrawlMode.PAGE, backend=CrawlingBackend.HTTP)
+    # search terms are normalized, other parameters are not
+    assert crawl_cache.get(CrawlingTargetPage.OPENART, " watercolor ", mode=CrawlMode.PAGE, backend=CrawlingBackend.HTTP) == crawling_data
+    assert crawl_cache.get(CrawlingTargetPage.OPENART, "watercolor", mode=CrawlMode.PAGE, backend=CrawlingBackend.SELENIUM) is None
+    assert crawl_cache.get(CrawlingTargetPage.OPENART, "watercolor", mode=CrawlMode.SCROLL, backend=CrawlingBackend.HTTP) is None
+    assert crawl_cache.get(CrawlingTargetPage.MIDJOURNEY, "watercolor", mode=CrawlMode.PAGE, backend=CrawlingBackend.HTTP) is None
+
+
+def test_crawl_cache_skips_empty_crawls(tmp_path):
+    crawl_cache = CrawlCache(str(tmp_path / "crawl_cache.sqlite"))
+    crawl_cache.set(CrawlingTargetPage.OPENART, "watercolor", CrawlingData())
+    assert crawl_cache.get(CrawlingTargetPage.OPENART, "watercolor") is None
@@ -0,0 +1,45 @@
+import pytest
+
+from utils.columnar import (PARQUET_MAGIC, ColumnarFormat, deserialize_midjourney_images, midjourney_images_to_table,
+                            serialize_midjourney_images)
+from utils.data_classes import MidjourneyImage
+
+MIDJOURNEY_IMAGES = [
+    MidjourneyImage(image_url="https://cdn.midjourney.com/0a1b2c3d/0_0_640_N.webp", prompt="a cat", search_term="cat"),
+    MidjourneyImage(image_url="https://cdn.midjourney.com/0a1b2c3d/0_1_640_N.webp", prompt="a \"quoted\" cat, ünïcödé"),
+    MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_1.webp", prompt="", search_term="cat"),
+    MidjourneyImage(image_url="relative.webp", prompt="a dog", search_term="dog"),
+]
+
+
+def test_table_encodes_url_prefixes_as_dictionary():
+    table = midjourney_images_to_table(MIDJOURNEY_IMAGES)
+    assert table.num_rows == len(MIDJOURNEY_IMAGES)
+    prefixes = table["image_url_prefix"].combine_chunks()
+    assert prefixes.dictionary.to_pylist() == ["https://cdn.midjourney.com/0a1b2c3d/", "https://cdn.openart.ai/uploads/", ""]
+    assert table["image_url_name"].to_pylist()[0] == "0_0_640_N.webp"
+
+
+@pytest.mark.parametrize("columnar_format", list(ColumnarFormat))
+def test_round_trip(columnar_format):
+    data = serialize_midjourney_images(MIDJOURNEY_IMAGES, columnar_format)
+    assert deserialize_midjourney_images(data) == MIDJOURNEY_IMAGES
+
+
+@pytest.mark.parametrize("columnar_format", list(ColumnarFormat))
+def test_round_trip_without_images(columnar_format):
+    assert len(deserialize_midjourney_images(serialize_midjourney_images([], columnar_format))) == 0
+
+
+def test_format_is_detected_by_parquet_magic_bytes():
+    parquet_data = serialize_midjourney_images(MIDJOURNEY_IMAGES, ColumnarFormat.PARQUET)
+    arrow_data = serialize_midjourney_images(MIDJOURNEY_IMAGES, ColumnarFormat.ARROW)
+    assert parquet_data[:4] == PARQUET_MAGIC and parquet_data[-4:] == PARQUET_MAGIC
+    assert arrow_data[:4] != PARQUET_MAGIC
+    assert deserialize_midjourney_images(parquet_data) == deserialize_midjourney_images(arrow_data)
+
+
+def test_duplicates_are_removed_on_read():
+    duplicate = MidjourneyImage(image_url="https://cdn.midjourney.com/0a1b2c3d/0_0_32_N.webp", prompt="a cat")
+    data = serialize_midjourney_images(MIDJOURNEY_IMAGES + [duplicate])
+    assert deserialize_midjourney_images(data) == MIDJOURNEY_IMAGES
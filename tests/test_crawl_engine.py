@@ -0,0 +1,291 @@
+import json
+import time
+
+import pytest
+import requests
+
+from contextlib import contextmanager
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from benchmarks.fixtures import openart_next_data_html
+from benchmarks.stub_server import StubServer, RecordedResponse, FaultInjector
+from utils.crawling import openart_ai
+from utils.crawling.cache import CrawlCache
+from utils.crawling.engine import CircuitBreaker, CircuitState, CrawlEngine, RetryPolicy
+from utils.crawling.openart_ai_http import parse_openartai_page
+from utils.data_classes import CrawlErrorKind, CrawlingTargetPage, CrawlReport, MidjourneyImage, MidjourneyImageCollection
+
+CARD_COUNT = 30
+BATCH_SIZE = 10
+PAGE_PATH = "/openart/search/watercolor"
+
+
+class FakeDriver:
+    """Loads pages from the stub server with requests, like a browser which fails on error pages"""
+
+    def __init__(self):
+        self.page_load_timeout_sec = None
+        self.page_source = ""
+
+    def set_page_load_timeout(self, timeout_sec: float):
+        self.page_load_timeout_sec = timeout_sec
+
+    def set_script_timeout(self, timeout_sec: float):
+        pass
+
+    def get(self, url: str):
+        try:
+            response = requests.get(url, timeout=self.page_load_timeout_sec)
+        except requests.Timeout as e:
+            raise TimeoutException(str(e))
+        if response.status_code >= 400:
+            raise WebDriverException(f"{url} returned status {response.status_code}")
+        self.page_source = response.text
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.driver = FakeDriver()
+
+    def is_alive(self) -> bool:
+        return True
+
+
+class FakeDriverPool:
+    def __init__(self):
+        self.leases = 0
+        self.leased = 0
+
+    @contextmanager
+    def lease(self, timeout=None):
+        self.leases += 1
+        self.leased += 1
+        try:
+            yield FakeBrowser()
+        finally:
+            self.leased -= 1
+
+
+@pytest.fixture
+def server():
+    responses = {PAGE_PATH: RecordedResponse(body=openart_next_data_html(CARD_COUNT).encode("utf-8"))}
+    with StubServer(responses) as stub_server:
+        yield stub_server
+
+
+def create_engine(circuit_breaker=None, max_attempts=3, step_timeout_sec=5.0):
+    return CrawlEngine(CrawlingTargetPage.OPENART, retry_policy=RetryPolicy(max_attempts=max_attempts, backoff_base_sec=0),
+                       circuit_breaker=circuit_breaker or CircuitBreaker(failure_threshold=100), driver_pool=FakeDriverPool(),
+                       step_timeout_sec=step_timeout_sec)
+
+
+def open_page(server):
+    return lambda driver, waiter: driver.get(server.base_url + PAGE_PATH)
+
+
+def iter_images(driver, waiter, remaining_sec):
+    midjourney_images = list(parse_openartai_page(driver.page_source))
+    for i in range(0, len(midjourney_images), BATCH_SIZE):
+        yield midjourney_images[i:i + BATCH_SIZE]
+
+
+def crawl(engine, server, report, iter_images=iter_images):
+    return [midjourney_image for batch in engine.stream(open_page(server), iter_images, report=report) for midjourney_image in batch]
+
+
+def open_circuit(circuit_breaker, engine, server):
+    server.on_request = FaultInjector(error_rate=1.0)
+    crawl(engine, server, CrawlReport())
+    assert circuit_breaker.state == CircuitState.OPEN
+    server.on_request = None
+
+
+def test_crawl_completes(server):
+    report = CrawlReport()
+    midjourney_images = crawl(create_engine(), server, report)
+    assert len(midjourney_images) == CARD_COUNT
+    assert report.completed and report.attempts == 1 and report.error_count == 0
+
+
+def test_retries_error_pages(server):
+    server.on_request = FaultInjector(error_rate=1.0)
+    engine = create_engine(max_attempts=3)
+    report = CrawlReport()
+    assert crawl(engine, server, report) == []
+    assert report.attempts == 3 and server.request_count == 3
+    assert report.errors[CrawlErrorKind.PAGE_ERROR.value] == 3
+    assert not report.completed and not report.partial
+    assert engine.driver_pool.leases == 3 and engine.driver_pool.leased == 0
+
+
+def test_retry_after_error_page(server):
+    fault_injector = FaultInjector(error_rate=1.0)
+    server.on_request = fault_injector
+
+    def open_page_once_failing(driver, waiter):
+        try:
+            driver.get(server.base_url + PAGE_PATH)
+        finally:
+            fault_injector.error_rate = 0.0
+
+    report = CrawlReport()
+    batches = list(create_engine().stream(open_page_once_failing, iter_images, report=report))
+    assert sum(len(batch) for batch in batches) == CARD_COUNT
+    assert report.completed and report.attempts == 2 and report.errors[CrawlErrorKind.PAGE_ERROR.value] == 1
+
+
+def test_hanging_page_is_timeout(server):
+    server.on_request = FaultInjector(hang_rate=1.0, hang_sec=0.5)
+    report = CrawlReport()
+    assert crawl(create_engine(max_attempts=2, step_timeout_sec=0.1), server, report) == []
+    assert report.errors[CrawlErrorKind.TIMEOUT.value] == 2
+
+
+def test_images_are_deduplicated_across_attempts(server):
+    attempts = []
+
+    def iter_images_failing_once(driver, waiter, remaining_sec):
+        attempts.append(1)
+        for i, batch in enumerate(iter_images(driver, waiter, remaining_sec)):
+            if len(attempts) == 1 and i == 2:
+                raise WebDriverException("page crashed")
+            yield batch
+
+    report = CrawlReport()
+    midjourney_images = crawl(create_engine(), server, report, iter_images_failing_once)
+    # the second attempt extracts all images again, only the last batch is new
+    assert len(midjourney_images) == CARD_COUNT
+    assert len({midjourney_image.image_url for midjourney_image in midjourney_images}) == CARD_COUNT
+    assert report.completed and report.attempts == 2 and report.image_count == CARD_COUNT
+
+
+def test_partial_report(server):
+    def iter_images_always_failing(driver, waiter, remaining_sec):
+        yield from list(iter_images(driver, waiter, remaining_sec))[:1]
+        raise WebDriverException("page crashed")
+
+    report = CrawlReport()
+    midjourney_images = crawl(create_engine(max_attempts=2), server, report, iter_images_always_failing)
+    assert len(midjourney_images) == BATCH_SIZE
+    assert report.partial and not report.completed
+    assert report.image_count == BATCH_SIZE and report.attempts == 2
+    assert "partial" in report.summary()
+
+
+def test_circuit_opens_and_rejects(server):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=60)
+    engine = create_engine(circuit_breaker)
+    open_circuit(circuit_breaker, engine, server)
+    request_count = server.request_count
+    report = CrawlReport()
+    assert crawl(engine, server, report) == []
+    assert report.attempts == 0 and report.errors[CrawlErrorKind.CIRCUIT_OPEN.value] == 1
+    assert server.request_count == request_count
+
+
+def test_circuit_half_open_trial_closes(server):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=0.1)
+    engine = create_engine(circuit_breaker)
+    open_circuit(circuit_breaker, engine, server)
+    time.sleep(0.1)
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    report = CrawlReport()
+    assert len(crawl(engine, server, report)) == CARD_COUNT
+    assert report.completed and circuit_breaker.state == CircuitState.CLOSED
+
+
+def test_circuit_half_open_trial_fails(server):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=0.1)
+    engine = create_engine(circuit_breaker)
+    open_circuit(circuit_breaker, engine, server)
+    time.sleep(0.1)
+    server.on_request = FaultInjector(error_rate=1.0)
+    report = CrawlReport()
+    crawl(engine, server, report)
+    # the failed trial opens the circuit again, the retry is rejected
+    assert report.attempts == 1 and report.errors[CrawlErrorKind.CIRCUIT_OPEN.value] == 1
+    assert circuit_breaker.state == CircuitState.OPEN
+
+
+def test_close_during_trial_releases_circuit(server):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=0.1)
+    engine = create_engine(circuit_breaker)
+    open_circuit(circuit_breaker, engine, server)
+    time.sleep(0.1)
+    batches = engine.stream(open_page(server), iter_images)
+    next(batches)
+    batches.close()
+    assert engine.driver_pool.leased == 0
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    # the next crawl is the trial, which closes the circuit
+    report = CrawlReport()
+    assert len(crawl(engine, server, report)) == CARD_COUNT
+    assert report.completed and circuit_breaker.state == CircuitState.CLOSED
+
+
+# similar images of every image of the similar images graph
+SIMILAR_IMAGES = {"seed": ["b", "c"], "b": ["d", "e"], "c": ["f"], "d": [], "e": [], "f": []}
+
+
+def similar_image(name: str) -> MidjourneyImage:
+    return MidjourneyImage(image_url=f"https://cdn.openart.ai/uploads/{name}.webp", prompt=f"watercolor {name}")
+
+
+@pytest.fixture
+def similar_images_server(monkeypatch, tmp_path):
+    """Serves the similar images of every image as json list of names and replaces the page interactions of the graph crawl"""
+    responses = {f"/similar/{name}": RecordedResponse(body=json.dumps(children).encode("utf-8"), content_type="application/json")
+                 for name, children in SIMILAR_IMAGES.items()}
+    with StubServer(responses) as stub_server:
+        def open_similar_images(driver, search_term, node, waiter):
+            # cached similar images have no page url, the page is found by the image name instead of clicking through the parents
+            name = node.midjourney_image.image_url.rsplit("/", 1)[-1][:-len(".webp")]
+            driver.get(f"{stub_server.base_url}/similar/{name}")
+            return True
+
+        def extract_similar_images(driver):
+            names = json.loads(driver.page_source)
+            page_urls = {similar_image(name).image_url: f"{stub_server.base_url}/similar/{name}" for name in names}
+            return MidjourneyImageCollection(similar_image(name) for name in names), page_urls
+
+        crawl_cache = CrawlCache(str(tmp_path / "crawl_cache.sqlite"))
+        monkeypatch.setattr(openart_ai, "get_crawl_cache", lambda: crawl_cache)
+        monkeypatch.setattr(openart_ai, "open_similar_images", open_similar_images)
+        monkeypatch.setattr(openart_ai, "extract_similar_images", extract_similar_images)
+        yield stub_server
+
+
+def crawl_similar_images(engine, report, **kwargs):
+    updates = list(openart_ai.stream_openartai_similar_images("watercolor", similar_image("seed"), max_depth=3, max_nodes=10,
+                                                              report=report, engine=engine, **kwargs))
+    return [midjourney_image.prompt for update in updates for midjourney_image in update.new_images]
+
+
+def test_similar_images_crawl_completes(similar_images_server):
+    report = CrawlReport()
+    prompts = crawl_similar_images(create_engine(), report)
+    assert sorted(prompts) == [f"watercolor {name}" for name in "bcdef"]
+    assert report.completed and report.attempts == 1 and report.image_count == 5
+
+
+def test_similar_images_crawl_skips_failing_image(similar_images_server):
+    similar_images_server.on_request = FaultInjector(error_rate=1.0, path_prefix="/similar/b")
+    engine = create_engine()
+    report = CrawlReport()
+    prompts = crawl_similar_images(engine, report)
+    # b is retried once, the third attempt skips b (and therefore its similar images d and e)
+    assert sorted(prompts) == ["watercolor b", "watercolor c", "watercolor f"]
+    assert report.completed and report.attempts == 3 and report.errors[CrawlErrorKind.PAGE_ERROR.value] == 2
+    # images expanded before a failure are answered by the cache: seed, c and f are requested once, b twice
+    assert similar_images_server.request_count == 5
+    assert engine.driver_pool.leases == 3 and engine.driver_pool.leased == 0
+
+
+def test_similar_images_crawl_times_out(similar_images_server):
+    similar_images_server.on_request = FaultInjector(hang_rate=1.0, hang_sec=0.5)
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout_sec=60)
+    report = CrawlReport()
+    assert crawl_similar_images(create_engine(circuit_breaker, step_timeout_sec=0.1), report) == []
+    # the seed hangs in the first attempt, the retry hangs on the seed again and opens the circuit
+    assert report.errors[CrawlErrorKind.TIMEOUT.value] == 2 and report.errors[CrawlErrorKind.CIRCUIT_OPEN.value] == 1
+    assert not report.completed and circuit_breaker.state == CircuitState.OPEN
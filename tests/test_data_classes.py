@@ -0,0 +1,57 @@
+from utils.data_classes import CrawlingData, MidjourneyImage, MidjourneyImageCollection, normalize_image_url, normalize_prompt
+
+IMAGE_URL = "https://cdn.midjourney.com/0a1b2c3d-0000-0000-0000-000000000000/0_1_{size}_N.webp"
+
+
+def test_normalize_image_url():
+    assert normalize_image_url(IMAGE_URL.format(size=32)) == normalize_image_url(IMAGE_URL.format(size=640))
+    assert normalize_image_url(IMAGE_URL.format(size=32) + "?method=shortest#top") == normalize_image_url(IMAGE_URL.format(size=640))
+    assert normalize_image_url("https://cdn.openart.ai/uploads/image_1_512.webp") == "https://cdn.openart.ai/uploads/image_1_512.webp"
+
+
+def test_normalize_prompt():
+    assert normalize_prompt("  A Cat,  in the   RAIN!! --v 5") == "a cat in the rain v 5"
+
+
+def test_dedupe_across_size_suffixes():
+    midjourney_images = MidjourneyImageCollection()
+    assert midjourney_images.add(MidjourneyImage(image_url=IMAGE_URL.format(size=32), prompt="a cat"))
+    assert not midjourney_images.add(MidjourneyImage(image_url=IMAGE_URL.format(size=640), prompt="a dog"))
+    assert MidjourneyImage(image_url=IMAGE_URL.format(size=128), prompt="") in midjourney_images
+    assert len(midjourney_images) == 1 and midjourney_images[0].prompt == "a cat"
+
+
+def test_same_prompt_with_other_image_is_kept_by_default():
+    midjourney_images = MidjourneyImageCollection([
+        MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_1.webp", prompt="a cat"),
+        MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_2.webp", prompt="a cat"),
+    ])
+    assert len(midjourney_images) == 2
+
+
+def test_dedupe_prompts():
+    midjourney_images = MidjourneyImageCollection(dedupe_prompts=True)
+    assert midjourney_images.add(MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_1.webp", prompt="A cat, in the rain"))
+    # near duplicates only differ in case, punctuation and whitespace
+    assert midjourney_images.is_duplicate(MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_2.webp", prompt="a cat in  the rain!"))
+    assert not midjourney_images.add(MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_2.webp", prompt="a cat in  the rain!"))
+    assert midjourney_images.add(MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_3.webp", prompt="a cat in the snow"))
+    assert [midjourney_image.image_url for midjourney_image in midjourney_images] == [
+        "https://cdn.openart.ai/uploads/image_1.webp", "https://cdn.openart.ai/uploads/image_3.webp"]
+
+
+def test_contains_prompt_builds_index_lazily():
+    midjourney_images = MidjourneyImageCollection([MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_1.webp", prompt="A cat")])
+    assert midjourney_images.contains_prompt("a cat.")
+    assert not midjourney_images.contains_prompt("a dog")
+    midjourney_images.add(MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_2.webp", prompt="a dog"))
+    assert midjourney_images.contains_prompt("A dog")
+
+
+def test_crawling_data_extend_counts_new_images():
+    crawling_data = CrawlingData(midjourney_images=[MidjourneyImage(image_url=IMAGE_URL.format(size=32), prompt="a cat")])
+    other = CrawlingData(midjourney_images=[MidjourneyImage(image_url=IMAGE_URL.format(size=640), prompt="a cat"),
+                                            MidjourneyImage(image_url="https://cdn.openart.ai/uploads/image_1.webp", prompt="a dog")])
+    assert isinstance(crawling_data.midjourney_images, MidjourneyImageCollection)
+    assert crawling_data.extend(other) == 1
+    assert len(crawling_data.midjourney_images) == 2
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from utils.data_classes import MidjourneyImage
+from utils.few_shot_selection import PromptEmbeddingIndex, hash_embed, mmr_select, select_few_shot_examples
+from utils.prompt_corpus import PromptCorpus
+
+N_FEATURES = 1024
+PROMPTS = [
+    "watercolor portrait of an old fisherman",
+    "watercolor portrait of an old fisherman, muted palette",
+    "watercolor portrait of a young woman",
+    "cyberpunk city at night, neon reflections",
+]
+
+
+def images(prompts):
+    return [MidjourneyImage(image_url=f"https://cdn.openart.ai/uploads/{prompt}.webp", prompt=prompt) for prompt in prompts]
+
+
+@pytest.fixture
+def prompt_corpus(tmp_path):
+    prompt_corpus = PromptCorpus(str(tmp_path / "prompt_corpus.sqlite"))
+    prompt_corpus.add(images(PROMPTS))
+    return prompt_corpus
+
+
+def test_hash_embed():
+    embeddings = hash_embed(PROMPTS + [""], n_features=N_FEATURES)
+    assert embeddings.shape == (len(PROMPTS) + 1, N_FEATURES) and embeddings.dtype == np.float32
+    assert np.allclose(np.linalg.norm(embeddings[:-1], axis=1), 1.0)
+    assert not embeddings[-1].any()
+    # stable between calls (and processes), case is ignored
+    assert np.array_equal(hash_embed([PROMPTS[0].upper()], n_features=N_FEATURES)[0], embeddings[0])
+
+
+def test_mmr_select_without_diversity_ranks_by_relevance():
+    embeddings = hash_embed(PROMPTS, n_features=N_FEATURES)
+    query_embedding = hash_embed(["watercolor portrait of an old fisherman"], n_features=N_FEATURES)[0]
+    assert mmr_select(embeddings, query_embedding, k=3, diversity=0) == [0, 1, 2]
+
+
+def test_mmr_select_skips_near_duplicates():
+    embeddings = hash_embed(PROMPTS, n_features=N_FEATURES)
+    query_embedding = hash_embed(["watercolor portrait of an old fisherman"], n_features=N_FEATURES)[0]
+    # the second fisherman prompt is almost the same as the first one
+    assert mmr_select(embeddings, query_embedding, k=2, diversity=0.5) == [0, 2]
+
+
+def test_mmr_select_edge_cases():
+    embeddings = hash_embed(PROMPTS, n_features=N_FEATURES)
+    query_embedding = hash_embed(["city"], n_features=N_FEATURES)[0]
+    assert mmr_select(embeddings, query_embedding, k=0) == []
+    assert mmr_select(embeddings[:0], query_embedding, k=3) == []
+    assert sorted(mmr_select(embeddings, query_embedding, k=10)) == [0, 1, 2, 3]
+
+
+def test_select_few_shot_examples():
+    assert select_few_shot_examples(images(PROMPTS), "neon city", k=1) == [3]
+
+
+def test_index_sync_is_incremental(tmp_path, prompt_corpus):
+    index = PromptEmbeddingIndex(str(tmp_path), n_features=N_FEATURES)
+    assert len(index) == 0 and index.last_id == 0
+    assert index.sync(prompt_corpus) == len(PROMPTS)
+    assert index.sync(prompt_corpus) == 0
+    prompt_corpus.add(images(["an astronaut riding a horse"]))
+    assert index.sync(prompt_corpus, batch_size=1) == 1
+    assert len(index) == len(PROMPTS) + 1
+    ids = index.select("astronaut on a horse", k=1)
+    assert [img.prompt for img in prompt_corpus.get_by_ids(ids)] == ["an astronaut riding a horse"]
+
+
+def test_index_is_reopened(tmp_path, prompt_corpus):
+    PromptEmbeddingIndex(str(tmp_path), n_features=N_FEATURES).sync(prompt_corpus)
+    index = PromptEmbeddingIndex(str(tmp_path), n_features=N_FEATURES)
+    assert len(index) == len(PROMPTS)
+    assert index.sync(prompt_corpus) == 0
+
+
+def test_index_is_rebuilt_when_n_features_changes(tmp_path, prompt_corpus):
+    PromptEmbeddingIndex(str(tmp_path), n_features=N_FEATURES).sync(prompt_corpus)
+    index = PromptEmbeddingIndex(str(tmp_path), n_features=2 * N_FEATURES)
+    assert len(index) == 0
+    assert index.sync(prompt_corpus) == len(PROMPTS)
+    assert index._embeddings.shape == (len(PROMPTS), 2 * N_FEATURES)
+    assert [img.prompt for img in prompt_corpus.get_by_ids(index.select("neon city", k=1))] == [PROMPTS[3]]
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from benchmarks.stub_server import StubServer, RecordedResponse
+from utils.crawling.openart_ai_http import OpenartParseError, crawl_openartai_http, extract_next_data, parse_openartai_page
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(file_name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, file_name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_extract_next_data():
+    next_data = extract_next_data(read_fixture("openart_search_watercolor.html"))
+    assert next_data["page"] == "/search/[query]"
+    assert next_data["props"]["pageProps"]["query"] == "watercolor"
+
+
+def test_parse_openartai_page():
+    midjourney_images = parse_openartai_page(read_fixture("openart_search_watercolor.html"))
+    # featured image is listed in the search results again, the template image and items without image are skipped
+    assert [(img.image_url, img.prompt) for img in midjourney_images] == [
+        ("https://cdn.openart.ai/uploads/image_Xk3b9_1686051234567_512.webp",
+         "watercolor portrait of an old fisherman, loose brush strokes, muted palette --ar 2:3 --v 5"),
+        ("https://cdn.openart.ai/uploads/image_Pq81z_1686051299911_512.jpg",
+         "watercolor city at night, neon reflections on wet streets, cinematic lighting"),
+        ("https://cdn.openart.ai/uploads/image_Rv20c_1686051300042_512.png",
+         "cute cat in a watercolor forest, ukiyo-e, highly detailed"),
+    ]
+
+
+def test_parse_openartai_page_without_next_data():
+    with pytest.raises(OpenartParseError):
+        parse_openartai_page("<html><body><div id=\"__next\"></div></body></html>")
+
+
+def test_parse_openartai_page_without_images():
+    html = '<html><body><script id="__NEXT_DATA__" type="application/json">{"props": {"pageProps": {"items": []}}}</script></body></html>'
+    with pytest.raises(OpenartParseError):
+        parse_openartai_page(html)
+
+
+def test_crawl_openartai_http():
+    responses = {"/search/watercolor": RecordedResponse(body=read_fixture("openart_search_watercolor.html").encode("utf-8"))}
+    with StubServer(responses) as server:
+        midjourney_images = crawl_openartai_http("watercolor", base_url=server.base_url)
+    assert len(midjourney_images) == 3
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from benchmarks.fake_llm import FakeMidjourneyChatModel
+from utils import pipeline
+from utils.data_classes import CrawlingData, CrawlingTargetPage, CrawlReport, MidjourneyImage
+from utils.pipeline import PipelineConfig, PipelineItem, load_checkpoint, read_pipeline_items, run_pipeline
+
+ITEMS = [PipelineItem(f"term{term}", f"subject {term}-{i}") for term in range(3) for i in range(4)]
+
+
+@pytest.fixture
+def crawled_search_terms(monkeypatch):
+    """Replaces the crawlers by synthetic crawling results, returns the crawled search terms"""
+    search_terms = []
+
+    def crawl_search_term(target_page, search_term, config):
+        search_terms.append(search_term)
+        midjourney_images = [MidjourneyImage(image_url=f"https://cdn.openart.ai/uploads/{search_term}_{i}.webp", prompt=f"{search_term} prompt {i}")
+                             for i in range(10)]
+        return CrawlingData(midjourney_images=midjourney_images), CrawlReport(attempts=1, image_count=10, completed=True)
+
+    monkeypatch.setattr(pipeline, "crawl_search_term", crawl_search_term)
+    return search_terms
+
+
+def run(output_path, items=ITEMS):
+    config = PipelineConfig(generation_concurrency=2, use_generation_cache=False)
+    return run_pipeline(items, str(output_path), config, llm=FakeMidjourneyChatModel(latency_sec=0))
+
+
+def read_results(output_path):
+    with open(output_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_run_pipeline(tmp_path, crawled_search_terms):
+    output_path = tmp_path / "results.jsonl"
+    stats = run(output_path)
+    assert stats.items == stats.generated == len(ITEMS) and stats.crawls == 3 and stats.failed == 0
+    assert sorted(crawled_search_terms) == ["term0", "term1", "term2"]
+    results = read_results(output_path)
+    assert sorted(result["id"] for result in results) == sorted(item.item_id for item in ITEMS)
+    assert all(len(result["image_prompts"]) == 5 and len(result["few_shot_prompts"]) == 5 for result in results)
+    assert all(prompt.startswith(result["search_term"]) for result in results for prompt in result["few_shot_prompts"])
+
+
+def test_resume_skips_generated_items(tmp_path, crawled_search_terms):
+    output_path = tmp_path / "results.jsonl"
+    run(output_path)
+    del crawled_search_terms[:]
+    stats = run(output_path)
+    assert stats.skipped == len(ITEMS) and stats.generated == 0
+    assert crawled_search_terms == []
+    assert len(read_results(output_path)) == len(ITEMS)
+
+
+def test_resume_after_crash(tmp_path, crawled_search_terms):
+    output_path = tmp_path / "results.jsonl"
+    run(output_path)
+    # a crash leaves half of the lines and a truncated line
+    with open(output_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:6])
+        f.write(lines[6][:20])
+    assert len(load_checkpoint(str(output_path))) == 6
+    stats = run(output_path)
+    assert stats.skipped == 6 and stats.generated == len(ITEMS) - 6
+    assert load_checkpoint(str(output_path)) == {item.item_id for item in ITEMS}
+    # the truncated line is kept, the next result starts on a new line
+    with open(output_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(ITEMS) + 1
+
+
+def test_failed_items_are_retried(tmp_path, crawled_search_terms):
+    output_path = tmp_path / "results.jsonl"
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": ITEMS[0].item_id, "error": "RateLimitError: too many requests"}) + "\n")
+    stats = run(output_path, ITEMS[:2])
+    assert stats.skipped == 0 and stats.generated == 2
+    assert load_checkpoint(str(output_path)) == {ITEMS[0].item_id, ITEMS[1].item_id}
+
+
+def test_read_pipeline_items(tmp_path):
+    jsonl_path = tmp_path / "inputs.jsonl"
+    jsonl_path.write_text('{"search_term": "cat", "text": "a cat"}\n\n# comment\n'
+                          '{"search_term": "dog", "texts": ["a dog", "two dogs"], "id": 7, "target_page": "midjourney.com"}\n', encoding="utf-8")
+    items = list(read_pipeline_items(str(jsonl_path)))
+    assert [(item.search_term, item.text, item.target_page, item.item_id) for item in items[1:]] == [
+        ("dog", "a dog", CrawlingTargetPage.MIDJOURNEY, "7-0"), ("dog", "two dogs", CrawlingTargetPage.MIDJOURNEY, "7-1")]
+    assert items[0].item_id == PipelineItem(" Cat ", "a cat").item_id
+
+    text_path = tmp_path / "inputs.txt"
+    text_path.write_text("cat\ta cat\nno tab\n", encoding="utf-8")
+    assert [(item.search_term, item.text) for item in read_pipeline_items(str(text_path))] == [("cat", "a cat")]
@@ -0,0 +1,74 @@
+import pytest
+
+from utils.data_classes import MidjourneyImage
+from utils.prompt_corpus import PromptCorpus, fts_query, prompt_hash
+
+PROMPTS = [
+    "watercolor portrait of an old fisherman, loose brush strokes",
+    "cute cats in a forest, greg rutkowski, highly detailed",
+    "watercolor watercolor city at night",
+    "cyberpunk city at night, neon reflections, watercolor style, cinematic lighting, 8k, octane render, trending on artstation",
+]
+
+
+def images(prompts):
+    return [MidjourneyImage(image_url=f"https://cdn.openart.ai/uploads/image_{i}.webp", prompt=prompt) for i, prompt in enumerate(prompts)]
+
+
+@pytest.fixture
+def prompt_corpus(tmp_path):
+    prompt_corpus = PromptCorpus(str(tmp_path / "prompt_corpus.sqlite"))
+    prompt_corpus.add(images(PROMPTS), source="openart.ai", search_term="watercolor")
+    return prompt_corpus
+
+
+def test_fts_query_quotes_words():
+    assert fts_query('cat AND "dog" OR-') == '"cat" AND "and" AND "dog" AND "or"'
+    assert fts_query("cat dog", operator="OR") == '"cat" OR "dog"'
+    assert fts_query(" --- ") is None
+
+
+def test_search_matches_stemmed_words(prompt_corpus):
+    assert [img.prompt for img in prompt_corpus.search("cat")] == [PROMPTS[1]]
+    assert [img.prompt for img in prompt_corpus.search("Fisherman, PORTRAITS")] == [PROMPTS[0]]
+
+
+def test_search_is_ranked_by_bm25(prompt_corpus):
+    prompts = [img.prompt for img in prompt_corpus.search("watercolor")]
+    # more occurrences in a shorter prompt rank first
+    assert prompts[0] == PROMPTS[2]
+    assert prompts[-1] == PROMPTS[3]
+    assert set(prompts) == {PROMPTS[0], PROMPTS[2], PROMPTS[3]}
+
+
+def test_search_limit(prompt_corpus):
+    assert len(prompt_corpus.search("watercolor", limit=2)) == 2
+
+
+def test_search_supplements_substring_matches(prompt_corpus):
+    assert [img.prompt for img in prompt_corpus.search("rutkow")] == [PROMPTS[1]]
+
+
+def test_search_without_words(prompt_corpus):
+    assert prompt_corpus.search('" OR (') == []
+    assert prompt_corpus.search("zz") == []
+
+
+def test_prompts_are_deduplicated_by_prompt_hash(prompt_corpus):
+    assert prompt_hash("Cute cats in a forest - Greg Rutkowski, highly detailed!") == prompt_hash(PROMPTS[1])
+    new_images = images(["Cute cats in a forest - Greg Rutkowski, highly detailed!", "a new prompt", ""])
+    assert prompt_corpus.add(new_images) == 1
+    assert prompt_corpus.stats().prompts == len(PROMPTS) + 1
+    seen_count = prompt_corpus._connection.execute("SELECT seen_count FROM prompts WHERE prompt_hash = ?", (prompt_hash(PROMPTS[1]),)).fetchone()[0]
+    assert seen_count == 2
+    assert len(prompt_corpus.search("rutkowski")) == 1
+
+
+def test_get_prompts_after(prompt_corpus):
+    rows = prompt_corpus.get_prompts_after(0)
+    assert [prompt for _, _, prompt in rows] == PROMPTS
+    last_id = rows[-1][0]
+    assert prompt_corpus.get_prompts_after(last_id) == []
+    prompt_corpus.add(images(["a new prompt"]))
+    assert [prompt for _, _, prompt in prompt_corpus.get_prompts_after(last_id)] == ["a new prompt"]
+    assert [img.prompt for img in prompt_corpus.get_by_ids([rows[2][0], -1, rows[0][0]])] == [PROMPTS[2], PROMPTS[0]]
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from utils.prompt_generation import parse_partial_image_prompts
+
+IMAGE_PROMPTS = ['a "quoted" cat in the rain, 8k --ar 2:3', "café at night \\ neon, [blade runner]", "a dog"]
+LLM_OUTPUT = json.dumps({"image_prompts": IMAGE_PROMPTS, "few_shot_styles": ["photo"], "few_shot_artists": []})
+
+
+@pytest.mark.parametrize("partial_output", [
+    "",
+    '{"image_pro',
+    '{"image_prompts": ',
+    '{"image_prompts": [',
+    '{"image_prompts": [ "',
+    '{"image_prompts": ["a cat',
+    '{"image_prompts": []}',
+    '{"image_prompts": [], "few_shot_styles": ["photo"]}',
+])
+def test_no_complete_image_prompt(partial_output):
+    assert parse_partial_image_prompts(partial_output) == []
+
+
+def test_truncated_string():
+    assert parse_partial_image_prompts('{"image_prompts": ["a cat", "a d') == ["a cat"]
+    assert parse_partial_image_prompts('{"image_prompts": ["a cat",') == ["a cat"]
+
+
+def test_escaped_quotes():
+    assert parse_partial_image_prompts(r'{"image_prompts": ["a \"quoted\" cat", "a \"dog') == ['a "quoted" cat']
+    # the string ends with an escaped quote, it is not complete yet
+    assert parse_partial_image_prompts(r'{"image_prompts": ["a cat", "a \"dog\"') == ["a cat"]
+    assert parse_partial_image_prompts(r'{"image_prompts": ["a cat", "a \\') == ["a cat"]
+
+
+def test_strings_after_the_array_are_ignored():
+    assert parse_partial_image_prompts('{"image_prompts": ["a cat"], "few_shot_styles": ["photo"') == ["a cat"]
+
+
+def test_every_prefix_of_the_output():
+    image_prompts = []
+    for end in range(len(LLM_OUTPUT) + 1):
+        partial_image_prompts = parse_partial_image_prompts(LLM_OUTPUT[:end])
+        # streamed prompts are never changed afterwards
+        assert partial_image_prompts[:len(image_prompts)] == image_prompts
+        image_prompts = partial_image_prompts
+    assert image_prompts == IMAGE_PROMPTS
@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from utils.crawling import session_store
+from utils.crawling.session_store import MidjourneySessionStore, derive_key, is_expired, remove_expired_cookies
+
+EMAIL = "User@Example.com"
+PASSWORD = "correct horse battery staple"
+
+
+def cookie(name: str, expiry=None):
+    cookie = {"name": name, "value": "1", "domain": ".midjourney.com"}
+    if expiry is not None:
+        cookie["expiry"] = expiry
+    return cookie
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MidjourneySessionStore(str(tmp_path), secret="server secret")
+
+
+def test_round_trip(store):
+    cookies = [cookie("__Secure-next-auth.session-token", expiry=time.time() + 3600), cookie("theme")]
+    store.save(EMAIL, PASSWORD, cookies)
+    assert store.load(" user@example.com", PASSWORD) == cookies
+    session_path = os.path.join(store.directory, os.listdir(store.directory)[0])
+    assert os.stat(session_path).st_mode & 0o777 == 0o600
+    with open(session_path, "rb") as f:
+        assert b"session-token" not in f.read()
+
+
+def test_missing_session(store):
+    assert store.load(EMAIL, PASSWORD) is None
+
+
+def test_wrong_credentials(store, tmp_path):
+    store.save(EMAIL, PASSWORD, [cookie("__Host-Midjourney.AuthUserToken")])
+    assert store.load(EMAIL, "wrong password") is None
+    assert MidjourneySessionStore(str(tmp_path), secret="other secret").load(EMAIL, PASSWORD) is None
+    # the session of the right credentials is kept
+    assert store.load(EMAIL, PASSWORD) is not None
+
+
+def test_expired_auth_cookie_deletes_session(store):
+    store.save(EMAIL, PASSWORD, [cookie("__Host-Midjourney.AuthUserToken", expiry=time.time() - 1), cookie("theme")])
+    assert store.load(EMAIL, PASSWORD) is None
+    assert os.listdir(store.directory) == []
+
+
+def test_expired_other_cookies_are_dropped(store):
+    auth_cookie = cookie("__Host-Midjourney.AuthUserToken", expiry=time.time() + 3600)
+    store.save(EMAIL, PASSWORD, [auth_cookie, cookie("__cf_bm", expiry=time.time() - 1), cookie("_ga", expiry=time.time() - 1)])
+    assert store.load(EMAIL, PASSWORD) == [auth_cookie]
+
+
+def test_is_expired():
+    now = 1000.0
+    assert not is_expired([], now)
+    assert not is_expired([cookie("next-auth.session-token"), cookie("__cf_bm", expiry=now - 1)], now)
+    assert is_expired([cookie("next-auth.session-token", expiry=now)], now)
+    assert remove_expired_cookies([cookie("a"), cookie("b", expiry=now), cookie("c", expiry=now + 1)], now) == [cookie("a"), cookie("c", expiry=now + 1)]
+
+
+def test_derived_keys_are_cached_without_password():
+    key = derive_key(EMAIL, PASSWORD, "")
+    assert derive_key(EMAIL, PASSWORD, "") == key
+    assert derive_key(EMAIL, PASSWORD, "secret") != key
+    assert derive_key(EMAIL, PASSWORD + "!", "") != key
+    assert all(PASSWORD not in credentials_digest for credentials_digest in session_store._derived_keys)
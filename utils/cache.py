@@ -0,0 +1,111 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+def get_cache_dir() -> str:
+    """Returns the directory for all local caches. Configurable via env variable CACHE_DIR."""
+    cache_dir = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "midjourney-prompt-generator"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+class SqliteLRUCache:
+    """ Persistent key value store (bytes) in a single sqlite file.
+    Entries expire after ttl_sec and the least recently used entries are evicted,
+    if more than max_entries or more than max_bytes are stored.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 1000, ttl_sec: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_sec is not None and now - row[1] > self.ttl_sec:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._stats.misses += 1
+                return None
+            self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._stats.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now))
+            self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+
+    def _evict(self):
+        """Removes expired entries and least recently used entries above the size limits"""
+        if self.ttl_sec is not None:
+            self._connection.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_sec,))
+        entries, size_bytes = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if entries > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                (entries - self.max_entries,))
+        if self.max_bytes is not None and size_bytes > self.max_bytes:
+            # walk from least recently used entry until enough bytes are freed
+            bytes_to_free = size_bytes - self.max_bytes
+            keys = []
+            for key, size in self._connection.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+                if bytes_to_free <= 0:
+                    break
+                keys.append(key)
+                bytes_to_free -= size
+            self._connection.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            entries, size_bytes = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+            return CacheStats(hits=self._stats.hits, misses=self._stats.misses, entries=entries, size_bytes=size_bytes)
@@ -0,0 +1,74 @@
+""" Columnar (Apache Arrow) representation of crawling results.
+Large crawls are moved between sessions, workers and processes as one Arrow IPC or Parquet buffer instead of pickled python objects.
+Image urls are split into a dictionary encoded prefix (everything up to the file name) and the file name,
+as images of the same cdn directory share long url prefixes.
+"""
+import io
+
+from enum import Enum
+from typing import Iterable
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.data_classes import MidjourneyImage, MidjourneyImageCollection
+
+PARQUET_MAGIC = b"PAR1"
+
+MIDJOURNEY_IMAGE_SCHEMA = pa.schema([
+    pa.field("image_url_prefix", pa.dictionary(pa.int32(), pa.string())),
+    pa.field("image_url_name", pa.string()),
+    pa.field("prompt", pa.string()),
+    pa.field("search_term", pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+class ColumnarFormat(str, Enum):
+    ARROW = "arrow"  # Arrow IPC stream, fastest to read and write (e.g. between workers)
+    PARQUET = "parquet"  # compressed, smallest files (e.g. downloads)
+
+
+def midjourney_images_to_table(midjourney_images: Iterable[MidjourneyImage]) -> pa.Table:
+    image_url_prefixes, image_url_names, prompts, search_terms = [], [], [], []
+    for midjourney_image in midjourney_images:
+        split_index = midjourney_image.image_url.rfind("/") + 1
+        image_url_prefixes.append(midjourney_image.image_url[:split_index])
+        image_url_names.append(midjourney_image.image_url[split_index:])
+        prompts.append(midjourney_image.prompt)
+        search_terms.append(midjourney_image.search_term)
+    return pa.table([
+        pa.array(image_url_prefixes, pa.string()).dictionary_encode(),
+        pa.array(image_url_names, pa.string()),
+        pa.array(prompts, pa.string()),
+        pa.array(search_terms, pa.string()).dictionary_encode(),
+    ], schema=MIDJOURNEY_IMAGE_SCHEMA)
+
+
+def table_to_midjourney_images(table: pa.Table) -> MidjourneyImageCollection:
+    """Converts a table with MIDJOURNEY_IMAGE_SCHEMA to deduplicated midjourney images (in table order)"""
+    image_urls = pc.binary_join_element_wise(table["image_url_prefix"].cast(pa.string()), table["image_url_name"], "")
+    return MidjourneyImageCollection(
+        MidjourneyImage(image_url=image_url, prompt=prompt, search_term=search_term)
+        for image_url, prompt, search_term in zip(image_urls.to_pylist(), table["prompt"].to_pylist(),
+                                                  table["search_term"].cast(pa.string()).to_pylist()))
+
+
+def serialize_midjourney_images(midjourney_images: Iterable[MidjourneyImage], columnar_format: ColumnarFormat = ColumnarFormat.ARROW) -> bytes:
+    table = midjourney_images_to_table(midjourney_images)
+    sink = io.BytesIO()
+    if ColumnarFormat(columnar_format) == ColumnarFormat.PARQUET:
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue()
+
+
+def deserialize_midjourney_images(data: bytes) -> MidjourneyImageCollection:
+    """Reads midjourney images serialized in any ColumnarFormat (detected by the parquet magic bytes)"""
+    if data[:4] == PARQUET_MAGIC:
+        table = pq.read_table(io.BytesIO(data))
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    return table_to_midjourney_images(table)
@@ -0,0 +1,18 @@
+""" Entry points of the crawlers. Crawler modules (selenium, driver pool, session store) are imported on first use,
+therefore importing this package is cheap. Import from here instead of the crawler modules, if the import happens on app startup.
+"""
+from utils.lazy import lazy_function
+
+crawl_openartai = lazy_function("utils.crawling.openart_ai", "crawl_openartai")
+crawl_openartai_similar_images = lazy_function("utils.crawling.openart_ai", "crawl_openartai_similar_images")
+stream_openartai = lazy_function("utils.crawling.openart_ai", "stream_openartai")
+crawl_midjourney = lazy_function("utils.crawling.midjourney", "crawl_midjourney")
+login_to_midjourney = lazy_function("utils.crawling.midjourney", "login_to_midjourney")
+stream_midjourney = lazy_function("utils.crawling.midjourney", "stream_midjourney")
+get_driver_pool = lazy_function("utils.driver_pool", "get_driver_pool")
+get_adaptive_timeouts = lazy_function("utils.crawling.readiness", "get_adaptive_timeouts")
+get_circuit_breaker = lazy_function("utils.crawling.engine", "get_circuit_breaker")
+crawl_openartai_search = lazy_function("utils.crawling.openart_ai", "crawl_openartai_search")
+crawl_midjourney_search = lazy_function("utils.crawling.midjourney", "crawl_midjourney_search")
+login_to_midjourney_with_credentials = lazy_function("utils.crawling.midjourney", "login_to_midjourney_with_credentials")
+shutdown_driver_pool = lazy_function("utils.driver_pool", "shutdown_driver_pool")
@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import threading
+
+from enum import Enum
+from typing import Optional
+
+from utils.cache import SqliteLRUCache, CacheStats, get_cache_dir
+from utils.prompt_corpus import PromptCorpus, get_prompt_corpus
+from utils.data_classes import CrawlingBackend, CrawlingData, CrawlingTargetPage, MidjourneyImage
+
+
+class CrawlMode(str, Enum):
+    PAGE = "page"  # images of the loaded result page
+    SCROLL = "scroll"  # infinite scrolling until target_count images are found
+
+
+def crawl_cache_key(target_page: CrawlingTargetPage, search_term: str, similar_image_seed: Optional[str] = None, account: str = "",
+                    mode: Optional[CrawlMode] = None, target_count: Optional[int] = None, backend: Optional[CrawlingBackend] = None) -> str:
+    """ Cache key of a crawl. similar_image_seed is the image url of the image which similar images were crawled for.
+    account identifies the user, whose authenticated results were crawled (midjourney), so that they are not served to other users.
+    mode, target_count and backend are part of the key, as they decide how many images a crawl returns
+    (e.g. the http backend only returns the first result page).
+    """
+    key_parts = [CrawlingTargetPage(target_page).value, " ".join(search_term.lower().split()), similar_image_seed or "", account,
+                 CrawlMode(mode).value if mode else "", target_count, CrawlingBackend(backend).value if backend else ""]
+    return hashlib.sha1(json.dumps(key_parts).encode("utf-8")).hexdigest()
+
+
+class CrawlCache:
+    """ Persistent cache of crawling results.
+    Results are stored as compact json list of [image_url, prompt] pairs.
+    Every stored crawl is indexed in prompt_corpus as well, so that prompts outlive the cache entries.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 500, ttl_sec: float = 24 * 60 * 60, prompt_corpus: Optional[PromptCorpus] = None):
+        self._cache = SqliteLRUCache(db_path, max_entries=max_entries, ttl_sec=ttl_sec)
+        self.prompt_corpus = prompt_corpus
+
+    def get(self, target_page: CrawlingTargetPage, search_term: str, similar_image_seed: Optional[str] = None, account: str = "",
+            mode: Optional[CrawlMode] = None, target_count: Optional[int] = None, backend: Optional[CrawlingBackend] = None) -> Optional[CrawlingData]:
+        value = self._cache.get(crawl_cache_key(target_page, search_term, similar_image_seed, account, mode, target_count, backend))
+        if value is None:
+            return None
+        midjourney_images = [MidjourneyImage(image_url=image_url, prompt=prompt) for image_url, prompt in json.loads(value)]
+        return CrawlingData(midjourney_images=midjourney_images)
+
+    def set(self, target_page: CrawlingTargetPage, search_term: str, crawling_data: CrawlingData, similar_image_seed: Optional[str] = None,
+            account: str = "", mode: Optional[CrawlMode] = None, target_count: Optional[int] = None, backend: Optional[CrawlingBackend] = None):
+        # empty crawls are most likely failed crawls and should be retried next time
+        if len(crawling_data.midjourney_images) == 0:
+            return
+        value = json.dumps([[img.image_url, img.prompt] for img in crawling_data.midjourney_images], separators=(",", ":"))
+        self._cache.set(crawl_cache_key(target_page, search_term, similar_image_seed, account, mode, target_count, backend), value.encode("utf-8"))
+        if self.prompt_corpus is not None:
+            self.prompt_corpus.add(crawling_data.midjourney_images, source=CrawlingTargetPage(target_page).value, search_term=search_term)
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+
+_crawl_cache: Optional[CrawlCache] = None
+_crawl_cache_lock = threading.Lock()
+
+
+def get_crawl_cache() -> CrawlCache:
+    """Returns the process wide crawl cache. TTL is configurable via env variable CRAWL_CACHE_TTL_SEC."""
+    global _crawl_cache
+    with _crawl_cache_lock:
+        if _crawl_cache is None:
+            _crawl_cache = CrawlCache(os.path.join(get_cache_dir(), "crawl_cache.sqlite"),
+                                      max_entries=int(os.environ.get("CRAWL_CACHE_MAX_ENTRIES", 500)),
+                                      ttl_sec=float(os.environ.get("CRAWL_CACHE_TTL_SEC", 24 * 60 * 60)),
+                                      prompt_corpus=get_prompt_corpus())
+        return _crawl_cache
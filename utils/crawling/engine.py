@@ -0,0 +1,239 @@
+""" Resilient execution of the selenium crawls.
+A crawl is split into opening the page and extracting images. Every attempt runs with its own pooled driver and per-step
+timeouts. Failed attempts are retried with exponential backoff within the time budget of the crawl, images of failed
+attempts are kept (partial results). Drivers which crashed or hang are evicted by the driver pool, so that the retry
+gets a new one. A circuit breaker per target page stops sending crawls to a site which fails permanently.
+What went wrong is counted per error kind in a CrawlReport instead of being printed.
+"""
+import os
+import time
+import random
+import logging
+import threading
+
+from enum import Enum
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.webdriver import WebDriver
+from urllib3.exceptions import TimeoutError as HttpTimeoutError
+
+from utils.driver_pool import DriverPool, get_driver_pool
+from utils.selenium_fns import SeleniumBrowser
+from utils.crawling.readiness import ReadinessWaiter
+from utils.data_classes import CrawlingTargetPage, CrawlErrorKind, CrawlReport, MidjourneyImage, MidjourneyImageCollection
+
+
+_active_report = threading.local()
+
+
+@contextmanager
+def report_scope(report: CrawlReport):
+    """Errors recorded with record_crawl_error in this thread are counted in report"""
+    previous = getattr(_active_report, "report", None)
+    _active_report.report = report
+    try:
+        yield report
+    finally:
+        _active_report.report = previous
+
+
+def record_crawl_error(kind: CrawlErrorKind, error: BaseException, message: str = ""):
+    """Logs an error, which the crawl survives, and counts it in the report of the running crawl (if any)"""
+    logging.warning(f"{message or 'Crawl error'}: {error}")
+    report: Optional[CrawlReport] = getattr(_active_report, "report", None)
+    if report is not None:
+        report.record(kind, error)
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 3
+    backoff_base_sec: float = 1.0
+    backoff_max_sec: float = 10.0
+
+    def backoff_sec(self, attempt: int) -> float:
+        """Exponential backoff with full jitter, so that parallel crawls do not retry in lockstep"""
+        return random.uniform(0, min(self.backoff_max_sec, self.backoff_base_sec * 2 ** (attempt - 1)))
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """ Opens after failure_threshold consecutive failed attempts, open circuits reject attempts immediately.
+    After reset_timeout_sec one trial attempt is let through (half open), which closes the circuit on success.
+    Every allowed attempt must end with record_success, record_failure or release_trial, otherwise no further trial is let through.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_sec: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_sec:
+                return CircuitState.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == CircuitState.CLOSED:
+                return True
+            if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_sec:
+                self._state = CircuitState.HALF_OPEN
+            if self._state == CircuitState.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def release_trial(self):
+        """Ends an attempt without result (e.g. stopped by the consumer), the next attempt can be the trial"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != CircuitState.OPEN:
+                    logging.warning(f"Circuit opened after {self._failures} failed crawl attempts")
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+
+
+_circuit_breakers: Dict[CrawlingTargetPage, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(target_page: CrawlingTargetPage) -> CircuitBreaker:
+    """ Returns the process wide circuit breaker of target_page.
+    Configurable via env variables CRAWL_CIRCUIT_FAILURES and CRAWL_CIRCUIT_RESET_SEC.
+    """
+    target_page = CrawlingTargetPage(target_page)
+    with _circuit_breakers_lock:
+        if target_page not in _circuit_breakers:
+            _circuit_breakers[target_page] = CircuitBreaker(failure_threshold=int(os.environ.get("CRAWL_CIRCUIT_FAILURES", 5)),
+                                                            reset_timeout_sec=float(os.environ.get("CRAWL_CIRCUIT_RESET_SEC", 60)))
+        return _circuit_breakers[target_page]
+
+
+def get_step_timeout_sec() -> float:
+    """Hard limit of a single page load or script execution, configurable via env variable CRAWL_STEP_TIMEOUT_SEC"""
+    return float(os.environ.get("CRAWL_STEP_TIMEOUT_SEC", 30))
+
+
+def classify_error(error: BaseException, browser: SeleniumBrowser) -> CrawlErrorKind:
+    if isinstance(error, (TimeoutException, TimeoutError, HttpTimeoutError)):
+        return CrawlErrorKind.TIMEOUT
+    if isinstance(error, WebDriverException) and not browser.is_alive():
+        return CrawlErrorKind.DRIVER_CRASH
+    return CrawlErrorKind.PAGE_ERROR
+
+
+OpenPage = Callable[[WebDriver, ReadinessWaiter], None]
+# extracts batches of images from the opened page within the given number of seconds
+IterImages = Callable[[WebDriver, ReadinessWaiter, float], Iterator[List[MidjourneyImage]]]
+
+
+class CrawlEngine:
+    def __init__(self, target_page: CrawlingTargetPage, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None, driver_pool: Optional[DriverPool] = None,
+                 step_timeout_sec: Optional[float] = None):
+        self.target_page = CrawlingTargetPage(target_page)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(target_page)
+        self.driver_pool = driver_pool or get_driver_pool()
+        self.step_timeout_sec = step_timeout_sec or get_step_timeout_sec()
+
+    def stream(self, open_page: OpenPage, iter_images: IterImages, time_budget_sec: float = 60,
+               report: Optional[CrawlReport] = None) -> Iterator[List[MidjourneyImage]]:
+        """ Yields batches of new images. Every attempt opens the page again, images found by a previous attempt are not yielded twice.
+        Closing the iterator stops the crawl and releases the driver.
+        """
+        report = report if report is not None else CrawlReport()
+        midjourney_images = MidjourneyImageCollection()
+        deadline = time.monotonic() + time_budget_sec
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            if not self.circuit_breaker.allow():
+                report.record(CrawlErrorKind.CIRCUIT_OPEN)
+                logging.warning(f"Crawl of {self.target_page.value} rejected, circuit is {self.circuit_breaker.state.value}")
+                break
+            report.attempts += 1
+            leased = False
+            attempt_ended = False
+            try:
+                with self.driver_pool.lease() as browser:
+                    leased = True
+                    driver = browser.driver
+                    waiter = ReadinessWaiter(driver)
+                    try:
+                        driver.set_page_load_timeout(self.step_timeout_sec)
+                        driver.set_script_timeout(self.step_timeout_sec)
+                        with report_scope(report):
+                            open_page(driver, waiter)
+                            batches = iter_images(driver, waiter, max(0.0, deadline - time.monotonic()))
+                        while True:
+                            # the scope is left before yielding, the consumer may crawl something else in this thread
+                            with report_scope(report):
+                                batch = next(batches, None)
+                            if batch is None:
+                                break
+                            new_images = [midjourney_image for midjourney_image in batch if midjourney_images.add(midjourney_image)]
+                            report.image_count = len(midjourney_images)
+                            if new_images:
+                                yield new_images
+                    except Exception as e:
+                        # classified while the driver is leased, the pool evicts it on release if it does not respond
+                        report.record(classify_error(e, browser), e)
+                        raise
+                    finally:
+                        logging.info(f"Crawl attempt {attempt} of {self.target_page.value} {waiter.summary()}")
+                self.circuit_breaker.record_success()
+                attempt_ended = True
+                report.completed = True
+                return
+            except Exception as e:
+                if leased:
+                    self.circuit_breaker.record_failure()
+                else:
+                    # no free driver, which is not the fault of the target page
+                    self.circuit_breaker.release_trial()
+                    report.record(CrawlErrorKind.PAGE_ERROR, e)
+                attempt_ended = True
+                remaining_sec = deadline - time.monotonic()
+                logging.warning(f"Crawl attempt {attempt} of {self.target_page.value} failed ({remaining_sec:.0f}s left): {e}")
+                if remaining_sec <= 0:
+                    break
+                time.sleep(min(remaining_sec, self.retry_policy.backoff_sec(attempt)))
+            finally:
+                # the consumer closed the iterator (GeneratorExit), which tells nothing about the target page
+                if not attempt_ended:
+                    self.circuit_breaker.release_trial()
+        logging.warning(f"Crawl of {self.target_page.value} {report.summary()}")
+
+    def run(self, open_page: OpenPage, extract_images: Callable[[WebDriver, ReadinessWaiter], List[MidjourneyImage]],
+            time_budget_sec: float = 60, report: Optional[CrawlReport] = None) -> MidjourneyImageCollection:
+        """Like stream, but for extractions which return all images at once"""
+        midjourney_images = MidjourneyImageCollection()
+        for batch in self.stream(open_page, lambda driver, waiter, _: iter([list(extract_images(driver, waiter))]),
+                                 time_budget_sec=time_budget_sec, report=report):
+            midjourney_images.extend(batch)
+        return midjourney_images
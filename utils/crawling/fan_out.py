@@ -0,0 +1,110 @@
+""" Crawls several search terms in parallel. Every term is crawled by its own streaming crawl with its own pooled driver.
+"""
+import queue
+import logging
+import threading
+
+from dataclasses import dataclass, replace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.data_classes import CrawlingData, CrawlingTargetPage, CrawlingBackend, CrawlReport, MidjourneyImage
+from utils.crawling import stream_openartai, stream_midjourney
+
+
+class TermStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class FanOutUpdate:
+    """ Progress of one search term. new_images are the images of this update, which were not found by any other term before.
+    crawling_data contains the merged and deduplicated results of all terms so far.
+    report is set, when the crawl of the term is finished (a done term can have partial results).
+    """
+    search_term: str
+    status: str
+    image_count: int
+    new_images: List[MidjourneyImage]
+    crawling_data: CrawlingData
+    error: Optional[str] = None
+    report: Optional[CrawlReport] = None
+
+
+def normalize_search_terms(search_terms: List[str]) -> List[str]:
+    """Strips search terms and removes empty and duplicate terms (case insensitive), order is kept"""
+    normalized_terms, seen = [], set()
+    for search_term in search_terms:
+        search_term = " ".join(search_term.split())
+        if search_term and search_term.lower() not in seen:
+            seen.add(search_term.lower())
+            normalized_terms.append(search_term)
+    return normalized_terms
+
+
+def fan_out_crawl(target_page: CrawlingTargetPage, search_terms: List[str], cookies: Optional[List[Dict[str, Any]]] = None,
+                  max_concurrency: int = 2, target_count_per_term: int = 50, time_budget_sec: float = 60,
+                  force_refresh: bool = False, backend: CrawlingBackend = CrawlingBackend.SELENIUM,
+                  account: str = "") -> Iterator[FanOutUpdate]:
+    """ Crawls all search terms with at most max_concurrency crawls at the same time and yields the progress of every term.
+    Midjourney is crawled with cookies of the user with account_id account.
+    Results are merged into one deduplicated CrawlingData, every image records the search term which found it first.
+    Closing the iterator stops all running crawls after their current batch.
+    """
+    search_terms = normalize_search_terms(search_terms)
+    crawling_data = CrawlingData()
+    if not search_terms:
+        return
+    updates: "queue.Queue[tuple]" = queue.Queue()
+    stop_event = threading.Event()
+
+    def crawl(search_term: str):
+        if stop_event.is_set():
+            return
+        updates.put((search_term, TermStatus.RUNNING, [], None, None))
+        report = CrawlReport()
+        try:
+            if CrawlingTargetPage(target_page) == CrawlingTargetPage.OPENART:
+                batches = stream_openartai(search_term, target_count=target_count_per_term, time_budget_sec=time_budget_sec,
+                                           force_refresh=force_refresh, backend=backend, report=report)
+            else:
+                batches = stream_midjourney(search_term, cookies, target_count=target_count_per_term,
+                                            time_budget_sec=time_budget_sec, force_refresh=force_refresh, report=report, account=account)
+            try:
+                for batch in batches:
+                    updates.put((search_term, TermStatus.RUNNING, batch, None, None))
+                    if stop_event.is_set():
+                        break
+            finally:
+                # releases the pooled driver
+                batches.close()
+            if report.completed or report.partial or stop_event.is_set():
+                updates.put((search_term, TermStatus.DONE, [], None, report))
+            else:
+                updates.put((search_term, TermStatus.FAILED, [], report.last_error or report.summary(), report))
+        except Exception as e:
+            logging.exception(f"Crawling of search term '{search_term}' failed")
+            updates.put((search_term, TermStatus.FAILED, [], str(e), report))
+
+    image_counts = {search_term: 0 for search_term in search_terms}
+    finished_terms = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(search_terms))), thread_name_prefix="fan-out-crawl")
+    try:
+        for search_term in search_terms:
+            executor.submit(crawl, search_term)
+            yield FanOutUpdate(search_term=search_term, status=TermStatus.PENDING, image_count=0, new_images=[], crawling_data=crawling_data)
+        while finished_terms < len(search_terms):
+            search_term, status, batch, error, report = updates.get()
+            new_images = [replace(midjourney_image, search_term=search_term) for midjourney_image in batch]
+            new_images = [midjourney_image for midjourney_image in new_images if crawling_data.midjourney_images.add(midjourney_image)]
+            image_counts[search_term] += len(batch)
+            if status in (TermStatus.DONE, TermStatus.FAILED):
+                finished_terms += 1
+            yield FanOutUpdate(search_term=search_term, status=status, image_count=image_counts[search_term],
+                               new_images=new_images, crawling_data=crawling_data, error=error, report=report)
+    finally:
+        stop_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
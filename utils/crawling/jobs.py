@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.data_classes import CrawlingData, CrawlingTargetPage, CrawlingBackend, CrawlReport
+from utils.crawling import stream_openartai, stream_midjourney
+
+DEFAULT_TARGET_COUNT = 200
+
+
+class CrawlJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class CrawlJobCancelled(Exception):
+    pass
+
+
+class CrawlJobQueueFull(Exception):
+    pass
+
+
+# target page, search term, backend, target count and authenticated session
+CrawlJobKey = Tuple[str, str, str, int, str]
+
+
+def crawl_job_key(target_page: CrawlingTargetPage, search_term: str, backend: CrawlingBackend = CrawlingBackend.SELENIUM,
+                  target_count: int = DEFAULT_TARGET_COUNT, cookies: Optional[List[Dict[str, Any]]] = None) -> CrawlJobKey:
+    """ Jobs with the same key deliver the same result and are coalesced.
+    Midjourney results depend on the authenticated session, therefore midjourney jobs are only coalesced for the same cookies.
+    """
+    target_page = CrawlingTargetPage(target_page)
+    session_key = ""
+    if target_page == CrawlingTargetPage.MIDJOURNEY:
+        session_key = hashlib.sha256(json.dumps(cookies or [], sort_keys=True).encode("utf-8")).hexdigest()
+    return target_page.value, " ".join(search_term.lower().split()), CrawlingBackend(backend).value, target_count, session_key
+
+
+class CrawlJob:
+    """ Crawl running in a background worker.
+    progress() has the same interface as a streamlit progress bar, so that the job can be passed to the crawlers
+    and progress_value/progress_text can be polled by the frontend.
+    """
+
+    def __init__(self, target_page: CrawlingTargetPage, search_term: str, cookies: Optional[List[Dict[str, Any]]] = None,
+                 deadline: Optional[float] = None, target_count: int = DEFAULT_TARGET_COUNT,
+                 backend: CrawlingBackend = CrawlingBackend.SELENIUM, account: str = ""):
+        self.key = crawl_job_key(target_page, search_term, backend, target_count, cookies)
+        self.target_page = CrawlingTargetPage(target_page)
+        self.search_term = search_term
+        self.cookies = cookies or []
+        self.account = account  # account_id of the midjourney user of cookies
+        self.deadline = deadline  # time.monotonic() timestamp
+        self.target_count = target_count
+        self.backend = backend
+        self.status = CrawlJobStatus.PENDING
+        self.progress_value = 0
+        self.progress_text = "Waiting for free browser..."
+        self.result: Optional[CrawlingData] = None
+        self.error: Optional[str] = None
+        # attempts and errors of the crawl, partial results are returned as done job
+        self.report = CrawlReport()
+        self.subscribers = 1
+        self.created_at = time.monotonic()
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done_event.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def progress(self, value: int, text: Optional[str] = None):
+        self.check_cancelled()
+        self.progress_value = value
+        if text is not None:
+            self.progress_text = text
+
+    def remaining_sec(self) -> Optional[float]:
+        return self.deadline - time.monotonic() if self.deadline is not None else None
+
+    def check_cancelled(self):
+        """Raises CrawlJobCancelled, if the job was cancelled or its deadline is exceeded"""
+        if self._cancel_event.is_set():
+            raise CrawlJobCancelled("Crawl job was cancelled")
+        remaining_sec = self.remaining_sec()
+        if remaining_sec is not None and remaining_sec <= 0:
+            raise CrawlJobCancelled("Crawl job exceeded its deadline")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the job is finished. Returns whether it is finished."""
+        return self._done_event.wait(timeout)
+
+    def _finish(self, status: CrawlJobStatus, result: Optional[CrawlingData] = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if status == CrawlJobStatus.DONE:
+            self.progress_value = 100
+        self._done_event.set()
+
+
+class CrawlJobQueue:
+    """ Bounded pool of crawl workers.
+    Concurrent requests with the same crawl_job_key (e.g. the same search term) are coalesced into one job.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 20, time_budget_sec: float = 60):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.time_budget_sec = time_budget_sec
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawl-worker")
+        self._jobs: Dict[CrawlJobKey, CrawlJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, target_page: CrawlingTargetPage, search_term: str, cookies: Optional[List[Dict[str, Any]]] = None,
+               timeout_sec: Optional[float] = None, target_count: int = DEFAULT_TARGET_COUNT,
+               backend: CrawlingBackend = CrawlingBackend.SELENIUM, account: str = "") -> CrawlJob:
+        """Returns the active job with the same crawl_job_key or starts a new one"""
+        key = crawl_job_key(target_page, search_term, backend, target_count, cookies)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.done and not job.cancelled:
+                job.subscribers += 1
+                return job
+            if len(self._jobs) >= self.max_workers + self.max_pending:
+                raise CrawlJobQueueFull(f"Too many crawl jobs ({len(self._jobs)}), please try again later")
+            deadline = time.monotonic() + timeout_sec if timeout_sec is not None else None
+            job = CrawlJob(target_page, search_term, cookies=cookies, deadline=deadline, target_count=target_count,
+                           backend=backend, account=account)
+            self._jobs[key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def cancel(self, job: CrawlJob):
+        """Unsubscribes from job. The crawl itself is only cancelled, if nobody else waits for it."""
+        with self._lock:
+            job.subscribers -= 1
+            if job.subscribers <= 0:
+                job._cancel_event.set()
+
+    def active_jobs(self) -> List[CrawlJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job: CrawlJob):
+        try:
+            job.check_cancelled()
+            job.status = CrawlJobStatus.RUNNING
+            result = self._crawl(job)
+            if job.report.completed or job.report.partial:
+                job._finish(CrawlJobStatus.DONE, result=result)
+            else:
+                job._finish(CrawlJobStatus.FAILED, error=job.report.last_error or job.report.summary())
+        except CrawlJobCancelled as e:
+            job._finish(CrawlJobStatus.CANCELLED, error=str(e))
+        except Exception as e:
+            logging.exception(f"Crawl job {job.key} failed")
+            job._finish(CrawlJobStatus.FAILED, error=str(e))
+        finally:
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+
+    def _crawl(self, job: CrawlJob) -> CrawlingData:
+        remaining_sec = job.remaining_sec()
+        time_budget_sec = self.time_budget_sec if remaining_sec is None else min(self.time_budget_sec, remaining_sec)
+        job.progress(5, text="Crawling Midjourney images: Search...")
+        if job.target_page == CrawlingTargetPage.OPENART:
+            midjourney_image_batches = stream_openartai(job.search_term, target_count=job.target_count,
+                                                        time_budget_sec=time_budget_sec, backend=job.backend, report=job.report)
+        else:
+            midjourney_image_batches = stream_midjourney(job.search_term, job.cookies, target_count=job.target_count,
+                                                         time_budget_sec=time_budget_sec, report=job.report, account=job.account)
+
+        crawling_data = CrawlingData()
+        try:
+            for midjourney_image_batch in midjourney_image_batches:
+                crawling_data.midjourney_images.extend(midjourney_image_batch)
+                # raises CrawlJobCancelled, which stops the crawl and releases the driver
+                job.progress(min(99, 10 + int(90 * len(crawling_data.midjourney_images) / job.target_count)),
+                             text=f"Crawling Midjourney images: {len(crawling_data.midjourney_images)} images...")
+        finally:
+            midjourney_image_batches.close()
+        return crawling_data
+
+
+_crawl_job_queue: Optional[CrawlJobQueue] = None
+_crawl_job_queue_lock = threading.Lock()
+
+
+def get_crawl_job_queue() -> CrawlJobQueue:
+    """Returns the process wide crawl job queue. By default it has as many workers as the driver pool has drivers."""
+    global _crawl_job_queue
+    with _crawl_job_queue_lock:
+        if _crawl_job_queue is None:
+            _crawl_job_queue = CrawlJobQueue(max_workers=int(os.environ.get("CRAWL_WORKERS", os.environ.get("DRIVER_POOL_SIZE", 2))))
+        return _crawl_job_queue
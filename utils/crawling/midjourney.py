@@ -1,64 +1,114 @@
 import time
+import logging
 import streamlit as st
 
-from typing import List
+from typing import Any, Dict, List, Iterator, Optional
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import WebDriverException
 
-from utils.session import set_session_state_if_not_exists
-from utils.data_classes import SessionState, CrawlingData, MidjourneyImage
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from utils.session import set_session_state_if_not_exists, is_crawl_force_refresh
+from utils.driver_pool import get_driver_pool
+from utils.crawling.cache import CrawlMode, get_crawl_cache
+from utils.crawling.readiness import ReadinessWaiter
+from utils.crawling.engine import CrawlEngine, record_crawl_error
+from utils.crawling.session_store import get_session_store, account_id, remove_expired_cookies
+from utils.crawling.resource_blocking import apply_crawl_profile, clear_crawl_profile
+from utils.tracing import traced
+from utils.data_classes import SessionState, CrawlingData, MidjourneyImage, MidjourneyImageCollection, CrawlingTargetPage, CrawlErrorKind, CrawlReport
 
+@traced()
 def login_to_midjourney():
+    """ Logs in with the credentials of the sidebar and keeps the authenticated cookies in the session.
+    """
     set_session_state_if_not_exists()
     session_state: SessionState = st.session_state["session_state"]
-    driver = session_state.browser.driver
+    cookies = login_to_midjourney_with_credentials(st.session_state["mid_email"], st.session_state["mid_password"])
+    # pooled drivers are reset after each lease, therefore we keep the authenticated cookies in the session
+    session_state.midjourney_cookies = cookies
+    session_state.midjourney_account = account_id(st.session_state["mid_email"])
+    session_state.status.midjourney_login = True
+
+
+def login_to_midjourney_with_credentials(email: str, password: str) -> List[Dict[str, Any]]:
+    """ Restores the stored session of the account, if it is still valid. Otherwise logs in and stores the new session.
+    Returns the authenticated midjourney cookies.
+    """
+    session_store = get_session_store()
+    stored_cookies = session_store.load(email, password)
+    with get_driver_pool().lease() as browser:
+        if stored_cookies and is_midjourney_session_valid(browser.driver, stored_cookies):
+            return stored_cookies
+        login_to_midjourney_with_driver(browser.driver, email, password)
+        cookies = browser.driver.get_cookies()
+    session_store.save(email, password, cookies)
+    return cookies
+
+
+@traced("midjourney.session_check")
+def is_midjourney_session_valid(driver: WebDriver, cookies) -> bool:
+    """Restores cookies in driver and checks whether the search of authenticated users is available"""
+    apply_crawl_profile(driver, CrawlingTargetPage.MIDJOURNEY)
+    add_midjourney_cookies(driver, cookies)
+    midjourney_community_feed(driver)
+    waiter = ReadinessWaiter(driver)
+    return waiter.element_visible("midjourney_session_check", (By.CSS_SELECTOR, 'input[name="search"]'), max_timeout_sec=5) is not None
+
+
+def login_to_midjourney_with_driver(driver: WebDriver, email: str, password: str):
+    waiter = ReadinessWaiter(driver)
+    # discord can show a captcha, which needs images
+    clear_crawl_profile(driver)
     # Click on home page
     driver.get("https://www.midjourney.com")
 
     # Sign in
-    time.sleep(5)
+    waiter.element_clickable("midjourney_sign_in", (By.XPATH, f"//*[contains(text(), '{SIGN_IN_TEXT}')]"), max_timeout_sec=15)
     click_sign_in(driver)
 
     # Login in with discord credentials
-    wait = WebDriverWait(driver, 10)  # Adjust the timeout as needed
-    wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "button[type='submit']")))
-    discord_login(driver)
+    waiter.element_visible("discord_login_form", (By.CSS_SELECTOR, "button[type='submit']"), max_timeout_sec=10, raise_on_timeout=True)
+    discord_login(driver, email, password, waiter)
 
     # Wait until the domain changes
     new_domain = "midjourney.com"
-    wait = WebDriverWait(driver, 5)
-    wait.until(EC.url_contains(new_domain))
+    waiter.url_contains("midjourney_redirect", new_domain, max_timeout_sec=5, raise_on_timeout=True)
+    logging.info(f"Midjourney login {waiter.summary()}")
 
-    session_state.status.midjourney_login = True
 
+SIGN_IN_TEXT = "Sign In"
 
 def click_sign_in(driver: WebDriver):
-    sign_in_text = "Sign In"
-    button = driver.find_element(By.XPATH, f"//*[contains(text(), '{sign_in_text}')]")
+    button = driver.find_element(By.XPATH, f"//*[contains(text(), '{SIGN_IN_TEXT}')]")
     button.click()
 
-def discord_login(driver: WebDriver):
+def discord_login_submitted(driver: WebDriver) -> bool:
+    """Whether discord left the login form, either by redirect or by showing a captcha"""
+    return "discord.com/login" not in driver.current_url or len(driver.find_elements(By.CSS_SELECTOR, "iframe[src*='captcha']")) > 0
+
+def discord_login(driver: WebDriver, email: str, password: str, waiter: ReadinessWaiter = None):
     """Fill discord login form and simulate submit button click"""
     # Fill in the form fields
     username_input = driver.find_element(By.NAME, "email")
     password_input = driver.find_element(By.NAME, "password")
-    username_input.send_keys(st.session_state["mid_email"])
-    password_input.send_keys(st.session_state["mid_password"])
+    username_input.send_keys(email)
+    password_input.send_keys(password)
 
     # Submit the form
     submit_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
     submit_button.click()
 
-    time.sleep(3)
+    waiter = waiter or ReadinessWaiter(driver)
+    waiter.until("discord_login_submit", discord_login_submitted, max_timeout_sec=10)
     # TODO: captcha can arrise
     if "captcha" in driver.page_source.lower():
-        st.error("Captcha Error appeared")
+        logging.warning("Captcha appeared during discord login")
 
     # if not redirect to midjourney happend, we probably need to authorized midjourney to acces the discord account first
     if "discord.com" in driver.current_url:
+        waiter.element_count_at_least("discord_authorize", (By.XPATH, "//button"), count=2, max_timeout_sec=10)
         authorize_midjourney(driver)
 
 
@@ -67,24 +117,41 @@ def authorize_midjourney(driver: WebDriver):
     auth_button.click()
 
 
+def add_midjourney_cookies(driver: WebDriver, cookies):
+    """Restores an authenticated midjourney session in a (pooled) driver"""
+    if not cookies:
+        return
+    # cookies can only be set for the domain of the currently opened page
+    driver.get("https://www.midjourney.com")
+    # cookies of a long running session can expire meanwhile, the browser rejects them
+    for cookie in remove_expired_cookies(cookies):
+        if "midjourney.com" not in cookie.get("domain", ""):
+            continue
+        try:
+            driver.add_cookie(cookie)
+        except Exception as e:
+            logging.warning(f"Could not add cookie {cookie.get('name')}: {e}")
+
+
 def midjourney_community_feed(driver: WebDriver):
     driver.get("https://www.midjourney.com/app/feed/")
 
-def midjourney_search_prompts(search_term: str, driver: WebDriver):
-    search_input = driver.find_element(By.CSS_SELECTOR, 'input[name="search"]')
+def midjourney_search_prompts(search_term: str, driver: WebDriver, waiter: ReadinessWaiter = None):
+    waiter = waiter or ReadinessWaiter(driver)
+    search_input = waiter.element_visible("midjourney_search_input", (By.CSS_SELECTOR, 'input[name="search"]'), max_timeout_sec=10, raise_on_timeout=True)
     search_input.send_keys(search_term)
 
-    time.sleep(1)
     # Find the parent element of the search input
     parent_element = search_input.find_element(By.XPATH, './..')
     search_button = parent_element.find_element(By.XPATH, './following-sibling::button')
+    waiter.until("midjourney_search_button", lambda _: search_button.is_enabled(), max_timeout_sec=2)
     search_button.click()
 
-def check_if_image_exists(images: List[MidjourneyImage], image_url: str) -> bool:
-    for img in images:
-        if img.image_url == image_url:
-            return True
-    return False
+def upscale_image_url(image_url: str) -> str:
+    """Transforms the image url of a thumbnail to the url of the upscaled image"""
+    image_url_splitted = image_url.split("_N.webp")[0].split("_")
+    image_url_splitted[-1] = "640" # midjourney stores upscaled images with 640 and not 32
+    return "_".join(image_url_splitted) + "_N.webp"
 
 def extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver):
     # Create an instance of ActionChains
@@ -98,43 +165,244 @@ def extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver):
             image_url = gridcell.find_element(By.TAG_NAME, 'link').get_attribute('href')
             assert ".webp" in image_url, f"image_url {image_url}, is not in the expected webp format"
             # Transform string to get upscaled image
-            image_url_splitted = image_url.split("_N.webp")[0].split("_")
-            image_url_splitted[-1] = "640" # midjourney stores upscaled images with 640 and not 32
-            image_url = "_".join(image_url_splitted) + "_N.webp"
+            image_url = upscale_image_url(image_url)
+            # skip expensive hover, if image was already extracted
+            if midjourney_images.contains_image_url(image_url):
+                continue
 
             ## Extract prompt
             # Hover over the gridcell
             actions.move_to_element(gridcell).perform()
             # extract prompt from text area
             prompt = driver.find_element(By.CSS_SELECTOR, "p._promptText_").text
-            if not check_if_image_exists(midjourney_images, image_url):
-                midjourney_images.append(MidjourneyImage(image_url=image_url, prompt=prompt))
+            midjourney_images.add(MidjourneyImage(image_url=image_url, prompt=prompt))
         except Exception as e:
-            print(str(e))
+            record_crawl_error(CrawlErrorKind.EXTRACTION, e, "Could not extract gridcell")
+
+# Extracts image url and prompt of a chunk of the gridcells matching arguments[0] in one WebDriver round trip (asynchronous script).
+# The prompt overlay is only rendered on hover, therefore every gridcell is hovered by dispatching mouse events and the
+# overlay text is read like extend_midjourney_images_by_gridcells does. The alt text of the image is not a reliable prompt.
+# An overlay belongs to the hovered gridcell, if it is rendered inside of it or positioned on top of it. Any other overlay is stale
+# (e.g. still shows the prompt of the previously hovered gridcell), comparing prompts does not work as variations share their prompt.
+# If arguments[1] is set, gridcells are marked as processed. Gridcells without overlay are returned as element,
+# so that they can be extracted element by element.
+EXTRACT_GRIDCELLS_JS = """
+const [selector, markCrawled, offset, chunkSize, done] = arguments;
+const isOnTop = (element, gridcell) => {
+    const rect = element.getBoundingClientRect(), cellRect = gridcell.getBoundingClientRect();
+    const x = rect.left + rect.width / 2, y = rect.top + rect.height / 2;
+    return x >= cellRect.left && x <= cellRect.right && y >= cellRect.top && y <= cellRect.bottom;
+};
+const overlayText = gridcell => {
+    for (const overlay of document.querySelectorAll("p._promptText_")) {
+        if (gridcell.contains(overlay) || isOnTop(overlay, gridcell)) return overlay.innerText.trim();
+    }
+    return "";
+};
+// the overlay can be rendered after the event handlers, wait for the next frame (at most 50ms)
+const nextFrame = () => new Promise(resolve => { requestAnimationFrame(() => setTimeout(resolve, 0)); setTimeout(resolve, 50); });
+(async () => {
+    const gridcells = Array.from(document.querySelectorAll(selector));
+    const chunk = gridcells.slice(offset, offset + chunkSize);
+    const results = [];
+    for (const gridcell of chunk) {
+        if (markCrawled) gridcell.dataset.crawled = "1";
+        const link = gridcell.querySelector("link");
+        let prompt = "";
+        if (link && link.href) {
+            gridcell.dispatchEvent(new MouseEvent("mouseover", {bubbles: true}));
+            gridcell.dispatchEvent(new MouseEvent("mouseenter"));
+            await Promise.resolve();
+            prompt = overlayText(gridcell);
+            if (!prompt) {
+                await nextFrame();
+                prompt = overlayText(gridcell);
+            }
+            gridcell.dispatchEvent(new MouseEvent("mouseout", {bubbles: true}));
+            gridcell.dispatchEvent(new MouseEvent("mouseleave"));
+        }
+        if (!link || !link.href || !prompt) {
+            results.push({image_url: null, prompt: null, gridcell: gridcell});
+            continue;
+        }
+        results.push({image_url: link.href, prompt: prompt, gridcell: null});
+    }
+    return {results: results, remaining: gridcells.length - offset - chunk.length};
+})().then(done, error => done({error: String(error)}));
+"""
+
+# a gridcell takes up to 50ms (one frame wait), a chunk stays far below the script timeout
+GRIDCELL_CHUNK_SIZE = 100
+
+
+def execute_extract_gridcells(driver: WebDriver, selector: str, mark_crawled: bool, chunk_size: int = GRIDCELL_CHUNK_SIZE) -> List[Dict[str, Any]]:
+    """ Extracts all gridcells matching selector with one execute_async_script call per chunk of chunk_size gridcells.
+    With mark_crawled, selector has to exclude marked gridcells (the next chunk starts at the first gridcell matching it again).
+    """
+    results = []
+    while True:
+        chunk = driver.execute_async_script(EXTRACT_GRIDCELLS_JS, selector, mark_crawled, 0 if mark_crawled else len(results), chunk_size)
+        if "error" in chunk:
+            raise WebDriverException(f"Gridcell extraction failed: {chunk['error']}")
+        results.extend(chunk["results"])
+        if chunk["remaining"] <= 0 or not chunk["results"]:
+            return results
+
 
-def extract_midjourney_images(driver: WebDriver) -> List[MidjourneyImage]:
-    midjourney_images: List[MidjourneyImage] = []
+def extend_midjourney_images_by_gridcells_bulk(midjourney_images, driver, reverse=False) -> List[WebElement]:
+    """ Extends midjourney_images by all gridcells of the current page with one execute_async_script call.
+    Returns all gridcells, which could not be extracted in bulk.
+    """
+    gridcells = execute_extract_gridcells(driver, 'div[role="gridcell"]', mark_crawled=False)
+    if reverse:
+        gridcells.reverse()
+    missing_gridcells = []
+    for gridcell in gridcells:
+        if gridcell["gridcell"] is not None:
+            missing_gridcells.append(gridcell["gridcell"])
+            continue
+        if ".webp" not in gridcell["image_url"]:
+            continue
+        image_url = upscale_image_url(gridcell["image_url"])
+        midjourney_images.add(MidjourneyImage(image_url=image_url, prompt=gridcell["prompt"]))
+    return missing_gridcells
+
+def extend_midjourney_images(midjourney_images, driver, reverse=False, bulk=True):
+    """Extracts all gridcells of the current page, in bulk if possible and element by element otherwise"""
+    if bulk:
+        try:
+            gridcells = extend_midjourney_images_by_gridcells_bulk(midjourney_images, driver, reverse=reverse)
+            extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver)
+            return
+        except WebDriverException as e:
+            logging.warning(f"Bulk extraction failed, fall back to element by element extraction: {e}")
     gridcells = driver.find_elements(By.CSS_SELECTOR, 'div[role="gridcell"]')
-    gridcells.reverse() # last html element is displayed on top of page
+    if reverse:
+        gridcells.reverse()
+    extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver)
+
+@traced("midjourney.extract")
+def extract_midjourney_images(driver: WebDriver, waiter: ReadinessWaiter = None, bulk=True) -> MidjourneyImageCollection:
+    waiter = waiter or ReadinessWaiter(driver)
+    midjourney_images = MidjourneyImageCollection()
 
     # extract all currently visible gridcells
-    extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver)
+    # last html element is displayed on top of page
+    extend_midjourney_images(midjourney_images, driver, reverse=True, bulk=bulk)
     # Scroll down to make more gridcells visible
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    gridcells = driver.find_elements(By.CSS_SELECTOR, 'div[role="gridcell"]')
-    #gridcells.reverse() # last html element is displayed on top of page
-    extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver)
+    waiter.network_idle("midjourney_scroll_load", max_timeout_sec=5)
+    extend_midjourney_images(midjourney_images, driver, bulk=bulk)
 
     return midjourney_images
 
+COUNT_NEW_GRIDCELLS_JS = """return document.querySelectorAll('div[role="gridcell"]:not([data-crawled])').length;"""
 
-def crawl_midjourney(tab_crawling):
-    session_state: SessionState = st.session_state["session_state"]
-    driver = session_state.browser.driver
-    time.sleep(1)
+def iter_midjourney_images(driver: WebDriver, target_count=200, time_budget_sec=60, waiter: ReadinessWaiter = None, max_idle_scrolls=3) -> Iterator[List[MidjourneyImage]]:
+    """ Infinite scroll crawling. Yields batches of new midjourney images until target_count unique images are found,
+    time_budget_sec is exceeded or scrolling does not load new gridcells anymore.
+    Only gridcells which were not processed before are extracted and no WebElements are kept between batches.
+    """
+    waiter = waiter or ReadinessWaiter(driver)
+    midjourney_images = MidjourneyImageCollection()
+    deadline = time.monotonic() + time_budget_sec
+    idle_scrolls = 0
+    while len(midjourney_images) < target_count:
+        image_count = len(midjourney_images)
+        missing_gridcells = []
+        # only gridcells which were not processed by a previous call
+        for gridcell in execute_extract_gridcells(driver, 'div[role="gridcell"]:not([data-crawled])', mark_crawled=True):
+            if gridcell["gridcell"] is not None:
+                missing_gridcells.append(gridcell["gridcell"])
+            elif ".webp" in gridcell["image_url"]:
+                midjourney_images.add(MidjourneyImage(image_url=upscale_image_url(gridcell["image_url"]), prompt=gridcell["prompt"]))
+        # gridcells without prompt need to be hovered
+        extend_midjourney_images_by_gridcells(midjourney_images, missing_gridcells, driver)
+        del missing_gridcells
+        batch = midjourney_images[image_count:target_count]
+        if batch:
+            idle_scrolls = 0
+            yield batch
+        else:
+            idle_scrolls += 1
+
+        remaining_sec = deadline - time.monotonic()
+        if idle_scrolls >= max_idle_scrolls or remaining_sec <= 0:
+            break
+        # Scroll down to load more gridcells
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        if not waiter.until("midjourney_infinite_scroll", lambda driver: driver.execute_script(COUNT_NEW_GRIDCELLS_JS) > 0, max_timeout_sec=min(10, remaining_sec)):
+            # scrolling did not load anything new, end of results is reached
+            break
+
+
+@traced("midjourney.navigate")
+def open_midjourney_search(driver: WebDriver, search_term: str, cookies, waiter: ReadinessWaiter):
+    """Opens the midjourney community feed (authenticated by cookies) and searches for search_term"""
+    apply_crawl_profile(driver, CrawlingTargetPage.MIDJOURNEY)
+    add_midjourney_cookies(driver, cookies)
     midjourney_community_feed(driver)
-    time.sleep(2)
-    midjourney_search_prompts(session_state.crawling_request.search_term, driver)
-    time.sleep(4)
-    session_state.crawling_data = CrawlingData(midjourney_images=extract_midjourney_images(driver))
+    midjourney_search_prompts(search_term, driver, waiter)
+    # wait until search results are rendered
+    waiter.element_count_stable("midjourney_search_results", (By.CSS_SELECTOR, 'div[role="gridcell"]'), max_timeout_sec=15)
+
+
+def stream_midjourney(search_term: str, cookies, target_count=200, time_budget_sec=60, force_refresh=False,
+                      report: Optional[CrawlReport] = None, account: str = "") -> Iterator[List[MidjourneyImage]]:
+    """ Streaming crawl of midjourney search results, yields batches of midjourney images as they are extracted.
+    Complete crawls are cached per account (account_id of the user, whose cookies are used) and target_count,
+    a cached result is yielded as one batch.
+    Failed attempts are retried, report (if given) is filled with the attempts and errors of the crawl.
+    """
+    crawl_cache = get_crawl_cache()
+    crawling_data = None if force_refresh else crawl_cache.get(CrawlingTargetPage.MIDJOURNEY, search_term, account=account,
+                                                               mode=CrawlMode.SCROLL, target_count=target_count)
+    report = report if report is not None else CrawlReport()
+    if crawling_data is not None:
+        report.completed = True
+        report.image_count = min(target_count, len(crawling_data.midjourney_images))
+        yield crawling_data.midjourney_images[:target_count]
+        return
+    crawling_data = CrawlingData()
+    for batch in CrawlEngine(CrawlingTargetPage.MIDJOURNEY).stream(
+            lambda driver, waiter: open_midjourney_search(driver, search_term, cookies, waiter),
+            lambda driver, waiter, remaining_sec: iter_midjourney_images(driver, target_count=target_count, time_budget_sec=remaining_sec, waiter=waiter),
+            time_budget_sec=time_budget_sec, report=report):
+        crawling_data.midjourney_images.extend(batch)
+        yield batch
+    logging.info(f"Midjourney streaming crawl {report.summary()}")
+    # partial results are not cached, so that the next request crawls again
+    if report.completed:
+        crawl_cache.set(CrawlingTargetPage.MIDJOURNEY, search_term, crawling_data, account=account, mode=CrawlMode.SCROLL,
+                        target_count=target_count)
 
+
+def crawl_midjourney_search(search_term: str, cookies, force_refresh=False, report: Optional[CrawlReport] = None, account: str = "") -> CrawlingData:
+    """ Crawls the midjourney search results of search_term with the authenticated cookies. Does not depend on the streamlit session.
+    Results are cached per account (account_id of the user, whose cookies are used).
+    Results of incomplete crawls are returned, but not cached, report (if given) tells why.
+    """
+    report = report if report is not None else CrawlReport()
+    crawl_cache = get_crawl_cache()
+    crawling_data = None if force_refresh else crawl_cache.get(CrawlingTargetPage.MIDJOURNEY, search_term, account=account, mode=CrawlMode.PAGE)
+    if crawling_data is not None:
+        report.completed = True
+        report.image_count = len(crawling_data.midjourney_images)
+        return crawling_data
+    crawling_data = CrawlingData(midjourney_images=CrawlEngine(CrawlingTargetPage.MIDJOURNEY).run(
+        lambda driver, waiter: open_midjourney_search(driver, search_term, cookies, waiter),
+        lambda driver, waiter: extract_midjourney_images(driver, waiter), report=report))
+    logging.info(f"Midjourney crawl {report.summary()}")
+    if report.completed:
+        crawl_cache.set(CrawlingTargetPage.MIDJOURNEY, search_term, crawling_data, account=account, mode=CrawlMode.PAGE)
+    return crawling_data
+
+
+@traced()
+def crawl_midjourney(tab_crawling):
+    session_state: SessionState = st.session_state["session_state"]
+    report = CrawlReport()
+    session_state.crawling_data = crawl_midjourney_search(session_state.crawling_request.search_term, session_state.midjourney_cookies,
+                                                          is_crawl_force_refresh(), report, account=session_state.midjourney_account)
+    if not report.completed:
+        tab_crawling.warning(f"Crawling of midjourney was not completed: {report.summary()}")
@@ -1,17 +1,31 @@
 import time
+import heapq
 import logging
+import itertools
+import collections
 import streamlit as st
 import math
 
-from typing import List
+from typing import Counter, Dict, List, Iterator, Optional, Tuple
+from dataclasses import dataclass, replace
 from contextlib import suppress
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.webelement import WebElement
+from selenium.common.exceptions import WebDriverException
 
-from utils.session import set_session_state_if_not_exists
-from utils.data_classes import SessionState, CrawlingData, MidjourneyImage
+from utils.session import set_session_state_if_not_exists, is_crawl_force_refresh
+from utils.crawling.cache import CrawlMode, get_crawl_cache
+from utils.crawling.readiness import ReadinessWaiter
+from utils.crawling.engine import CrawlEngine, record_crawl_error
+from utils.crawling.openart_ai_http import crawl_openartai_http
+from utils.prompt_corpus import get_prompt_corpus
+from utils.crawling.resource_blocking import apply_crawl_profile
+from utils.tracing import traced
+from utils.few_shot_selection import hash_embed
+from utils.data_classes import SessionState, CrawlingData, MidjourneyImage, MidjourneyImageCollection, CrawlingTargetPage, CrawlErrorKind, CrawlReport, CrawlingBackend, normalize_image_url
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
@@ -20,8 +34,9 @@ from selenium.webdriver.support import expected_conditions as EC
 def get_openartai_discovery(driver: WebDriver):
     driver.get("https://openart.ai/discovery")
 
-def openartai_search_prompts(search_term: str, driver: WebDriver):
-    search_input = driver.find_element(By.CSS_SELECTOR, 'input[id=":R36ilaqplal6:"]')
+def openartai_search_prompts(search_term: str, driver: WebDriver, waiter: ReadinessWaiter = None):
+    waiter = waiter or ReadinessWaiter(driver)
+    search_input = waiter.element_clickable("openart_search_input", (By.CSS_SELECTOR, 'input[id=":R36ilaqplal6:"]'), max_timeout_sec=10, raise_on_timeout=True)
     # Click on input field
     search_input.click()
     # Put text in input
@@ -29,34 +44,76 @@ def openartai_search_prompts(search_term: str, driver: WebDriver):
     # Simulate pressing the Enter key
     search_input.send_keys(Keys.ENTER)
 
-def check_if_image_exists(images: List[MidjourneyImage], image_url: str) -> bool:
-    for img in images:
-        if img.image_url == image_url:
-            return True
-    return False
-
-def apply_filters(driver: WebDriver, preiod_wait_in_sec=1):
+def apply_filters(driver: WebDriver, waiter: ReadinessWaiter = None):
+    waiter = waiter or ReadinessWaiter(driver)
+    filter_locator = (By.CLASS_NAME, 'MuiFormControlLabel-root')
     # Open model selection filter field
-    driver.find_element(By.CLASS_NAME, 'MuiFormControlLabel-root').click()
-    time.sleep(preiod_wait_in_sec)
+    driver.find_element(*filter_locator).click()
+    waiter.element_count_at_least("openart_filter_options", filter_locator, count=3, max_timeout_sec=5)
     # deactivate Stable Diffusion
-    driver.find_elements(By.CLASS_NAME, 'MuiFormControlLabel-root')[1].click()
-    time.sleep(preiod_wait_in_sec)
+    driver.find_elements(*filter_locator)[1].click()
+    waiter.network_idle("openart_filter_stable_diffusion", max_timeout_sec=5)
     # deactivate DALL-E 2
-    driver.find_elements(By.CLASS_NAME, 'MuiFormControlLabel-root')[2].click()
+    driver.find_elements(*filter_locator)[2].click()
+
+# Extracts image url and prompt of all cards in one WebDriver round trip.
+# Cards are returned in screen order (row by row over all grid columns).
+# Cards without image or prompt are returned as element, so that they can be extracted element by element.
+BULK_EXTRACT_CARDS_JS = """
+const presentationViews = document.querySelectorAll("div[role='presentation']");
+// if we have a presentation view, only images of this view are extracted
+const root = presentationViews.length > 0 ? presentationViews[presentationViews.length - 1] : document;
+const gridColumns = Array.from(root.querySelectorAll("[style*='flex-direction: column']"))
+    .map(column => Array.from(column.querySelectorAll(".MuiCard-root")));
+const maxRows = Math.max(0, ...gridColumns.map(gridColumn => gridColumn.length));
+const cards = [];
+for (let i = 0; i < maxRows; i++) {
+    for (const gridColumn of gridColumns) {
+        if (i < gridColumn.length) cards.push(gridColumn[i]);
+    }
+}
+return cards.map(card => {
+    const image = card.querySelector("img[src$='.webp'], img[src$='.jpg'], img[src$='.jpeg'], img[src$='.png']");
+    const promptElement = card.querySelector(".MuiTypography-body2");
+    const prompt = promptElement ? promptElement.innerText.trim() : null;
+    if (!image || prompt === null) {
+        return {image_url: null, prompt: null, card: card};
+    }
+    return {image_url: image.src, prompt: prompt, card: null};
+});
+"""
+
+
+def is_valid_image_url(image_url: str) -> bool:
+    # catch wrong template image
+    if "image_1685064640647_1024" in image_url:
+        return False
+    return any(image_url.endswith(ending) for ending in [".webp", ".jpg", "jpeg", ".png"])
+
 
-def extract_midjourney_images(driver: WebDriver, crawling_progress_bar, progress: int, progress_max=90) -> List[MidjourneyImage]:
-    midjourney_images: List[MidjourneyImage] = []
+def extract_midjourney_images_bulk(driver: WebDriver, midjourney_images: MidjourneyImageCollection) -> List[WebElement]:
+    """ Extends midjourney_images by all cards of the current page with one execute_script call.
+    Returns all cards, which could not be extracted in bulk (e.g. image is not rendered yet).
+    """
+    missing_gridcells = []
+    for card in driver.execute_script(BULK_EXTRACT_CARDS_JS):
+        if card["card"] is not None:
+            missing_gridcells.append(card["card"])
+            continue
+        image_url = card["image_url"]
+        if not is_valid_image_url(image_url):
+            continue
+        midjourney_images.add(MidjourneyImage(image_url=image_url, prompt=card["prompt"]))
+    return missing_gridcells
+
+
+def get_gridcells(driver: WebDriver) -> List[WebElement]:
+    """Returns all cards of the current page in screen order"""
     try:
         # if we have a presentation view, driver should include only images for this view
         driver_view = driver.find_elements(By.XPATH, "//div[@role='presentation']")[-1]
     except:
         driver_view = driver
-    expand_prompt_text(driver)
-    # scroll to botton
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-    time.sleep(1)
-    expand_prompt_text(driver)
 
     # bring grid elements in right order to screen scrolling
     columns = driver_view.find_elements(By.XPATH, ".//*[contains(@style, 'flex-direction: column')]")
@@ -70,6 +127,11 @@ def extract_midjourney_images(driver: WebDriver, crawling_progress_bar, progress
             for grid_column in grid_columns:
                 with suppress(IndexError):
                     gridcells.append(grid_column[i])
+    return gridcells
+
+
+def extend_midjourney_images_by_gridcells(midjourney_images: MidjourneyImageCollection, gridcells: List[WebElement], driver: WebDriver, crawling_progress_bar, progress: int, progress_max=90):
+    """Extracts image url and prompt element by element (multiple WebDriver round trips per card)"""
     progress_left = progress_max - progress
     for i, gridcell in enumerate(gridcells):
         # skip if its not a midjourney image
@@ -86,29 +148,131 @@ def extract_midjourney_images(driver: WebDriver, crawling_progress_bar, progress
             # catch wrong template image
             if "image_1685064640647_1024" in image_url:
                 continue
-            assert any(image_url.endswith(ending) for ending in [".webp", ".jpg", "jpeg", ".png"]) , f"image_url {image_url}, is not in the expected image format"
+            assert is_valid_image_url(image_url), f"image_url {image_url}, is not in the expected image format"
             # extract prompt from text area
             prompt = gridcell.find_element(By.CLASS_NAME, "MuiTypography-body2").text
-            if not check_if_image_exists(midjourney_images, image_url):
-                midjourney_images.append(MidjourneyImage(image_url=image_url, prompt=prompt))
-            crawling_progress_bar.progress(int(progress + (progress_left * (i/len(gridcells)))), text="Crawling Midjourney images" + ": Crawling...")
+            midjourney_images.add(MidjourneyImage(image_url=image_url, prompt=prompt))
+            if crawling_progress_bar:
+                crawling_progress_bar.progress(int(progress + (progress_left * (i/len(gridcells)))), text="Crawling Midjourney images" + ": Crawling...")
 
         except Exception as e:
-            print("Could not extract image and prompt", str(e))
+            record_crawl_error(CrawlErrorKind.EXTRACTION, e, "Could not extract image and prompt")
             continue
 
+
+@traced("openart.extract")
+def extract_midjourney_images(driver: WebDriver, crawling_progress_bar, progress: int, progress_max=90, waiter: ReadinessWaiter = None, bulk=True) -> MidjourneyImageCollection:
+    """ Extracts all midjourney images of the current page.
+    If bulk is True, all cards are extracted with one JavaScript call and only cards which could not be extracted
+    that way, fall back to the element by element extraction.
+    """
+    waiter = waiter or ReadinessWaiter(driver)
+    midjourney_images = MidjourneyImageCollection()
+    expand_prompt_text(driver)
+    # scroll to botton
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    waiter.network_idle("openart_scroll_load", max_timeout_sec=5)
+    expand_prompt_text(driver)
+
+    if bulk:
+        try:
+            gridcells = extract_midjourney_images_bulk(driver, midjourney_images)
+        except WebDriverException as e:
+            logging.warning(f"Bulk extraction failed, fall back to element by element extraction: {e}")
+            midjourney_images = MidjourneyImageCollection()
+            gridcells = get_gridcells(driver)
+    else:
+        gridcells = get_gridcells(driver)
+
+    extend_midjourney_images_by_gridcells(midjourney_images, gridcells, driver, crawling_progress_bar, progress, progress_max)
     return midjourney_images
 
 
+# Clicks all "[more]" elements in one WebDriver round trip
+EXPAND_PROMPT_TEXT_JS = """
+const moreElements = document.evaluate("//span[text()='[more]']", document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (let i = 0; i < moreElements.snapshotLength; i++) {
+    try { moreElements.snapshotItem(i).click(); } catch (e) {}
+}
+return moreElements.snapshotLength;
+"""
+
+# Like BULK_EXTRACT_CARDS_JS, but only returns cards which were not processed by a previous call.
+# Processed cards are marked with a data attribute, cards without image are retried up to arguments[0] times.
+STREAM_EXTRACT_CARDS_JS = """
+const maxAttempts = arguments[0];
+const presentationViews = document.querySelectorAll("div[role='presentation']");
+const root = presentationViews.length > 0 ? presentationViews[presentationViews.length - 1] : document;
+const gridColumns = Array.from(root.querySelectorAll("[style*='flex-direction: column']"))
+    .map(column => Array.from(column.querySelectorAll(".MuiCard-root:not([data-crawled])")));
+const maxRows = Math.max(0, ...gridColumns.map(gridColumn => gridColumn.length));
+const results = [];
+for (let i = 0; i < maxRows; i++) {
+    for (const gridColumn of gridColumns) {
+        if (i >= gridColumn.length) continue;
+        const card = gridColumn[i];
+        const image = card.querySelector("img[src$='.webp'], img[src$='.jpg'], img[src$='.jpeg'], img[src$='.png']");
+        const promptElement = card.querySelector(".MuiTypography-body2");
+        if (!image || !promptElement) {
+            const attempts = parseInt(card.dataset.crawlAttempts || "0") + 1;
+            card.dataset.crawlAttempts = attempts;
+            if (attempts >= maxAttempts) card.dataset.crawled = "1";
+            continue;
+        }
+        card.dataset.crawled = "1";
+        results.push({image_url: image.src, prompt: promptElement.innerText.trim()});
+    }
+}
+return results;
+"""
+
+COUNT_NEW_CARDS_JS = """return document.querySelectorAll(".MuiCard-root:not([data-crawled])").length;"""
+
+
+def iter_midjourney_images(driver: WebDriver, target_count=200, time_budget_sec=60, waiter: ReadinessWaiter = None, max_idle_scrolls=3) -> Iterator[List[MidjourneyImage]]:
+    """ Infinite scroll crawling. Yields batches of new midjourney images until target_count unique images are found,
+    time_budget_sec is exceeded or scrolling does not load new cards anymore.
+    Only cards which were not processed before are extracted and no WebElements are kept between batches.
+    """
+    waiter = waiter or ReadinessWaiter(driver)
+    midjourney_images = MidjourneyImageCollection()
+    deadline = time.monotonic() + time_budget_sec
+    idle_scrolls = 0
+    while len(midjourney_images) < target_count:
+        driver.execute_script(EXPAND_PROMPT_TEXT_JS)
+        image_count = len(midjourney_images)
+        for card in driver.execute_script(STREAM_EXTRACT_CARDS_JS, 3):
+            if len(midjourney_images) >= target_count:
+                break
+            if is_valid_image_url(card["image_url"]):
+                midjourney_images.add(MidjourneyImage(image_url=card["image_url"], prompt=card["prompt"]))
+        batch = midjourney_images[image_count:]
+        if batch:
+            idle_scrolls = 0
+            yield batch
+        else:
+            idle_scrolls += 1
+
+        remaining_sec = deadline - time.monotonic()
+        if idle_scrolls >= max_idle_scrolls or remaining_sec <= 0:
+            break
+        # Scroll down to load more cards
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        if not waiter.until("openart_infinite_scroll", lambda driver: driver.execute_script(COUNT_NEW_CARDS_JS) > 0, max_timeout_sec=min(10, remaining_sec)):
+            # scrolling did not load anything new, end of results is reached
+            break
+
+
 def wait_until_image_loaded(gridcell, wait_secs=1):
     # Define the locator for the image element
     image_locator = (By.CSS_SELECTOR, "img[src$='.webp'], img[src$='.jpg'], img[src$='.jpeg'], img[src$='.png']")
-    # Wait until the image element is visible
+    # Wait until the image element has its final src. Visibility can not be used, as images are blocked by the crawl profile.
     wait = WebDriverWait(gridcell, wait_secs)
-    image_element = wait.until(EC.visibility_of_element_located(image_locator))
+    image_element = wait.until(EC.presence_of_element_located(image_locator))
     return image_element
 
 
+@traced("openart.expand_prompt_text")
 def expand_prompt_text(driver):
     # Click on all more to make prompt completly visible
     more_elements = driver.find_elements(By.XPATH, "//span[text()='[more]']")
@@ -119,68 +283,349 @@ def expand_prompt_text(driver):
             #more_element.click()
             driver.execute_script("arguments[0].click();", more_element)
         except Exception as e:
-            print(f"more element number {i} is not clickable")
+            record_crawl_error(CrawlErrorKind.EXTRACTION, e, f"More element number {i} is not clickable")
             continue
 
-def click_image(driver, prompt):
-    # cut prompt to handle ' char
-    prompt = prompt[:prompt.find("'")]
-    #prompt_web_elements = driver.find_elements(By.XPATH, f"//span[text()='{prompt}']")
-    prompt_web_elements = driver.find_elements(By.XPATH, f"//*[contains(text(), '{prompt}')]")
-    if len(prompt_web_elements) == 0:
-        st.error("Could not find element. Please try another one.")
-        return None
-    prompt_web_element = prompt_web_elements[0]
-    gridcell = prompt_web_element.find_elements(By.XPATH, "./ancestor::div[contains(@class, 'MuiPaper-root')]")[-1]
+# Clicks the image with src arguments[0]. The last match is clicked, as an open presentation view is rendered after the page.
+CLICK_IMAGE_BY_URL_JS = """
+const images = Array.from(document.querySelectorAll("img")).filter(image => image.src === arguments[0]);
+if (images.length === 0) return false;
+const image = images[images.length - 1];
+image.scrollIntoView({block: "center"});
+image.click();
+return true;
+"""
 
-    # Scroll to the element using JavaScript
-    driver.execute_script("arguments[0].scrollIntoView();", gridcell)
-    # Wait until image tag is loaded
+@traced("openart.click_image")
+def click_image(driver, image_url: str) -> bool:
+    """Clicks the image with image_url on the current page, which opens its similar images. Returns False if the image is not on the page."""
+    return bool(driver.execute_script(CLICK_IMAGE_BY_URL_JS, image_url))
+
+@traced("openart.navigate")
+def open_openartai_search(driver: WebDriver, search_term: str, crawling_progress_bar=None, progress_text="", waiter: ReadinessWaiter = None):
+    """Opens the openart.ai discovery page and searches for search_term"""
+    waiter = waiter or ReadinessWaiter(driver)
+    if crawling_progress_bar:
+        crawling_progress_bar.progress(20,text=progress_text + ": Search...")
+    apply_crawl_profile(driver, CrawlingTargetPage.OPENART)
+    get_openartai_discovery(driver)
+    if crawling_progress_bar:
+        crawling_progress_bar.progress(30,text=progress_text + ": Search...")
+    openartai_search_prompts(search_term, driver, waiter)
+    if crawling_progress_bar:
+        crawling_progress_bar.progress(40,text=progress_text + ": Apply filters...")
+    #apply_filters(driver)
+    # wait until search results are rendered
+    waiter.element_count_stable("openart_search_results", (By.CLASS_NAME, 'MuiCard-root'), max_timeout_sec=15)
+
+@traced("openart.http")
+def try_crawl_openartai_http(search_term: str) -> Optional[CrawlingData]:
+    """Crawls search results with the http backend. Returns None if this fails, so that selenium can be used as fallback."""
     try:
-        image_element = wait_until_image_loaded(gridcell)
+        return CrawlingData(midjourney_images=crawl_openartai_http(search_term))
     except Exception as e:
-        logging.warning(e)
-        image_element = gridcell.find_element(By.CSS_SELECTOR, "img[src$='.webp'], img[src$='.jpg'], img[src$='.jpeg'], img[src$='.png']")
+        logging.warning(f"Http crawling of openart.ai failed, fall back to selenium: {e}")
+        return None
 
-    # click image
-    driver.execute_script("arguments[0].click();", image_element)
-    #image_element.click()
+@traced("prompt_corpus.search")
+def try_search_prompt_corpus(search_term: str, limit: int = 200, min_results: int = 20) -> Optional[CrawlingData]:
+    """Searches the local prompt corpus. Returns None if it contains less than min_results matches, so that selenium can be used as fallback."""
+    midjourney_images = get_prompt_corpus().search(search_term, limit=limit)
+    if len(midjourney_images) < min_results:
+        logging.info(f"Prompt corpus contains only {len(midjourney_images)} matches for '{search_term}', fall back to selenium")
+        return None
+    return CrawlingData(midjourney_images=midjourney_images)
 
+def cached_backend(backend: CrawlingBackend) -> CrawlingBackend:
+    """ Backend whose cached results answer a request for backend. Http results only contain the first result page and are cached separately.
+    The corpus backend is not cached, but uses complete selenium crawls if available.
+    """
+    return CrawlingBackend.HTTP if backend == CrawlingBackend.HTTP else CrawlingBackend.SELENIUM
+
+def crawl_openartai_search(search_term: str, backend=CrawlingBackend.SELENIUM, force_refresh=False, crawling_progress_bar=None,
+                           progress_text="Crawling Midjourney images", report: Optional[CrawlReport] = None) -> CrawlingData:
+    """ Crawls the openart.ai search results of search_term. Does not depend on the streamlit session, progress is reported to
+    crawling_progress_bar (optional). Results of incomplete crawls are returned, but not cached, report (if given) tells why.
+    """
+    report = report if report is not None else CrawlReport()
+    crawl_cache = get_crawl_cache()
+    crawling_data = None if force_refresh else crawl_cache.get(CrawlingTargetPage.OPENART, search_term, mode=CrawlMode.PAGE, backend=cached_backend(backend))
+    if crawling_data is None and backend == CrawlingBackend.HTTP:
+        if crawling_progress_bar:
+            crawling_progress_bar.progress(50,text=progress_text + ": Crawling...")
+        crawling_data = try_crawl_openartai_http(search_term)
+        if crawling_data is not None:
+            crawl_cache.set(CrawlingTargetPage.OPENART, search_term, crawling_data, mode=CrawlMode.PAGE, backend=CrawlingBackend.HTTP)
+    if crawling_data is None and backend == CrawlingBackend.CORPUS:
+        crawling_data = try_search_prompt_corpus(search_term)
+    if crawling_data is not None:
+        report.completed = True
+        report.image_count = len(crawling_data.midjourney_images)
+        return crawling_data
+
+    def open_page(driver, waiter):
+        open_openartai_search(driver, search_term, crawling_progress_bar, progress_text, waiter)
+        if crawling_progress_bar:
+            crawling_progress_bar.progress(50,text=progress_text + ": Crawling...")
+    crawling_data = CrawlingData(midjourney_images=CrawlEngine(CrawlingTargetPage.OPENART).run(
+        open_page, lambda driver, waiter: extract_midjourney_images(driver, crawling_progress_bar, 50, waiter=waiter), report=report))
+    logging.info(f"Openart crawl {report.summary()}")
+    if report.completed:
+        crawl_cache.set(CrawlingTargetPage.OPENART, search_term, crawling_data, mode=CrawlMode.PAGE, backend=CrawlingBackend.SELENIUM)
+    return crawling_data
+
+@traced()
 def crawl_openartai(crawling_tab):
     set_session_state_if_not_exists()
     progress_text = "Crawling Midjourney images"
     crawling_progress_bar = crawling_tab.progress(0, text=progress_text)
     crawling_progress_bar.progress(10,text=progress_text + ": Setup...")
     session_state: SessionState = st.session_state["session_state"]
-    driver = session_state.browser.driver
-    time.sleep(1)
-    crawling_progress_bar.progress(20,text=progress_text + ": Search...")
-    get_openartai_discovery(driver)
-    crawling_progress_bar.progress(30,text=progress_text + ": Search...")
-    openartai_search_prompts(session_state.crawling_request.search_term, driver)
-    time.sleep(1)
-    crawling_progress_bar.progress(40,text=progress_text + ": Apply filters...")
-    #apply_filters(driver)
-    time.sleep(2)
-    crawling_progress_bar.progress(50,text=progress_text + ": Crawling...")
-    session_state.crawling_data = CrawlingData(midjourney_images=extract_midjourney_images(driver, crawling_progress_bar, 50))
+    report = CrawlReport()
+    session_state.crawling_data = crawl_openartai_search(session_state.crawling_request.search_term, session_state.crawling_request.backend,
+                                                         is_crawl_force_refresh(), crawling_progress_bar, progress_text, report)
+    if not report.completed:
+        crawling_tab.warning(f"Crawling of openart.ai was not completed: {report.summary()}")
     crawling_progress_bar.empty()
 
+def stream_openartai(search_term: str, target_count=200, time_budget_sec=60, force_refresh=False, backend=CrawlingBackend.SELENIUM,
+                     report: Optional[CrawlReport] = None) -> Iterator[List[MidjourneyImage]]:
+    """ Streaming crawl of openart.ai search results, yields batches of midjourney images as they are extracted.
+    Complete crawls are cached per target_count, a cached result is yielded as one batch.
+    Failed attempts are retried, report (if given) is filled with the attempts and errors of the selenium crawl.
+    The http backend only delivers the first result page, but does not need a selenium driver.
+    The corpus backend answers from the local prompt corpus, if it contains enough matches.
+    """
+    crawl_cache = get_crawl_cache()
+    crawling_data = None if force_refresh else crawl_cache.get(CrawlingTargetPage.OPENART, search_term, mode=CrawlMode.SCROLL, target_count=target_count,
+                                                               backend=cached_backend(backend))
+    if crawling_data is None and backend == CrawlingBackend.HTTP:
+        crawling_data = try_crawl_openartai_http(search_term)
+        if crawling_data is not None:
+            crawl_cache.set(CrawlingTargetPage.OPENART, search_term, crawling_data, mode=CrawlMode.SCROLL, target_count=target_count,
+                            backend=CrawlingBackend.HTTP)
+    if crawling_data is None and backend == CrawlingBackend.CORPUS:
+        crawling_data = try_search_prompt_corpus(search_term, limit=target_count)
+    report = report if report is not None else CrawlReport()
+    if crawling_data is not None:
+        report.completed = True
+        report.image_count = min(target_count, len(crawling_data.midjourney_images))
+        yield crawling_data.midjourney_images[:target_count]
+        return
+    crawling_data = CrawlingData()
+    for batch in CrawlEngine(CrawlingTargetPage.OPENART).stream(
+            lambda driver, waiter: open_openartai_search(driver, search_term, waiter=waiter),
+            lambda driver, waiter, remaining_sec: iter_midjourney_images(driver, target_count=target_count, time_budget_sec=remaining_sec, waiter=waiter),
+            time_budget_sec=time_budget_sec, report=report):
+        crawling_data.midjourney_images.extend(batch)
+        yield batch
+    logging.info(f"Openart streaming crawl {report.summary()}")
+    # partial results are not cached, so that the next request crawls again
+    if report.completed:
+        crawl_cache.set(CrawlingTargetPage.OPENART, search_term, crawling_data, mode=CrawlMode.SCROLL, target_count=target_count,
+                        backend=CrawlingBackend.SELENIUM)
+
+# Extracts image url, prompt and the link to the image page of all cards of the similar images view in one WebDriver round trip
+EXTRACT_SIMILAR_CARDS_JS = """
+const presentationViews = document.querySelectorAll("div[role='presentation']");
+const root = presentationViews.length > 0 ? presentationViews[presentationViews.length - 1] : document;
+return Array.from(root.querySelectorAll(".MuiCard-root")).map(card => {
+    const image = card.querySelector("img[src$='.webp'], img[src$='.jpg'], img[src$='.jpeg'], img[src$='.png']");
+    const promptElement = card.querySelector(".MuiTypography-body2");
+    const link = card.closest("a[href]") || card.querySelector("a[href]");
+    return {image_url: image ? image.src : null, prompt: promptElement ? promptElement.innerText.trim() : null, page_url: link ? link.href : null};
+});
+"""
+
+
+# attempts of the crawl engine, in which the similar images of an image could not be crawled, before the image is skipped
+MAX_SIMILAR_IMAGE_FAILURES = 2
+
+
+@dataclass
+class SimilarImageNode:
+    midjourney_image: MidjourneyImage
+    depth: int
+    # relevance of the prompt to the prompt of the seed image (cosine similarity)
+    relevance: float
+    # url of the image page, if known the similar images are opened directly instead of clicking the image on the page of the parent
+    page_url: Optional[str] = None
+    parent: Optional["SimilarImageNode"] = None
+
+
+@dataclass
+class SimilarImagesCrawlUpdate:
+    """Similar images of one expanded node. crawling_data contains the deduplicated results of all expanded nodes so far."""
+    node: SimilarImageNode
+    new_images: List[MidjourneyImage]
+    crawling_data: CrawlingData
+    expanded_nodes: int
+    frontier_size: int
+
+
+class SimilarImagesFrontier:
+    """ Nodes which are not expanded yet. Best first pops the node with the most relevant prompt first,
+    breadth first pops the node with the lowest depth first (most relevant first within one depth).
+    """
+
+    def __init__(self, best_first: bool = True):
+        self.best_first = best_first
+        self._heap = []
+        self._counter = itertools.count()
+
+    def push(self, node: SimilarImageNode):
+        priority = (-node.relevance, node.depth) if self.best_first else (node.depth, -node.relevance)
+        # counter keeps insertion order for equal priorities and avoids comparing nodes
+        heapq.heappush(self._heap, (priority, next(self._counter), node))
+
+    def pop(self) -> SimilarImageNode:
+        return heapq.heappop(self._heap)[-1]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def open_similar_images(driver: WebDriver, search_term: str, node: SimilarImageNode, waiter: ReadinessWaiter) -> bool:
+    """ Opens the similar images of node. If the url of the image page is known, it is opened directly.
+    Otherwise the image is clicked on the page of its parent (the search results for the seed image).
+    Returns False, if the image could not be found.
+    """
+    if node.page_url:
+        driver.get(node.page_url)
+        waiter.element_count_stable("openart_image_page", (By.CLASS_NAME, 'MuiCard-root'), max_timeout_sec=10)
+    else:
+        if node.parent is None:
+            open_openartai_search(driver, search_term, waiter=waiter)
+        elif not open_similar_images(driver, search_term, node.parent, waiter):
+            return False
+        previous_url = driver.current_url
+        if not click_image(driver, node.midjourney_image.image_url):
+            logging.warning(f"Could not find image {node.midjourney_image.image_url} on {previous_url}")
+            return False
+        if driver.current_url != previous_url:
+            # image page has its own url, children of this node can be opened without clicking through the parents
+            node.page_url = driver.current_url
+        waiter.element_count_stable("openart_similar_images", (By.XPATH, "//div[@role='presentation']//*[contains(@class, 'MuiCard-root')]"), max_timeout_sec=10)
+    return True
+
+
+def extract_similar_images(driver: WebDriver) -> Tuple[MidjourneyImageCollection, Dict[str, str]]:
+    """Returns the similar images of the open image and the urls of their image pages (by image url)"""
+    driver.execute_script(EXPAND_PROMPT_TEXT_JS)
+    midjourney_images, page_urls = MidjourneyImageCollection(), {}
+    for card in driver.execute_script(EXTRACT_SIMILAR_CARDS_JS):
+        if card["image_url"] is None or card["prompt"] is None or not is_valid_image_url(card["image_url"]):
+            continue
+        if midjourney_images.add(MidjourneyImage(image_url=card["image_url"], prompt=card["prompt"])) and card["page_url"]:
+            page_urls[card["image_url"]] = card["page_url"]
+    return midjourney_images, page_urls
+
+
+def iter_similar_images_graph(driver: WebDriver, search_term: str, seed: MidjourneyImage, max_depth=1, max_nodes=1, max_images=1000,
+                              time_budget_sec=120, best_first=True, force_refresh=False, waiter: ReadinessWaiter = None,
+                              image_failures: Optional[Counter[str]] = None) -> Iterator[SimilarImagesCrawlUpdate]:
+    """ Graph crawl over the similar images relation of openart.ai, starting with the similar images of seed (a search result of search_term).
+    Expands at most max_nodes images up to max_depth hops from the seed, every image at most once.
+    Images are expanded in the order of the relevance of their prompts to the seed prompt (best first) or hop by hop (breadth first).
+    Yields the results of every expanded image, similar images of one image are cached.
+    WebDriver errors are raised and counted per image url in image_failures (if given). Images other than the seed, which failed
+    MAX_SIMILAR_IMAGE_FAILURES times, are skipped, so that a single broken image page does not stop the whole crawl.
+    """
+    waiter = waiter or ReadinessWaiter(driver)
+    crawl_cache = get_crawl_cache()
+    seed_embedding = hash_embed([seed.prompt])[0]
+    crawling_data = CrawlingData()
+    frontier = SimilarImagesFrontier(best_first)
+    frontier.push(SimilarImageNode(seed, depth=0, relevance=1.0))
+    # images which were pushed to the frontier once, first discovery wins
+    enqueued = {normalize_image_url(seed.image_url)}
+    expanded_nodes = 0
+    deadline = time.monotonic() + time_budget_sec
+    while frontier and expanded_nodes < max_nodes and len(crawling_data.midjourney_images) < max_images and time.monotonic() < deadline:
+        node = frontier.pop()
+        if node.depth > 0 and image_failures and image_failures[node.midjourney_image.image_url] >= MAX_SIMILAR_IMAGE_FAILURES:
+            continue
+        similar_images = None if force_refresh else crawl_cache.get(CrawlingTargetPage.OPENART, search_term, similar_image_seed=node.midjourney_image.image_url)
+        page_urls = {}
+        if similar_images is not None:
+            similar_images = similar_images.midjourney_images
+        else:
+            try:
+                if not open_similar_images(driver, search_term, node, waiter):
+                    continue
+                similar_images, page_urls = extract_similar_images(driver)
+            except WebDriverException:
+                if image_failures is not None:
+                    image_failures[node.midjourney_image.image_url] += 1
+                raise
+            crawl_cache.set(CrawlingTargetPage.OPENART, search_term, CrawlingData(midjourney_images=similar_images), similar_image_seed=node.midjourney_image.image_url)
+        expanded_nodes += 1
+
+        new_images = []
+        for midjourney_image in similar_images:
+            if len(crawling_data.midjourney_images) >= max_images:
+                break
+            if crawling_data.midjourney_images.add(midjourney_image):
+                new_images.append(midjourney_image)
+        if node.depth + 1 < max_depth and similar_images:
+            relevances = hash_embed([midjourney_image.prompt for midjourney_image in similar_images]) @ seed_embedding
+            for midjourney_image, relevance in zip(similar_images, relevances):
+                image_key = normalize_image_url(midjourney_image.image_url)
+                if image_key not in enqueued:
+                    enqueued.add(image_key)
+                    frontier.push(SimilarImageNode(midjourney_image, depth=node.depth + 1, relevance=float(relevance),
+                                                   page_url=page_urls.get(midjourney_image.image_url), parent=node))
+        yield SimilarImagesCrawlUpdate(node=node, new_images=new_images, crawling_data=crawling_data,
+                                       expanded_nodes=expanded_nodes, frontier_size=len(frontier))
+
+
+def stream_openartai_similar_images(search_term: str, seed: MidjourneyImage, max_depth=1, max_nodes=1, max_images=1000, time_budget_sec=120,
+                                    best_first=True, force_refresh=False, report: Optional[CrawlReport] = None,
+                                    engine: Optional[CrawlEngine] = None) -> Iterator[SimilarImagesCrawlUpdate]:
+    """ Runs the graph crawl of iter_similar_images_graph with the crawl engine and yields every update with new images.
+    A failed attempt is retried with a new driver. The retry starts at the seed again, but the images expanded before are
+    answered by the cache. report (if given) is filled with the attempts and errors.
+    """
+    engine = engine or CrawlEngine(CrawlingTargetPage.OPENART)
+    image_failures: Counter[str] = collections.Counter()
+    updates: List[SimilarImagesCrawlUpdate] = []
+
+    def iter_images(driver, waiter, remaining_sec):
+        for update in iter_similar_images_graph(driver, search_term, seed, max_depth=max_depth, max_nodes=max_nodes, max_images=max_images,
+                                                time_budget_sec=remaining_sec, best_first=best_first, force_refresh=force_refresh,
+                                                waiter=waiter, image_failures=image_failures):
+            updates.append(update)
+            yield update.new_images
+
+    # images of a retry, which were already yielded by a previous attempt, are removed by the engine
+    for batch in engine.stream(lambda driver, waiter: apply_crawl_profile(driver, CrawlingTargetPage.OPENART), iter_images,
+                               time_budget_sec=time_budget_sec, report=report):
+        yield replace(updates[-1], new_images=batch)
+
+
+@traced()
 def crawl_openartai_similar_images(crawling_tab, image_nr):
+    """ Crawls the similar images of the selected image and adds them to the crawling results.
+    Depth, number of expanded images and order of the graph crawl are read from the session (one hop by default).
+    """
     progress_text = "Crawling Midjourney images"
     crawling_progress_bar = crawling_tab.progress(0, text=progress_text)
     # Get session data
     session_state: SessionState = st.session_state["session_state"]
-    driver = session_state.browser.driver
     midjourney_image: MidjourneyImage = session_state.crawling_data.midjourney_images[image_nr]
+    search_term = session_state.crawling_request.search_term
+    max_depth = st.session_state.get("similar_crawl_depth", 1)
+    max_nodes = st.session_state.get("similar_crawl_max_nodes", 1)
 
-    # Click on selected image
-    click_image(driver, midjourney_image.prompt)
-    time.sleep(1)
-    crawling_progress_bar.progress(30,text=progress_text + ": Crawling...")
-
-    # Crawl similar images
-    session_state.crawling_data = CrawlingData(midjourney_images=extract_midjourney_images(driver, crawling_progress_bar, 30))
+    report = CrawlReport()
+    for update in stream_openartai_similar_images(search_term, midjourney_image, max_depth=max_depth, max_nodes=max_nodes,
+                                                  best_first=st.session_state.get("similar_crawl_best_first", True),
+                                                  force_refresh=is_crawl_force_refresh(), report=report):
+        # accumulate, so that the numbers of the already displayed images do not change
+        session_state.crawling_data.midjourney_images.extend(update.new_images)
+        crawling_progress_bar.progress(min(100, int(100 * update.expanded_nodes / max_nodes)),
+                                       text=progress_text + f": {len(update.crawling_data.midjourney_images)} similar images of {update.expanded_nodes} images...")
+    logging.info(f"Openart similar images crawl {report.summary()}")
+    if not report.completed:
+        crawling_tab.warning(f"Crawling of similar images was not completed: {report.summary()}")
     crawling_progress_bar.empty()
-
-
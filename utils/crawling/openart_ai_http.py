@@ -0,0 +1,111 @@
+""" Crawls openart.ai search results via plain HTTP requests instead of a selenium driver.
+openart.ai is rendered by Next.js, therefore the initial search results are embedded as json in the __NEXT_DATA__ script tag.
+"""
+import os
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote, urljoin
+from urllib3.util.retry import Retry
+from typing import Any, Iterator, List, Optional
+
+from utils.data_classes import MidjourneyImage, MidjourneyImageCollection
+
+OPENART_BASE_URL = os.environ.get("OPENART_BASE_URL", "https://openart.ai")
+IMAGE_URL_KEYS = ["image_url", "imageUrl", "url", "src", "thumbnail_url"]
+IMAGE_ENDINGS = [".webp", ".jpg", "jpeg", ".png"]
+NEXT_DATA_START = '<script id="__NEXT_DATA__" type="application/json">'
+REQUEST_TIMEOUT_SEC = 10
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+
+
+class OpenartParseError(Exception):
+    pass
+
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Returns the process wide requests session, which pools connections to openart.ai"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], allowed_methods=["GET"])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept-Language": "en"})
+            _http_session = session
+        return _http_session
+
+
+def get_openartai_search_url(search_term: str, base_url: Optional[str] = None) -> str:
+    base_url = base_url or OPENART_BASE_URL
+    if not search_term:
+        return urljoin(base_url, "/discovery")
+    return urljoin(base_url, f"/search/{quote(search_term)}?method=prompt")
+
+
+def extract_next_data(html: str) -> Any:
+    """Returns the parsed json of the __NEXT_DATA__ script tag"""
+    start = html.find(NEXT_DATA_START)
+    if start == -1:
+        raise OpenartParseError("Page does not contain __NEXT_DATA__")
+    start += len(NEXT_DATA_START)
+    end = html.find("</script>", start)
+    try:
+        return json.loads(html[start:end])
+    except json.JSONDecodeError as e:
+        raise OpenartParseError(f"Could not parse __NEXT_DATA__: {e}")
+
+
+def iter_image_items(data: Any) -> Iterator[dict]:
+    """Yields all json objects, which contain a prompt and an image url (depth first, in document order)"""
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if isinstance(item.get("prompt"), str) and get_image_url(item):
+                yield item
+            stack.extend(reversed(list(item.values())))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+
+
+def get_image_url(item: dict) -> Optional[str]:
+    for key in IMAGE_URL_KEYS:
+        value = item.get(key)
+        if isinstance(value, str) and any(value.endswith(ending) for ending in IMAGE_ENDINGS):
+            return value
+    return None
+
+
+def parse_openartai_page(html: str) -> MidjourneyImageCollection:
+    """ Parses midjourney images out of an openart.ai discovery/search page.
+    Raises OpenartParseError, if the page does not contain any images (e.g. changed page structure).
+    """
+    midjourney_images = MidjourneyImageCollection()
+    for item in iter_image_items(extract_next_data(html)):
+        image_url = get_image_url(item)
+        # catch wrong template image
+        if "image_1685064640647_1024" in image_url:
+            continue
+        midjourney_images.add(MidjourneyImage(image_url=image_url, prompt=item["prompt"].strip()))
+    if len(midjourney_images) == 0:
+        raise OpenartParseError("No images found in __NEXT_DATA__")
+    return midjourney_images
+
+
+def crawl_openartai_http(search_term: str, base_url: Optional[str] = None, session: Optional[requests.Session] = None) -> List[MidjourneyImage]:
+    """ Fetches and parses openart.ai search results without selenium.
+    Raises requests.RequestException or OpenartParseError, if the page could not be crawled.
+    """
+    session = session or get_http_session()
+    response = session.get(get_openartai_search_url(search_term, base_url), timeout=REQUEST_TIMEOUT_SEC)
+    response.raise_for_status()
+    return list(parse_openartai_page(response.text))
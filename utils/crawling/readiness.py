@@ -0,0 +1,183 @@
+import math
+import time
+import logging
+import threading
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Any
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.webdriver import WebDriver
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from utils.tracing import span
+
+Locator = Tuple[str, str]
+
+# Number of resources the page finished loading so far. The resource timing buffer of the browser stops at 250 entries,
+# therefore finished resources are counted by a PerformanceObserver, which is installed on the first call per page.
+RESOURCE_COUNT_JS = """
+if (window.__crawlResourceCount === undefined) {
+    window.__crawlResourceCount = performance.getEntriesByType("resource").length;
+    new PerformanceObserver(list => { window.__crawlResourceCount += list.getEntries().length; }).observe({type: "resource"});
+}
+return window.__crawlResourceCount;
+"""
+
+
+@dataclass
+class StepLatency:
+    observations: int = 0
+    mean_sec: float = 0.0
+    var_sec: float = 0.0
+    timeouts: int = 0
+
+
+class AdaptiveTimeouts:
+    """ Learns per step how long the crawled pages need to become ready.
+    Latencies are tracked as exponentially weighted mean/variance. The timeout of a step is
+    the larger of twice the mean and mean + 4 standard deviations, but at least min_timeout_sec
+    and at most the hard limit of the step.
+    """
+
+    def __init__(self, alpha=0.2, min_timeout_sec=2.0):
+        self.alpha = alpha
+        self.min_timeout_sec = min_timeout_sec
+        self._steps: Dict[str, StepLatency] = {}
+        self._lock = threading.Lock()
+
+    def timeout(self, step: str, max_timeout_sec: float) -> float:
+        with self._lock:
+            latency = self._steps.get(step)
+            if latency is None or latency.observations < 3:
+                # not enough observations yet to trust the estimate
+                return max_timeout_sec
+            timeout_sec = max(2 * latency.mean_sec, latency.mean_sec + 4 * math.sqrt(latency.var_sec))
+            return min(max_timeout_sec, max(self.min_timeout_sec, timeout_sec))
+
+    def observe(self, step: str, wait_sec: float, timed_out: bool):
+        with self._lock:
+            latency = self._steps.setdefault(step, StepLatency())
+            if timed_out:
+                # a timeout only tells us that the page was slower than expected, widen the estimate
+                latency.timeouts += 1
+                wait_sec = wait_sec * 2
+            if latency.observations == 0:
+                latency.mean_sec = wait_sec
+            else:
+                diff = wait_sec - latency.mean_sec
+                latency.mean_sec += self.alpha * diff
+                latency.var_sec = (1 - self.alpha) * (latency.var_sec + self.alpha * diff * diff)
+            latency.observations += 1
+
+    def stats(self) -> Dict[str, StepLatency]:
+        with self._lock:
+            return {step: StepLatency(**vars(latency)) for step, latency in self._steps.items()}
+
+
+_adaptive_timeouts = AdaptiveTimeouts()
+
+
+def get_adaptive_timeouts() -> AdaptiveTimeouts:
+    """Returns the process wide learned step latencies"""
+    return _adaptive_timeouts
+
+
+@dataclass
+class WaitRecord:
+    step: str
+    wait_sec: float
+    timeout_sec: float
+    timed_out: bool
+
+
+class ReadinessWaiter:
+    """ Waits for page readiness conditions instead of fixed sleeps.
+    Every wait is named by a step, which is used to learn the timeout and to report the time spent waiting.
+    """
+
+    def __init__(self, driver: WebDriver, adaptive_timeouts: Optional[AdaptiveTimeouts] = None, poll_frequency=0.1):
+        self.driver = driver
+        self.adaptive_timeouts = adaptive_timeouts or get_adaptive_timeouts()
+        self.poll_frequency = poll_frequency
+        self.records: List[WaitRecord] = []
+
+    def until(self, step: str, condition: Callable[[WebDriver], Any], max_timeout_sec: float = 10,
+              raise_on_timeout: bool = False) -> Any:
+        """ Waits until condition returns a truthy value. Returns the value or None after a timeout
+        (or raises TimeoutException if raise_on_timeout is set).
+        Steps which raise on timeout fail the crawl, they always wait max_timeout_sec instead of the learned timeout.
+        """
+        timeout_sec = max_timeout_sec if raise_on_timeout else self.adaptive_timeouts.timeout(step, max_timeout_sec)
+        start = time.monotonic()
+        try:
+            with span(f"wait.{step}"):
+                result = WebDriverWait(self.driver, timeout_sec, poll_frequency=self.poll_frequency).until(condition)
+            timed_out = False
+        except TimeoutException:
+            result = None
+            timed_out = True
+        wait_sec = time.monotonic() - start
+        self.adaptive_timeouts.observe(step, wait_sec, timed_out)
+        self.records.append(WaitRecord(step=step, wait_sec=wait_sec, timeout_sec=timeout_sec, timed_out=timed_out))
+        if timed_out:
+            logging.warning(f"Readiness step '{step}' timed out after {wait_sec:.2f}s")
+            if raise_on_timeout:
+                raise TimeoutException(f"Readiness step '{step}' timed out after {wait_sec:.2f}s")
+        return result
+
+    def document_ready(self, step: str, max_timeout_sec: float = 15, **kwargs):
+        return self.until(step, lambda driver: driver.execute_script("return document.readyState") == "complete",
+                          max_timeout_sec, **kwargs)
+
+    def element_visible(self, step: str, locator: Locator, max_timeout_sec: float = 10, **kwargs):
+        return self.until(step, EC.visibility_of_element_located(locator), max_timeout_sec, **kwargs)
+
+    def element_clickable(self, step: str, locator: Locator, max_timeout_sec: float = 10, **kwargs):
+        return self.until(step, EC.element_to_be_clickable(locator), max_timeout_sec, **kwargs)
+
+    def element_count_at_least(self, step: str, locator: Locator, count: int = 1, max_timeout_sec: float = 10, **kwargs):
+        def condition(driver):
+            elements = driver.find_elements(*locator)
+            return elements if len(elements) >= count else False
+        return self.until(step, condition, max_timeout_sec, **kwargs)
+
+    def element_count_stable(self, step: str, locator: Locator, stable_sec: float = 0.5, max_timeout_sec: float = 10, **kwargs):
+        """Waits until at least one element matches locator and the number of matches did not change for stable_sec"""
+        state = {"count": -1, "since": time.monotonic()}
+
+        def condition(driver):
+            count = len(driver.find_elements(*locator))
+            now = time.monotonic()
+            if count != state["count"]:
+                state["count"], state["since"] = count, now
+                return False
+            return count > 0 and now - state["since"] >= stable_sec
+        return self.until(step, condition, max_timeout_sec, **kwargs)
+
+    def network_idle(self, step: str, idle_sec: float = 0.5, max_timeout_sec: float = 10, **kwargs):
+        """Waits until the browser did not start loading any new resource for idle_sec"""
+        state = {"count": -1, "since": time.monotonic()}
+
+        def condition(driver):
+            try:
+                count = driver.execute_script(RESOURCE_COUNT_JS)
+            except WebDriverException:
+                return False
+            now = time.monotonic()
+            if count != state["count"]:
+                state["count"], state["since"] = count, now
+                return False
+            return now - state["since"] >= idle_sec
+        return self.until(step, condition, max_timeout_sec, **kwargs)
+
+    def url_contains(self, step: str, url_part: str, max_timeout_sec: float = 10, **kwargs):
+        return self.until(step, EC.url_contains(url_part), max_timeout_sec, **kwargs)
+
+    def total_wait_sec(self) -> float:
+        return sum(record.wait_sec for record in self.records)
+
+    def summary(self) -> str:
+        """One line report of the time spent waiting per step"""
+        steps = ", ".join(f"{record.step}={record.wait_sec:.2f}s{' (timeout)' if record.timed_out else ''}" for record in self.records)
+        return f"waited {self.total_wait_sec():.2f}s: {steps}"
@@ -0,0 +1,64 @@
+""" Crawl profiles, which block resources the crawlers do not need (images, fonts, media, trackers).
+The crawlers only read DOM attributes (e.g. img src) and texts, so blocked resources make page loads faster and drivers smaller.
+Blocking is done with the Chrome DevTools protocol (Network.setBlockedURLs) and can be switched per driver and target page.
+"""
+import os
+import logging
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+from selenium.webdriver.chrome.webdriver import WebDriver
+
+from utils.data_classes import CrawlingTargetPage
+
+BLOCKED_URL_PATTERNS: Dict[str, List[str]] = {
+    "images": ["*.webp", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.avif"],
+    "fonts": ["*.woff", "*.woff2", "*.ttf", "*.otf"],
+    "media": ["*.mp4", "*.webm", "*.mp3"],
+    "trackers": ["*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+                 "*hotjar.com*", "*segment.io*", "*sentry.io*", "*intercom.io*", "*clarity.ms*", "*amplitude.com*"],
+}
+
+
+@dataclass
+class ResourceBlockingProfile:
+    blocked_categories: List[str] = field(default_factory=lambda: list(BLOCKED_URL_PATTERNS.keys()))
+    # patterns of the blocked categories, which must not be blocked for the target page
+    allowlist: List[str] = field(default_factory=list)
+
+    def blocked_url_patterns(self) -> List[str]:
+        return [pattern for category in self.blocked_categories for pattern in BLOCKED_URL_PATTERNS[category]
+                if pattern not in self.allowlist]
+
+
+CRAWL_PROFILES: Dict[CrawlingTargetPage, ResourceBlockingProfile] = {
+    CrawlingTargetPage.OPENART: ResourceBlockingProfile(),
+    # search input and gridcell hover overlay are rendered with svg icons
+    CrawlingTargetPage.MIDJOURNEY: ResourceBlockingProfile(allowlist=["*.svg"]),
+}
+
+
+def is_resource_blocking_enabled() -> bool:
+    """Resource blocking can be disabled with env variable CRAWL_RESOURCE_BLOCKING=0 (e.g. for debugging with a visible browser)"""
+    return os.environ.get("CRAWL_RESOURCE_BLOCKING", "1") == "1"
+
+
+def set_blocked_url_patterns(driver: WebDriver, url_patterns: List[str]):
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": url_patterns})
+    except Exception as e:
+        # blocking is an optimization only, crawling works without it
+        logging.warning(f"Could not set blocked urls: {e}")
+
+
+def apply_crawl_profile(driver: WebDriver, target_page: CrawlingTargetPage):
+    """Blocks all resources, which are not required to crawl target_page"""
+    if not is_resource_blocking_enabled():
+        return
+    set_blocked_url_patterns(driver, CRAWL_PROFILES[CrawlingTargetPage(target_page)].blocked_url_patterns())
+
+
+def clear_crawl_profile(driver: WebDriver):
+    """Loads all resources again (e.g. for logins, which can show captcha images)"""
+    set_blocked_url_patterns(driver, [])
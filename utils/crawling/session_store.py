@@ -0,0 +1,131 @@
+""" Encrypted store of authenticated midjourney sessions (browser cookies), so that a login is only required once per account.
+Every session is encrypted with a key derived from the credentials of the account (and an optional server secret),
+therefore a stored session can only be restored by someone who knows the credentials.
+"""
+import os
+import re
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+
+from typing import Any, Dict, List, Optional
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+from utils.cache import get_cache_dir
+
+KDF_ITERATIONS = 200000
+DERIVED_KEYS_MAX_SIZE = 32
+# cookies of the login, all other cookies (e.g. analytics or bot protection) are short lived and renewed by the page
+AUTH_COOKIE_NAME_REGEX = re.compile(r"auth|session|token", re.IGNORECASE)
+
+
+def account_id(email: str) -> str:
+    return hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()
+
+
+# derived keys are cached by an hmac of the credentials with a random key of the process, so that no password is kept in memory
+_derived_keys: Dict[str, bytes] = {}
+_derived_keys_lock = threading.Lock()
+_derived_keys_hmac_key = os.urandom(32)
+
+
+def derive_key(email: str, password: str, secret: str) -> bytes:
+    """Fernet key derived from the credentials (pbkdf2 is slow by design, therefore derived keys are cached in memory)"""
+    credentials_digest = hmac.new(_derived_keys_hmac_key, json.dumps([account_id(email), password, secret]).encode("utf-8"),
+                                  hashlib.sha256).hexdigest()
+    with _derived_keys_lock:
+        if credentials_digest in _derived_keys:
+            return _derived_keys[credentials_digest]
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=(account_id(email) + secret).encode("utf-8"), iterations=KDF_ITERATIONS)
+    key = base64.urlsafe_b64encode(kdf.derive(password.encode("utf-8")))
+    with _derived_keys_lock:
+        if len(_derived_keys) >= DERIVED_KEYS_MAX_SIZE:
+            del _derived_keys[next(iter(_derived_keys))]
+        _derived_keys[credentials_digest] = key
+    return key
+
+
+def is_auth_cookie(cookie: Dict[str, Any]) -> bool:
+    return AUTH_COOKIE_NAME_REGEX.search(cookie.get("name", "")) is not None
+
+
+def is_cookie_expired(cookie: Dict[str, Any], now: Optional[float] = None) -> bool:
+    """Whether the cookie has an expiry date, which is passed (session cookies without expiry never expire here)"""
+    return cookie.get("expiry") is not None and cookie["expiry"] <= (now or time.time())
+
+
+def is_expired(cookies: List[Dict[str, Any]], now: Optional[float] = None) -> bool:
+    """Whether any auth cookie is expired. Other cookies do not tell whether the login is still valid."""
+    return any(is_auth_cookie(cookie) and is_cookie_expired(cookie, now) for cookie in cookies)
+
+
+def remove_expired_cookies(cookies: List[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Cookies without the expired ones, which a browser would not accept"""
+    return [cookie for cookie in cookies if not is_cookie_expired(cookie, now)]
+
+
+class MidjourneySessionStore:
+    def __init__(self, directory: str, secret: str = ""):
+        self.directory = directory
+        self.secret = secret
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, email: str) -> str:
+        return os.path.join(self.directory, f"{account_id(email)}.session")
+
+    def save(self, email: str, password: str, cookies: List[Dict[str, Any]]):
+        token = Fernet(derive_key(email, password, self.secret)).encrypt(json.dumps(cookies).encode("utf-8"))
+        path = self._path(email)
+        with self._lock:
+            # write and rename, so that a concurrent load never reads a partial file
+            with open(path + ".tmp", "wb") as f:
+                f.write(token)
+            os.chmod(path + ".tmp", 0o600)
+            os.replace(path + ".tmp", path)
+
+    def load(self, email: str, password: str) -> Optional[List[Dict[str, Any]]]:
+        """ Returns the stored, not expired cookies of the account or None, if no session is stored or its login expired.
+        Whether the returned session is still valid, can only be checked by the target page.
+        """
+        path = self._path(email)
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            with open(path, "rb") as f:
+                token = f.read()
+        try:
+            cookies = json.loads(Fernet(derive_key(email, password, self.secret)).decrypt(token))
+        except InvalidToken:
+            # wrong credentials or changed server secret
+            logging.warning("Stored midjourney session could not be decrypted")
+            return None
+        if is_expired(cookies):
+            self.delete(email)
+            return None
+        return remove_expired_cookies(cookies)
+
+    def delete(self, email: str):
+        with self._lock:
+            if os.path.exists(self._path(email)):
+                os.remove(self._path(email))
+
+
+_session_store: Optional[MidjourneySessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> MidjourneySessionStore:
+    """Returns the process wide session store. Sessions are additionally encrypted with env variable SESSION_STORE_SECRET."""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            _session_store = MidjourneySessionStore(os.path.join(get_cache_dir(), "midjourney_sessions"),
+                                                    secret=os.environ.get("SESSION_STORE_SECRET", ""))
+        return _session_store
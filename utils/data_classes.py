@@ -1,24 +1,156 @@
-from utils.selenium_fns import SeleniumBrowser
+import re
+from collections import Counter
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Set, Union
 from enum import Enum
 
 class CrawlingTargetPage(str, Enum):
     MIDJOURNEY = "midjourney.com"
     OPENART = "openart.ai"
 
-@dataclass
+class CrawlingBackend(str, Enum):
+    SELENIUM = "selenium"  # full browser, works for all target pages
+    HTTP = "http"  # plain http requests, only openart.ai search results
+    CORPUS = "corpus"  # search in the local prompt corpus of all previous crawls, no crawling at all
+
+@dataclass(slots=True)
 class MidjourneyImage:
     image_url: str
     prompt: str
+    search_term: Optional[str] = None  # search term which found the image (set by multi term crawls)
+
+MIDJOURNEY_SIZE_SUFFIX_REGEX = re.compile(r"_\d+_N\.webp$")
+NON_WORD_REGEX = re.compile(r"[^\w]+")
+
+def normalize_image_url(image_url: str) -> str:
+    """ Normalized image url, which is equal for all sizes of the same image.
+    Removes query/fragment and the midjourney size suffix (e.g. _32_N.webp and _640_N.webp).
+    """
+    image_url = image_url.split("#")[0].split("?")[0].strip()
+    return MIDJOURNEY_SIZE_SUFFIX_REGEX.sub("_N.webp", image_url)
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase prompt without punctuation and redundant whitespaces"""
+    return " ".join(NON_WORD_REGEX.sub(" ", prompt.lower()).split())
+
+
+class MidjourneyImageCollection:
+    """ List like collection of unique midjourney images in insertion order.
+    Holds a hash index on the normalized image url (and optionally on the normalized prompt),
+    so that checking for duplicates is O(1) instead of scanning the whole list.
+    The index only stores the 64 bit hashes of the normalized values, not copies of the (long) normalized strings.
+    Normalizing prompts is comparatively expensive, therefore the prompt index is only built when it is needed.
+    """
+
+    def __init__(self, midjourney_images: Optional[Iterable[MidjourneyImage]] = None, dedupe_prompts=False):
+        self.dedupe_prompts = dedupe_prompts
+        self._midjourney_images: List[MidjourneyImage] = []
+        self._image_urls: Set[int] = set()
+        self._prompts: Optional[Set[int]] = set() if dedupe_prompts else None
+        if midjourney_images:
+            self.extend(midjourney_images)
+
+    def contains_image_url(self, image_url: str) -> bool:
+        return hash(normalize_image_url(image_url)) in self._image_urls
+
+    def contains_prompt(self, prompt: str) -> bool:
+        if self._prompts is None:
+            self._prompts = {hash(normalize_prompt(midjourney_image.prompt)) for midjourney_image in self._midjourney_images}
+        return hash(normalize_prompt(prompt)) in self._prompts
+
+    def is_duplicate(self, midjourney_image: MidjourneyImage) -> bool:
+        if self.contains_image_url(midjourney_image.image_url):
+            return True
+        return self.dedupe_prompts and self.contains_prompt(midjourney_image.prompt)
+
+    def add(self, midjourney_image: MidjourneyImage) -> bool:
+        """Appends midjourney_image if it is not a duplicate. Returns whether it was added."""
+        image_url_hash = hash(normalize_image_url(midjourney_image.image_url))
+        if image_url_hash in self._image_urls:
+            return False
+        prompt_hash = hash(normalize_prompt(midjourney_image.prompt)) if self._prompts is not None else None
+        if self.dedupe_prompts and prompt_hash in self._prompts:
+            return False
+        self._midjourney_images.append(midjourney_image)
+        self._image_urls.add(image_url_hash)
+        if self._prompts is not None:
+            self._prompts.add(prompt_hash)
+        return True
+
+    def extend(self, midjourney_images: Iterable[MidjourneyImage]) -> int:
+        """Adds all not duplicated images. Returns number of added images."""
+        return sum(self.add(midjourney_image) for midjourney_image in midjourney_images)
+
+    def __len__(self) -> int:
+        return len(self._midjourney_images)
+
+    def __iter__(self) -> Iterator[MidjourneyImage]:
+        return iter(self._midjourney_images)
+
+    def __getitem__(self, index: Union[int, slice]):
+        return self._midjourney_images[index]
+
+    def __contains__(self, midjourney_image: MidjourneyImage) -> bool:
+        return self.contains_image_url(midjourney_image.image_url)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MidjourneyImageCollection):
+            return self._midjourney_images == other._midjourney_images
+        return self._midjourney_images == other
+
+    def __repr__(self) -> str:
+        return f"MidjourneyImageCollection({self._midjourney_images!r})"
 
 @dataclass
 class CrawlingRequest:
     search_term: str
+    backend: CrawlingBackend = CrawlingBackend.SELENIUM
 
 @dataclass
 class CrawlingData:
-    midjourney_images: List[MidjourneyImage] = field(default_factory=list)  # crawled midjourney images
+    midjourney_images: MidjourneyImageCollection = field(default_factory=MidjourneyImageCollection)  # crawled midjourney images
+
+    def __post_init__(self):
+        if not isinstance(self.midjourney_images, MidjourneyImageCollection):
+            self.midjourney_images = MidjourneyImageCollection(self.midjourney_images)
+
+    def extend(self, crawling_data: "CrawlingData") -> int:
+        """Merges other crawling results into this one. Returns number of new images."""
+        return self.midjourney_images.extend(crawling_data.midjourney_images)
+
+class CrawlErrorKind(str, Enum):
+    TIMEOUT = "timeout"  # page load, script or readiness step took longer than its timeout
+    DRIVER_CRASH = "driver_crash"  # browser does not respond anymore
+    PAGE_ERROR = "page_error"  # any other failure of an attempt (e.g. changed page layout)
+    EXTRACTION = "extraction"  # single card or gridcell, which could not be extracted (attempt goes on)
+    CIRCUIT_OPEN = "circuit_open"  # attempt was not started, because the target page failed too often
+
+@dataclass
+class CrawlReport:
+    """Outcome of one crawl. A crawl is partial, if it did not complete, but returned images anyway."""
+    attempts: int = 0
+    image_count: int = 0
+    completed: bool = False
+    errors: Counter = field(default_factory=Counter)
+    last_error: Optional[str] = None
+
+    @property
+    def partial(self) -> bool:
+        return not self.completed and self.image_count > 0
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    def record(self, kind: CrawlErrorKind, error: Optional[BaseException] = None):
+        self.errors[CrawlErrorKind(kind).value] += 1
+        if error is not None:
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def summary(self) -> str:
+        errors = ", ".join(f"{count} {kind}" for kind, count in self.errors.most_common()) or "no errors"
+        status = "completed" if self.completed else ("partial" if self.partial else "failed")
+        return f"{status} after {self.attempts} attempts with {self.image_count} images ({errors})"
 
 @dataclass
 class Status:
@@ -29,7 +161,8 @@ class Status:
 @dataclass
 class SessionState:
     crawling_request: CrawlingRequest
-    browser: SeleniumBrowser
     crawling_data: CrawlingData
     status: Status
-    session_id: str
\ No newline at end of file
+    session_id: str
+    midjourney_cookies: List[Dict[str, Any]] = field(default_factory=list)  # cookies of authenticated midjourney user
+    midjourney_account: str = ""  # account_id of the authenticated midjourney user, crawl results are cached per account
\ No newline at end of file
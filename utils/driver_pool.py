@@ -0,0 +1,262 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from utils.selenium_fns import SeleniumBrowser
+from utils.session import is_debug
+from utils.tracing import traced
+
+
+@dataclass
+class PooledBrowser:
+    browser: SeleniumBrowser
+    created_at: float = field(default_factory=time.monotonic)
+    last_used_at: float = field(default_factory=time.monotonic)
+    lease_count: int = 0
+
+
+@dataclass
+class DriverPoolStats:
+    size: int  # number of living drivers (idle + leased)
+    leased: int
+    idle: int
+    max_size: int
+    leases_total: int
+    wait_time_total_sec: float
+    wait_time_max_sec: float
+    evicted_total: int
+    recycled_total: int  # evicted on release, because they crashed or exceeded the memory limit
+
+    @property
+    def wait_time_avg_sec(self) -> float:
+        return self.wait_time_total_sec / self.leases_total if self.leases_total else 0.0
+
+
+class DriverPool:
+    """ Process wide pool of pre-warmed selenium drivers.
+    Drivers are leased for one crawl and reset (cookies, storage, current page) before they are leased again.
+    Drivers which are idle for too long, have been leased too often or do not respond anymore are evicted.
+    Drivers which crashed during a lease or leak memory (browser RSS above max_rss_mb) are recycled on release.
+    """
+
+    def __init__(self, max_size=2, min_idle=1, headless=True, idle_timeout_sec=600, max_leases_per_driver=50, max_rss_mb: Optional[float] = None):
+        self.max_size = max_size
+        self.min_idle = min(min_idle, max_size)
+        self.headless = headless
+        self.idle_timeout_sec = idle_timeout_sec
+        self.max_leases_per_driver = max_leases_per_driver
+        self.max_rss_mb = max_rss_mb
+
+        self._idle: List[PooledBrowser] = []
+        self._leased: List[PooledBrowser] = []
+        self._creating = 0
+        self._condition = threading.Condition()
+
+        # metrics
+        self._leases_total = 0
+        self._wait_time_total_sec = 0.0
+        self._wait_time_max_sec = 0.0
+        self._evicted_total = 0
+        self._recycled_total = 0
+
+    @traced("driver_pool.create_driver")
+    def _create_browser(self) -> PooledBrowser:
+        browser = SeleniumBrowser()
+        # every driver needs its own user data dir, otherwise chrome instances block each other
+        browser.setup(headless=self.headless, data_dir_path=tempfile.mkdtemp(prefix="selenium-pool-"))
+        return PooledBrowser(browser=browser)
+
+    def _destroy_browser(self, pooled_browser: PooledBrowser):
+        browser = pooled_browser.browser
+        try:
+            browser.quit_driver()
+        except Exception as e:
+            logging.warning(f"Could not quit pooled driver: {e}")
+        if browser.data_dir_path:
+            shutil.rmtree(browser.data_dir_path, ignore_errors=True)
+
+    def _is_expired(self, pooled_browser: PooledBrowser) -> bool:
+        idle_sec = time.monotonic() - pooled_browser.last_used_at
+        return idle_sec > self.idle_timeout_sec or pooled_browser.lease_count >= self.max_leases_per_driver
+
+    def warm_up(self):
+        """Starts drivers until at least min_idle drivers are idle"""
+        while True:
+            with self._condition:
+                size = len(self._idle) + len(self._leased) + self._creating
+                if len(self._idle) + self._creating >= self.min_idle or size >= self.max_size:
+                    return
+                self._creating += 1
+            self._add_new_browser()
+
+    def _add_new_browser(self):
+        """Creates a driver outside of the lock and adds it to the idle list"""
+        pooled_browser = None
+        try:
+            pooled_browser = self._create_browser()
+        finally:
+            with self._condition:
+                self._creating -= 1
+                if pooled_browser:
+                    self._idle.append(pooled_browser)
+                self._condition.notify_all()
+
+    @traced("driver_pool.acquire")
+    def _acquire(self, timeout: Optional[float]) -> PooledBrowser:
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        while True:
+            create_new = False
+            with self._condition:
+                while True:
+                    if self._idle:
+                        # LIFO keeps the most recently used (warm) drivers busy and lets the others idle out
+                        pooled_browser = self._idle.pop()
+                        break
+                    if len(self._leased) + self._creating < self.max_size:
+                        self._creating += 1
+                        create_new = True
+                        pooled_browser = None
+                        break
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"No selenium driver available after {timeout} seconds")
+                    self._condition.wait(remaining)
+            if create_new:
+                self._add_new_browser()
+                continue
+            if self._is_expired(pooled_browser) or not pooled_browser.browser.is_alive():
+                self._evict(pooled_browser)
+                continue
+            break
+
+        wait_time_sec = time.monotonic() - start
+        with self._condition:
+            pooled_browser.lease_count += 1
+            self._leased.append(pooled_browser)
+            self._leases_total += 1
+            self._wait_time_total_sec += wait_time_sec
+            self._wait_time_max_sec = max(self._wait_time_max_sec, wait_time_sec)
+        return pooled_browser
+
+    def _exceeds_memory_limit(self, pooled_browser: PooledBrowser) -> bool:
+        if not self.max_rss_mb:
+            return False
+        rss_mb = pooled_browser.browser.rss_mb()
+        if rss_mb is not None and rss_mb > self.max_rss_mb:
+            logging.warning(f"Recycle pooled driver, which uses {rss_mb:.0f}MB (limit {self.max_rss_mb:.0f}MB)")
+            return True
+        return False
+
+    def _release(self, pooled_browser: PooledBrowser, healthy: bool):
+        with self._condition:
+            self._leased.remove(pooled_browser)
+        pooled_browser.last_used_at = time.monotonic()
+        healthy = healthy and not self._exceeds_memory_limit(pooled_browser)
+        if not healthy:
+            with self._condition:
+                self._recycled_total += 1
+        else:
+            try:
+                pooled_browser.browser.clear_session()
+            except Exception as e:
+                logging.warning(f"Could not reset pooled driver: {e}")
+                healthy = False
+        with self._condition:
+            # pool might be shut down in the meantime
+            keep = healthy and len(self._idle) + len(self._leased) < self.max_size
+            if keep:
+                self._idle.append(pooled_browser)
+                self._condition.notify_all()
+        if not keep:
+            self._evict(pooled_browser)
+
+    def _evict(self, pooled_browser: PooledBrowser):
+        self._destroy_browser(pooled_browser)
+        with self._condition:
+            self._evicted_total += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = 60):
+        """ Context manager which provides a SeleniumBrowser for exclusive usage.
+        If the block raises an exception, the driver is only reused if it still responds.
+        """
+        pooled_browser = self._acquire(timeout)
+        healthy = True
+        try:
+            yield pooled_browser.browser
+        except Exception:
+            healthy = pooled_browser.browser.is_alive()
+            raise
+        finally:
+            self._release(pooled_browser, healthy)
+
+    def evict_idle(self):
+        """Quits all idle drivers which exceeded their idle time or lease limit"""
+        with self._condition:
+            expired = [pooled_browser for pooled_browser in self._idle if self._is_expired(pooled_browser)]
+            self._idle = [pooled_browser for pooled_browser in self._idle if pooled_browser not in expired]
+        for pooled_browser in expired:
+            self._evict(pooled_browser)
+
+    def maintain(self, interval_sec=60):
+        """Blocking loop which evicts expired idle drivers and keeps min_idle drivers warm"""
+        while self.max_size > 0:
+            try:
+                self.evict_idle()
+                self.warm_up()
+            except Exception as e:
+                logging.warning(f"Driver pool maintenance failed: {e}")
+            time.sleep(interval_sec)
+
+    def shutdown(self):
+        """Quits all idle drivers. Leased drivers are quit on release."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self.max_size = 0
+        for pooled_browser in idle:
+            self._destroy_browser(pooled_browser)
+
+    def stats(self) -> DriverPoolStats:
+        with self._condition:
+            return DriverPoolStats(size=len(self._idle) + len(self._leased), leased=len(self._leased),
+                                   idle=len(self._idle), max_size=self.max_size, leases_total=self._leases_total,
+                                   wait_time_total_sec=self._wait_time_total_sec,
+                                   wait_time_max_sec=self._wait_time_max_sec, evicted_total=self._evicted_total,
+                                   recycled_total=self._recycled_total)
+
+
+_driver_pool: Optional[DriverPool] = None
+_driver_pool_lock = threading.Lock()
+
+
+def get_driver_pool() -> DriverPool:
+    """ Returns the process wide driver pool.
+    Configurable via env variables DRIVER_POOL_SIZE, DRIVER_POOL_MIN_IDLE and DRIVER_MAX_RSS_MB (0 disables the memory limit).
+    """
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            _driver_pool = DriverPool(max_size=int(os.environ.get("DRIVER_POOL_SIZE", 2)),
+                                      min_idle=int(os.environ.get("DRIVER_POOL_MIN_IDLE", 1)),
+                                      headless=not is_debug(),
+                                      max_rss_mb=float(os.environ.get("DRIVER_MAX_RSS_MB", 1500)))
+            # start idle drivers in background, so that the first crawl does not pay chrome cold start
+            threading.Thread(target=_driver_pool.maintain, daemon=True).start()
+        return _driver_pool
+
+
+def shutdown_driver_pool():
+    """Quits the drivers of the process wide driver pool, if it was started (e.g. at the end of a command line run)"""
+    with _driver_pool_lock:
+        driver_pool = _driver_pool
+    if driver_pool is not None:
+        driver_pool.shutdown()
@@ -0,0 +1,168 @@
+""" Automatic selection of few shot examples, which are relevant for the prompt generation input and diverse among each other.
+Prompts are embedded offline with a hashing vectorizer (words and word bigrams), so no embedding model is required.
+"""
+import os
+import re
+import json
+import zlib
+import threading
+
+import numpy as np
+from typing import Iterable, List, Optional
+
+from utils.cache import get_cache_dir
+from utils.prompt_corpus import PromptCorpus, get_prompt_corpus
+from utils.data_classes import MidjourneyImage
+
+WORD_REGEX = re.compile(r"\w+", re.UNICODE)
+# collisions of the hashing vectorizer blur the similarity of unrelated prompts, they get rare with 2^12 and more features
+DEFAULT_N_FEATURES = 2 ** 12
+# number of candidates per selected example, MMR is only computed on the most relevant candidates
+MMR_CANDIDATE_FACTOR = 20
+
+
+def hash_embed(texts: Iterable[str], n_features: int = DEFAULT_N_FEATURES) -> np.ndarray:
+    """ Returns the l2 normalized hashed bag of words and word bigrams of every text (float32 matrix with one row per text).
+    crc32 is used as hash function, as it is stable between processes (unlike python's hash).
+    """
+    texts = list(texts)
+    embeddings = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = WORD_REGEX.findall(text.lower())
+        for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            token_hash = zlib.crc32(token.encode("utf-8"))
+            # sign of the hash reduces the bias of hash collisions
+            embeddings[row, token_hash % n_features] += 1.0 if token_hash & 0x80000000 else -1.0
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+    return embeddings
+
+
+def mmr_select(embeddings: np.ndarray, query_embedding: np.ndarray, k: int, diversity: float = 0.3) -> List[int]:
+    """ Maximal marginal relevance: greedily selects k rows, which are similar to the query, but not to the already selected rows.
+    diversity=0 ranks by relevance only. Returns the selected row indices.
+    """
+    if len(embeddings) == 0 or k <= 0:
+        return []
+    relevance = embeddings @ query_embedding
+    candidate_count = min(len(relevance), k * MMR_CANDIDATE_FACTOR)
+    # sorted candidates read a memory mapped matrix sequentially
+    candidates = np.sort(np.argpartition(-relevance, candidate_count - 1)[:candidate_count])
+    candidate_embeddings = np.asarray(embeddings[candidates])
+    candidate_relevance = relevance[candidates]
+    similarities = candidate_embeddings @ candidate_embeddings.T
+    max_similarity_to_selected = np.full(len(candidates), -np.inf, dtype=np.float32)
+    selected: List[int] = []
+    for _ in range(min(k, len(candidates))):
+        redundancy = np.where(np.isinf(max_similarity_to_selected), 0.0, max_similarity_to_selected)
+        scores = (1 - diversity) * candidate_relevance - diversity * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(max_similarity_to_selected, similarities[:, best], out=max_similarity_to_selected)
+    return [int(candidates[i]) for i in selected]
+
+
+def select_few_shot_examples(midjourney_images: List[MidjourneyImage], text: str, k: int = 5, diversity: float = 0.3) -> List[int]:
+    """Returns the indices of the k most relevant and diverse midjourney images for text"""
+    embeddings = hash_embed(img.prompt for img in midjourney_images)
+    return mmr_select(embeddings, hash_embed([text])[0], k, diversity)
+
+
+class PromptEmbeddingIndex:
+    """ Append only embedding matrix of the prompt corpus.
+    Embeddings (float32) and corpus ids (int64) are stored in flat files and memory mapped,
+    so that the matrix does not need to fit into memory and is extended incrementally.
+    If n_features changed since the files were written, the index is rebuilt by the next sync.
+    """
+
+    def __init__(self, directory: str, n_features: int = DEFAULT_N_FEATURES):
+        self.n_features = n_features
+        self.embeddings_path = os.path.join(directory, "prompt_embeddings.f32")
+        self.ids_path = os.path.join(directory, "prompt_embeddings.ids")
+        self.meta_path = os.path.join(directory, "prompt_embeddings.json")
+        self._lock = threading.Lock()
+        self._embeddings: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._reset_if_incompatible()
+        self._map()
+
+    def _reset_if_incompatible(self):
+        """Removes embeddings with another number of features, sync embeds the whole corpus again"""
+        meta = {"n_features": self.n_features}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                if json.load(f) == meta:
+                    return
+        for path in (self.ids_path, self.embeddings_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _map(self):
+        row_count = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        if row_count == 0:
+            self._embeddings = np.zeros((0, self.n_features), dtype=np.float32)
+            self._ids = np.zeros(0, dtype=np.int64)
+            return
+        # ids are written after the embeddings, therefore row_count rows of embeddings exist
+        self._embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(row_count, self.n_features))
+        self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(row_count,))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def last_id(self) -> int:
+        return int(self._ids[-1]) if len(self._ids) else 0
+
+    def add(self, ids: List[int], prompts: List[str]):
+        embeddings = hash_embed(prompts, self.n_features)
+        with self._lock:
+            with open(self.embeddings_path, "r+b" if os.path.exists(self.embeddings_path) else "wb") as embeddings_file:
+                # drop rows of an interrupted write, which have no id
+                embeddings_file.truncate(len(self._ids) * self.n_features * 4)
+                embeddings_file.seek(0, os.SEEK_END)
+                embeddings_file.write(embeddings.tobytes())
+            with open(self.ids_path, "ab") as ids_file:
+                ids_file.write(np.asarray(ids, dtype=np.int64).tobytes())
+            self._map()
+
+    def sync(self, prompt_corpus: PromptCorpus, batch_size: int = 10000) -> int:
+        """Embeds all prompts which were added to the corpus since the last sync. Returns the number of new embeddings."""
+        added = 0
+        while True:
+            rows = prompt_corpus.get_prompts_after(self.last_id, limit=batch_size)
+            if not rows:
+                return added
+            self.add([row_id for row_id, _, _ in rows], [prompt for _, _, prompt in rows])
+            added += len(rows)
+
+    def select(self, text: str, k: int = 5, diversity: float = 0.3) -> List[int]:
+        """Returns the corpus ids of the k most relevant and diverse prompts for text"""
+        with self._lock:
+            embeddings, ids = self._embeddings, self._ids
+        return [int(ids[row]) for row in mmr_select(embeddings, hash_embed([text], self.n_features)[0], k, diversity)]
+
+
+def select_few_shot_examples_from_corpus(text: str, k: int = 5, diversity: float = 0.3) -> List[MidjourneyImage]:
+    """Returns the k most relevant and diverse midjourney images of the whole prompt corpus for text"""
+    return get_prompt_corpus().get_by_ids(get_prompt_embedding_index().select(text, k, diversity))
+
+
+_prompt_embedding_index: Optional[PromptEmbeddingIndex] = None
+_prompt_embedding_index_lock = threading.Lock()
+
+
+def get_prompt_embedding_index() -> PromptEmbeddingIndex:
+    """ Returns the process wide embedding index of the prompt corpus (synced with the corpus on every call).
+    Number of features is configurable via env variable PROMPT_EMBEDDING_FEATURES.
+    """
+    global _prompt_embedding_index
+    with _prompt_embedding_index_lock:
+        if _prompt_embedding_index is None:
+            _prompt_embedding_index = PromptEmbeddingIndex(get_cache_dir(),
+                                                           n_features=int(os.environ.get("PROMPT_EMBEDDING_FEATURES", DEFAULT_N_FEATURES)))
+        _prompt_embedding_index.sync(get_prompt_corpus())
+        return _prompt_embedding_index
@@ -0,0 +1,54 @@
+import os
+import json
+import hashlib
+import threading
+
+from typing import List, Optional
+
+from llm_few_shot_gen.models.output import ImagePromptOutputModel
+from utils.cache import SqliteLRUCache, CacheStats, get_cache_dir
+
+
+def generation_cache_key(few_shot_prompts: List[str], text: str, model_name: str, temperature: float) -> str:
+    """ Cache key of a prompt generation. Few shot prompts are sorted, as their order is not relevant for the user."""
+    key_parts = [sorted(few_shot_prompts), text.strip(), model_name, round(float(temperature), 4)]
+    return hashlib.sha1(json.dumps(key_parts).encode("utf-8")).hexdigest()
+
+
+def is_deterministic_temperature(temperature: float) -> bool:
+    return temperature <= 0
+
+
+class GenerationCache:
+    """ Persistent LRU cache of llm generations.
+    Results are stored as json of the ImagePromptOutputModel.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 2000, ttl_sec: Optional[float] = None):
+        self._cache = SqliteLRUCache(db_path, max_entries=max_entries, ttl_sec=ttl_sec)
+
+    def get(self, few_shot_prompts: List[str], text: str, model_name: str, temperature: float) -> Optional[ImagePromptOutputModel]:
+        value = self._cache.get(generation_cache_key(few_shot_prompts, text, model_name, temperature))
+        if value is None:
+            return None
+        return ImagePromptOutputModel.parse_raw(value)
+
+    def set(self, few_shot_prompts: List[str], text: str, model_name: str, temperature: float, llm_output: ImagePromptOutputModel):
+        self._cache.set(generation_cache_key(few_shot_prompts, text, model_name, temperature), llm_output.json().encode("utf-8"))
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+
+_generation_cache: Optional[GenerationCache] = None
+_generation_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """Returns the process wide generation cache. Size is configurable via env variable GENERATION_CACHE_MAX_ENTRIES."""
+    global _generation_cache
+    with _generation_cache_lock:
+        if _generation_cache is None:
+            _generation_cache = GenerationCache(os.path.join(get_cache_dir(), "generation_cache.sqlite"),
+                                                max_entries=int(os.environ.get("GENERATION_CACHE_MAX_ENTRIES", 2000)))
+        return _generation_cache
@@ -0,0 +1,138 @@
+import os
+import logging
+import threading
+
+import requests
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import List, Optional
+from PIL import Image
+
+from utils.cache import SqliteLRUCache, get_cache_dir
+
+REQUEST_TIMEOUT_SEC = 10
+
+
+@dataclass
+class ImageServiceStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    fetches: int = 0
+    fetch_errors: int = 0
+    fetched_bytes: int = 0
+    memory_bytes: int = 0
+
+
+class MemoryLRUCache:
+    """Thread safe in memory LRU cache of bytes, bounded by the sum of all value sizes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self.size_bytes += len(value)
+            while self.size_bytes > self.max_bytes and self._entries:
+                _, evicted_value = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted_value)
+
+
+def create_thumbnail(image_bytes: bytes, width: int) -> bytes:
+    """Downscales image to width (keeping aspect ratio) and encodes it as webp"""
+    with Image.open(BytesIO(image_bytes)) as image:
+        # lets the jpeg decoder downscale while decoding (no-op for other formats)
+        image.draft("RGB", (width, width * 4))
+        image.thumbnail((width, width * 4))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        thumbnail = BytesIO()
+        # method 0 is the fastest webp encoder with only slightly larger files
+        image.save(thumbnail, format="WEBP", quality=80, method=0)
+        return thumbnail.getvalue()
+
+
+class ImageService:
+    """ Fetches images concurrently with a pooled http session and returns downscaled thumbnails.
+    Thumbnails are cached in memory and on disk (both size bounded LRU caches) keyed by url and width.
+    """
+
+    def __init__(self, disk_cache: Optional[SqliteLRUCache] = None, memory_max_bytes: int = 64 * 1024 * 1024, max_workers: int = 8):
+        self.disk_cache = disk_cache
+        self.memory_cache = MemoryLRUCache(memory_max_bytes)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._stats = ImageServiceStats()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, increment in increments.items():
+                setattr(self._stats, name, getattr(self._stats, name) + increment)
+
+    def get_thumbnail(self, image_url: str, width: int) -> Optional[bytes]:
+        """Returns the thumbnail of image_url or None, if the image could not be fetched"""
+        key = f"{width}:{image_url}"
+        thumbnail = self.memory_cache.get(key)
+        if thumbnail is not None:
+            self._count(memory_hits=1)
+            return thumbnail
+        thumbnail = self.disk_cache.get(key) if self.disk_cache else None
+        if thumbnail is not None:
+            self._count(disk_hits=1)
+        else:
+            try:
+                response = self._session.get(image_url, timeout=REQUEST_TIMEOUT_SEC)
+                response.raise_for_status()
+                self._count(fetches=1, fetched_bytes=len(response.content))
+                thumbnail = create_thumbnail(response.content, width)
+            except Exception as e:
+                logging.warning(f"Could not fetch image {image_url}: {e}")
+                self._count(fetch_errors=1)
+                return None
+            if self.disk_cache:
+                self.disk_cache.set(key, thumbnail)
+        self.memory_cache.set(key, thumbnail)
+        return thumbnail
+
+    def get_thumbnails(self, image_urls: List[str], width: int) -> List[Optional[bytes]]:
+        """Fetches all thumbnails concurrently (bounded by max_workers). Result has the same order as image_urls."""
+        return list(self._executor.map(lambda image_url: self.get_thumbnail(image_url, width), image_urls))
+
+    def stats(self) -> ImageServiceStats:
+        with self._stats_lock:
+            return ImageServiceStats(**{**vars(self._stats), "memory_bytes": self.memory_cache.size_bytes})
+
+
+_image_service: Optional[ImageService] = None
+_image_service_lock = threading.Lock()
+
+
+def get_image_service() -> ImageService:
+    """Returns the process wide image service. Disk cache size is configurable via env variable IMAGE_CACHE_MAX_MB."""
+    global _image_service
+    with _image_service_lock:
+        if _image_service is None:
+            disk_cache = SqliteLRUCache(os.path.join(get_cache_dir(), "image_cache.sqlite"), max_entries=100000,
+                                        max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_MB", 512)) * 1024 * 1024)
+            _image_service = ImageService(disk_cache=disk_cache)
+        return _image_service
@@ -0,0 +1,16 @@
+""" Functions, whose modules are imported on their first call.
+Used for entry points of subsystems with expensive imports (selenium, langchain), so that importing the app stays cheap.
+"""
+import importlib
+
+from typing import Callable
+
+
+def lazy_function(module_name: str, function_name: str) -> Callable:
+    """Returns a function, which imports module_name on its first call and calls its function function_name"""
+    def wrapper(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    wrapper.__name__ = wrapper.__qualname__ = function_name
+    wrapper.__module__ = module_name
+    wrapper.__doc__ = f"{module_name}.{function_name} (imported on first call)"
+    return wrapper
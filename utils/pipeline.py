@@ -0,0 +1,308 @@
+""" Headless crawl and generate pipeline, which runs without streamlit (e.g. to precompute prompts overnight).
+Every input item is a search term and a text to generate prompts for. Every search term is crawled once (with the crawlers
+and caches of the app), few shot examples are selected per text from the crawled images and prompts are generated concurrently.
+Results are appended to a JSONL file as soon as they are generated. A rerun with the same output file skips all items,
+which were generated before (checkpoint/resume), failed items are retried.
+
+Input files are JSONL ({"search_term": ..., "text": ...} or {"search_term": ..., "texts": [...]} per line, optional
+"target_page" and "id") or text files with one tab separated search term and text per line.
+
+Run: python -m utils.pipeline inputs.jsonl results.jsonl [--target-page openart.ai] [--backend selenium] [--generation-concurrency 8]
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils.crawling import crawl_openartai_search, crawl_midjourney_search, login_to_midjourney_with_credentials, shutdown_driver_pool
+from utils.crawling.session_store import account_id
+from utils.data_classes import CrawlingBackend, CrawlingData, CrawlingTargetPage, CrawlReport
+from utils.few_shot_selection import hash_embed, mmr_select, select_few_shot_examples_from_corpus
+from utils.prompt_generation import DEFAULT_MODEL_NAME, create_llm, generate_midjourney_prompts_batch
+
+if TYPE_CHECKING:
+    from langchain.base_language import BaseLanguageModel
+
+
+def pipeline_item_id(target_page: CrawlingTargetPage, search_term: str, text: str) -> str:
+    """Stable id of an input item, so that results can be matched with inputs, even if the input file is reordered"""
+    key = json.dumps([CrawlingTargetPage(target_page).value, " ".join(search_term.lower().split()), text.strip()])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class PipelineItem:
+    search_term: str
+    text: str
+    target_page: CrawlingTargetPage = CrawlingTargetPage.OPENART
+    item_id: str = ""
+
+    def __post_init__(self):
+        self.target_page = CrawlingTargetPage(self.target_page)
+        if not self.item_id:
+            self.item_id = pipeline_item_id(self.target_page, self.search_term, self.text)
+
+    @property
+    def crawl_key(self) -> Tuple[CrawlingTargetPage, str]:
+        return self.target_page, " ".join(self.search_term.lower().split())
+
+
+@dataclass
+class PipelineConfig:
+    backend: CrawlingBackend = CrawlingBackend.SELENIUM
+    force_refresh: bool = False
+    # at most as many parallel crawls as the driver pool has drivers
+    crawl_concurrency: int = 2
+    generation_concurrency: int = 4
+    few_shot_count: int = 5
+    few_shot_diversity: float = 0.3
+    temperature: float = 0.7
+    model_name: str = DEFAULT_MODEL_NAME
+    use_generation_cache: Optional[bool] = None
+    midjourney_cookies: List[Dict[str, Any]] = field(default_factory=list)
+    midjourney_account: str = ""  # account_id of the user of midjourney_cookies
+
+
+@dataclass
+class PipelineStats:
+    items: int = 0
+    skipped: int = 0  # generated by a previous run
+    generated: int = 0
+    failed: int = 0
+    crawls: int = 0
+    partial_crawls: int = 0
+    duration_sec: float = 0.0
+
+    @property
+    def items_per_sec(self) -> float:
+        return self.generated / self.duration_sec if self.duration_sec else 0.0
+
+
+def read_pipeline_items(path: str, target_page: CrawlingTargetPage = CrawlingTargetPage.OPENART) -> Iterator[PipelineItem]:
+    """Reads the input items of a JSONL or tab separated text file. Items without target page are crawled on target_page."""
+    is_jsonl = path.endswith(".jsonl") or path.endswith(".json")
+    with open(path, encoding="utf-8") as f:
+        for line_nr, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if not is_jsonl:
+                if "\t" not in line:
+                    logging.warning(f"Skip line {line_nr} of {path}, it has no tab between search term and text")
+                    continue
+                search_term, text = line.split("\t", 1)
+                yield PipelineItem(search_term.strip(), text.strip(), target_page)
+                continue
+            row = json.loads(line)
+            texts = row["texts"] if "texts" in row else [row["text"]]
+            for i, text in enumerate(texts):
+                item_id = row.get("id", "")
+                if item_id and len(texts) > 1:
+                    item_id = f"{item_id}-{i}"
+                yield PipelineItem(row["search_term"], text, row.get("target_page", target_page), item_id=str(item_id))
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """Ids of all items, which were generated successfully by a previous run. A truncated last line (crashed run) is ignored."""
+    done_ids = set()
+    if not os.path.exists(output_path):
+        return done_ids
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if result.get("error") is None:
+                done_ids.add(result["id"])
+    return done_ids
+
+
+class JsonlResultWriter:
+    """Appends one json line per result and flushes it, so that a crashed run loses at most the line in progress"""
+
+    def __init__(self, output_path: str):
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(output_path, "a+", encoding="utf-8")
+        # a crashed run can leave a truncated line, the next result must start on a new line
+        if self._file.tell() > 0:
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def write(self, result: Dict[str, Any]):
+        self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self) -> "JsonlResultWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def crawl_search_term(target_page: CrawlingTargetPage, search_term: str, config: PipelineConfig) -> Tuple[CrawlingData, CrawlReport]:
+    report = CrawlReport()
+    if target_page == CrawlingTargetPage.OPENART:
+        crawling_data = crawl_openartai_search(search_term, backend=config.backend, force_refresh=config.force_refresh, report=report)
+    else:
+        crawling_data = crawl_midjourney_search(search_term, config.midjourney_cookies, force_refresh=config.force_refresh, report=report,
+                                                account=config.midjourney_account)
+    return crawling_data, report
+
+
+def select_few_shot_prompts(crawling_data: CrawlingData, texts: List[str], k: int, diversity: float) -> List[List[str]]:
+    """ Few shot prompts per text, the most relevant and diverse crawled images.
+    Crawled prompts are embedded once for all texts. Texts, for which the crawl found less than k images, use the prompt corpus.
+    """
+    prompts = [midjourney_image.prompt for midjourney_image in crawling_data.midjourney_images]
+    if len(prompts) < k:
+        return [[midjourney_image.prompt for midjourney_image in select_few_shot_examples_from_corpus(text, k, diversity)] for text in texts]
+    embeddings = hash_embed(prompts)
+    text_embeddings = hash_embed(texts)
+    return [[prompts[i] for i in mmr_select(embeddings, text_embedding, k, diversity)] for text_embedding in text_embeddings]
+
+
+def pipeline_result(item: PipelineItem, report: Optional[CrawlReport], few_shot_prompts: List[str], llm_output=None,
+                    error: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "id": item.item_id,
+        "target_page": item.target_page.value,
+        "search_term": item.search_term,
+        "text": item.text,
+        "image_prompts": llm_output.image_prompts if llm_output else [],
+        "few_shot_styles": llm_output.few_shot_styles if llm_output else [],
+        "few_shot_artists": llm_output.few_shot_artists if llm_output else [],
+        "few_shot_prompts": few_shot_prompts,
+        "crawl": {"images": report.image_count, "completed": report.completed, "errors": dict(report.errors)} if report else None,
+        "error": error,
+    }
+
+
+def run_pipeline(items: Iterable[PipelineItem], output_path: str, config: Optional[PipelineConfig] = None,
+                 llm: Optional["BaseLanguageModel"] = None) -> PipelineStats:
+    """ Crawls the search terms of all items, generates prompts for their texts and appends the results to output_path.
+    Items, which are already in output_path without error, are skipped.
+    At most config.crawl_concurrency crawls and config.generation_concurrency llm requests run at the same time.
+    """
+    config = config or PipelineConfig()
+    start = time.monotonic()
+    stats = PipelineStats()
+    done_ids = load_checkpoint(output_path)
+    pending_items: Dict[Tuple[CrawlingTargetPage, str], List[PipelineItem]] = {}
+    for item in items:
+        stats.items += 1
+        if item.item_id in done_ids:
+            stats.skipped += 1
+            continue
+        # the same item can occur several times in the input, it is generated once
+        done_ids.add(item.item_id)
+        pending_items.setdefault(item.crawl_key, []).append(item)
+    logging.info(f"Pipeline: {stats.items} items, {stats.skipped} already generated, {len(pending_items)} search terms to crawl")
+    if not pending_items:
+        return stats
+    llm = llm or create_llm(config.temperature, config.model_name)
+
+    def generate(item: PipelineItem, report: CrawlReport, few_shot_prompts: List[str]) -> Dict[str, Any]:
+        try:
+            llm_output = generate_midjourney_prompts_batch(few_shot_prompts, [item.text], llm=llm, max_concurrency=1,
+                                                           use_cache=config.use_generation_cache)[0]
+            return pipeline_result(item, report, few_shot_prompts, llm_output)
+        except Exception as e:
+            logging.exception(f"Prompt generation of item {item.item_id} failed")
+            return pipeline_result(item, report, few_shot_prompts, error=f"{type(e).__name__}: {e}")
+
+    crawl_executor = ThreadPoolExecutor(max_workers=max(1, config.crawl_concurrency), thread_name_prefix="pipeline-crawl")
+    generation_executor = ThreadPoolExecutor(max_workers=max(1, config.generation_concurrency), thread_name_prefix="pipeline-generate")
+    crawl_futures: Dict[Future, Tuple[CrawlingTargetPage, str]] = {}
+    generation_futures: Set[Future] = set()
+    try:
+        with JsonlResultWriter(output_path) as writer:
+            for crawl_key, crawl_items in pending_items.items():
+                crawl_futures[crawl_executor.submit(crawl_search_term, crawl_key[0], crawl_items[0].search_term, config)] = crawl_key
+            # crawls and generations overlap, generations of a search term start as soon as its crawl is finished
+            while crawl_futures or generation_futures:
+                finished, _ = wait(set(crawl_futures) | generation_futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in generation_futures:
+                        generation_futures.remove(future)
+                        result = future.result()
+                        if result["error"] is None:
+                            stats.generated += 1
+                        else:
+                            stats.failed += 1
+                        writer.write(result)
+                        continue
+                    crawl_items = pending_items.pop(crawl_futures.pop(future))
+                    try:
+                        crawling_data, report = future.result()
+                        few_shot_prompts = select_few_shot_prompts(crawling_data, [item.text for item in crawl_items],
+                                                                   config.few_shot_count, config.few_shot_diversity)
+                    except Exception as e:
+                        logging.exception(f"Crawling of search term '{crawl_items[0].search_term}' failed")
+                        for item in crawl_items:
+                            stats.failed += 1
+                            writer.write(pipeline_result(item, None, [], error=f"{type(e).__name__}: {e}"))
+                        continue
+                    stats.crawls += 1
+                    if not report.completed:
+                        stats.partial_crawls += 1
+                    # crawling data is not referenced anymore, only the selected prompts are kept until generation
+                    del crawling_data
+                    for item, item_few_shot_prompts in zip(crawl_items, few_shot_prompts):
+                        generation_futures.add(generation_executor.submit(generate, item, report, item_few_shot_prompts))
+    finally:
+        crawl_executor.shutdown(wait=False, cancel_futures=True)
+        generation_executor.shutdown(wait=False, cancel_futures=True)
+    stats.duration_sec = time.monotonic() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawls midjourney prompts and generates new prompts for a file of search terms and texts")
+    parser.add_argument("input_path", help="JSONL file or tab separated text file with search term and text per line")
+    parser.add_argument("output_path", help="JSONL file the results are appended to, rerun with the same file to resume")
+    parser.add_argument("--target-page", default=CrawlingTargetPage.OPENART.value, choices=[target_page.value for target_page in CrawlingTargetPage])
+    parser.add_argument("--backend", default=CrawlingBackend.SELENIUM.value, choices=[backend.value for backend in CrawlingBackend])
+    parser.add_argument("--force-refresh", action="store_true", help="ignore cached crawling results")
+    parser.add_argument("--crawl-concurrency", type=int, default=int(os.environ.get("DRIVER_POOL_SIZE", 2)))
+    parser.add_argument("--generation-concurrency", type=int, default=int(os.environ.get("PROMPT_GEN_CONCURRENCY", 4)))
+    parser.add_argument("--few-shot-count", type=int, default=5)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--model-name", default=DEFAULT_MODEL_NAME)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    config = PipelineConfig(backend=CrawlingBackend(args.backend), force_refresh=args.force_refresh,
+                            crawl_concurrency=args.crawl_concurrency, generation_concurrency=args.generation_concurrency,
+                            few_shot_count=args.few_shot_count, temperature=args.temperature, model_name=args.model_name)
+    items = list(read_pipeline_items(args.input_path, CrawlingTargetPage(args.target_page)))
+    needs_login = any(item.target_page == CrawlingTargetPage.MIDJOURNEY for item in items)
+    if needs_login and not (os.environ.get("user_name") and os.environ.get("password")):
+        parser.error("midjourney search terms need the midjourney credentials in env variables user_name and password")
+    try:
+        if needs_login:
+            # midjourney search needs an authenticated session (restored from the session store, if possible)
+            config.midjourney_cookies = login_to_midjourney_with_credentials(os.environ["user_name"], os.environ["password"])
+            config.midjourney_account = account_id(os.environ["user_name"])
+        stats = run_pipeline(items, args.output_path, config)
+    finally:
+        shutdown_driver_pool()
+    print(f"{stats.generated} generated, {stats.failed} failed, {stats.skipped} skipped of {stats.items} items "
+          f"({stats.crawls} crawls, {stats.partial_crawls} partial) in {stats.duration_sec:.0f}s ({stats.items_per_sec:.2f} items/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from utils.cache import get_cache_dir
+from utils.data_classes import MidjourneyImage, normalize_prompt
+
+WORD_REGEX = re.compile(r"\w+", re.UNICODE)
+# trigram tokenizer can only match terms with at least 3 characters
+MIN_TRIGRAM_TERM_LENGTH = 3
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha1(normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def fts_query(search_term: str, operator: str = "AND") -> Optional[str]:
+    """Converts user input to a fts5 query, every word is quoted, so that user input can not break the query syntax"""
+    words = WORD_REGEX.findall(search_term.lower())
+    if not words:
+        return None
+    return f" {operator} ".join(f'"{word}"' for word in words)
+
+
+@dataclass
+class PromptCorpusStats:
+    prompts: int = 0
+    searches: int = 0
+    search_time_avg_sec: float = 0.0
+
+
+class PromptCorpus:
+    """ Persistent corpus of all crawled prompts with a full text index (sqlite fts5).
+    Prompts are deduplicated by their normalized text. Search results are ranked by bm25,
+    word matches are supplemented by substring matches of a trigram index (e.g. parts of artist names).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._search_time_sec = 0.0
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS prompts (
+                id INTEGER PRIMARY KEY,
+                prompt_hash TEXT NOT NULL UNIQUE,
+                prompt TEXT NOT NULL,
+                image_url TEXT NOT NULL,
+                source TEXT,
+                search_term TEXT,
+                seen_count INTEGER NOT NULL DEFAULT 1,
+                created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+                prompt, content='prompts', content_rowid='id', tokenize='porter unicode61');
+            CREATE VIRTUAL TABLE IF NOT EXISTS prompts_trigram USING fts5(
+                prompt, content='prompts', content_rowid='id', tokenize='trigram');
+            CREATE TRIGGER IF NOT EXISTS prompts_after_insert AFTER INSERT ON prompts BEGIN
+                INSERT INTO prompts_fts(rowid, prompt) VALUES (new.id, new.prompt);
+                INSERT INTO prompts_trigram(rowid, prompt) VALUES (new.id, new.prompt);
+            END;
+            CREATE TRIGGER IF NOT EXISTS prompts_after_delete AFTER DELETE ON prompts BEGIN
+                INSERT INTO prompts_fts(prompts_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+                INSERT INTO prompts_trigram(prompts_trigram, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+            END;
+        """)
+
+    def add(self, midjourney_images: Iterable[MidjourneyImage], source: Optional[str] = None, search_term: Optional[str] = None) -> int:
+        """Indexes all new prompts (incremental, already known prompts are only counted). Returns the number of new prompts."""
+        now = time.time()
+        rows = [(prompt_hash(img.prompt), img.prompt, img.image_url, source, search_term, now)
+                for img in midjourney_images if img.prompt]
+        with self._lock:
+            count_before = self._count()
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany("""
+                    INSERT INTO prompts (prompt_hash, prompt, image_url, source, search_term, created_at) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (prompt_hash) DO UPDATE SET seen_count = seen_count + 1""", rows)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return self._count() - count_before
+
+    def search(self, search_term: str, limit: int = 50) -> List[MidjourneyImage]:
+        """Returns the best matching prompts of the corpus (ranked by bm25)"""
+        start = time.monotonic()
+        with self._lock:
+            rows = []
+            query = fts_query(search_term)
+            if query:
+                rows = self._connection.execute("""
+                    SELECT prompts.id, prompts.image_url, prompts.prompt FROM prompts_fts
+                    JOIN prompts ON prompts.id = prompts_fts.rowid
+                    WHERE prompts_fts MATCH ? ORDER BY bm25(prompts_fts) LIMIT ?""", (query, limit)).fetchall()
+            words = [word for word in WORD_REGEX.findall(search_term.lower()) if len(word) >= MIN_TRIGRAM_TERM_LENGTH]
+            if len(rows) < limit and words:
+                found_ids = {row[0] for row in rows}
+                trigram_rows = self._connection.execute("""
+                    SELECT prompts.id, prompts.image_url, prompts.prompt FROM prompts_trigram
+                    JOIN prompts ON prompts.id = prompts_trigram.rowid
+                    WHERE prompts_trigram MATCH ? ORDER BY bm25(prompts_trigram) LIMIT ?""",
+                                                        (fts_query(" ".join(words), operator="OR"), limit)).fetchall()
+                rows.extend(row for row in trigram_rows if row[0] not in found_ids)
+            self._searches += 1
+            self._search_time_sec += time.monotonic() - start
+        return [MidjourneyImage(image_url=image_url, prompt=prompt) for _, image_url, prompt in rows[:limit]]
+
+    def get_prompts_after(self, last_id: int, limit: int = 10000) -> List[Tuple[int, str, str]]:
+        """Returns (id, image_url, prompt) of the prompts indexed after last_id (ordered by id)"""
+        with self._lock:
+            return self._connection.execute("SELECT id, image_url, prompt FROM prompts WHERE id > ? ORDER BY id LIMIT ?",
+                                            (last_id, limit)).fetchall()
+
+    def get_by_ids(self, ids: List[int]) -> List[MidjourneyImage]:
+        """Returns the midjourney images of ids (in the same order, unknown ids are skipped)"""
+        with self._lock:
+            rows = self._connection.execute(f"SELECT id, image_url, prompt FROM prompts WHERE id IN ({','.join('?' * len(ids))})",
+                                            ids).fetchall()
+        midjourney_images = {row_id: MidjourneyImage(image_url=image_url, prompt=prompt) for row_id, image_url, prompt in rows}
+        return [midjourney_images[row_id] for row_id in ids if row_id in midjourney_images]
+
+    def _count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+    def stats(self) -> PromptCorpusStats:
+        with self._lock:
+            return PromptCorpusStats(prompts=self._count(), searches=self._searches,
+                                     search_time_avg_sec=self._search_time_sec / self._searches if self._searches else 0.0)
+
+
+_prompt_corpus: Optional[PromptCorpus] = None
+_prompt_corpus_lock = threading.Lock()
+
+
+def get_prompt_corpus() -> PromptCorpus:
+    """Returns the process wide prompt corpus. Location is configurable via env variable PROMPT_CORPUS_PATH."""
+    global _prompt_corpus
+    with _prompt_corpus_lock:
+        if _prompt_corpus is None:
+            _prompt_corpus = PromptCorpus(os.environ.get("PROMPT_CORPUS_PATH", os.path.join(get_cache_dir(), "prompt_corpus.sqlite")))
+        return _prompt_corpus
@@ -0,0 +1,160 @@
+import re
+import json
+import time
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+from llm_few_shot_gen.models.output import ImagePromptOutputModel
+
+from utils.generation_cache import GenerationCache, get_generation_cache, is_deterministic_temperature
+from utils.tracing import span
+
+if TYPE_CHECKING:
+    # langchain and the generators take more than a second to import, therefore they are imported on first use
+    from langchain.base_language import BaseLanguageModel
+    from llm_few_shot_gen.generators import MidjourneyPromptGenerator
+
+DEFAULT_MODEL_NAME = "gpt-3.5-turbo"
+DEFAULT_MAX_CONCURRENCY = 4
+IMAGE_PROMPTS_START = re.compile(r'"image_prompts"\s*:\s*\[')
+JSON_STRING = re.compile(r'\s*,?\s*("(?:[^"\\]|\\.)*")')
+
+
+def create_llm(temperature: float, model_name: str = DEFAULT_MODEL_NAME) -> "BaseLanguageModel":
+    from langchain.chat_models.openai import ChatOpenAI
+    return ChatOpenAI(temperature=temperature, model_name=model_name)
+
+
+def create_midjourney_prompt_generator(llm: "BaseLanguageModel", few_shot_prompts: List[str]) -> "MidjourneyPromptGenerator":
+    """ Returns a generator with all chat messages already set.
+    Filling the messages mutates the generator, so it is done once here and afterwards the generator can be shared between threads.
+    """
+    from llm_few_shot_gen.generators import MidjourneyPromptGenerator
+    midjourney_prompt_gen = MidjourneyPromptGenerator(llm, pydantic_cls=ImagePromptOutputModel)
+    midjourney_prompt_gen.set_few_shot_examples(few_shot_prompts)
+    midjourney_prompt_gen._fill_messages()
+    midjourney_prompt_gen.make_io_prompt_parsable()
+    return midjourney_prompt_gen
+
+
+def get_llm_model_name(llm: "BaseLanguageModel") -> str:
+    return getattr(llm, "model_name", None) or llm._llm_type
+
+
+def generate_midjourney_prompts_batch(few_shot_prompts: List[str], texts: List[str], llm: Optional["BaseLanguageModel"] = None,
+                                      temperature: float = 0.7, model_name: str = DEFAULT_MODEL_NAME,
+                                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY, use_cache: Optional[bool] = None,
+                                      generation_cache: Optional[GenerationCache] = None) -> List[ImagePromptOutputModel]:
+    """ Generates midjourney prompts for every text with the same few shot examples.
+    All texts share one generator and llm client, up to max_concurrency llm requests run at the same time.
+    llm can be any langchain language model (e.g. a fake llm), by default a ChatOpenAI client with temperature is created.
+    Generations are cached by few shot prompts, text, model and temperature. By default the cache is only used
+    for deterministic temperatures, as users expect new prompts for every click otherwise.
+    Returns one ImagePromptOutputModel per text (in the same order).
+    """
+    if not texts:
+        return []
+    llm = llm or create_llm(temperature, model_name)
+    temperature = getattr(llm, "temperature", temperature)
+    model_name = get_llm_model_name(llm)
+    if use_cache is None:
+        use_cache = is_deterministic_temperature(temperature)
+    generation_cache = (generation_cache or get_generation_cache()) if use_cache else None
+
+    llm_outputs: List[Optional[ImagePromptOutputModel]] = [None] * len(texts)
+    if generation_cache:
+        llm_outputs = [generation_cache.get(few_shot_prompts, text, model_name, temperature) for text in texts]
+    missing_texts = [text for text, llm_output in zip(texts, llm_outputs) if llm_output is None]
+    if not missing_texts:
+        return llm_outputs
+
+    midjourney_prompt_gen = create_midjourney_prompt_generator(llm, few_shot_prompts)
+
+    def generate(text: str) -> ImagePromptOutputModel:
+        logging.info(f"Generate midjourney prompts for '{text}'")
+        with span("llm.generate"):
+            llm_output = midjourney_prompt_gen.generate(text=text)
+        if generation_cache:
+            generation_cache.set(few_shot_prompts, text, model_name, temperature, llm_output)
+        return llm_output
+
+    if len(missing_texts) == 1:
+        generated_llm_outputs = [generate(missing_texts[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(missing_texts)), thread_name_prefix="prompt-gen") as executor:
+            generated_llm_outputs = list(executor.map(generate, missing_texts))
+    generated_llm_outputs_iter = iter(generated_llm_outputs)
+    return [llm_output if llm_output is not None else next(generated_llm_outputs_iter) for llm_output in llm_outputs]
+
+
+@dataclass
+class PromptGenerationUpdate:
+    """ State of a streamed prompt generation. llm_output is set by the last update, after the complete output was parsed."""
+    image_prompts: List[str]
+    llm_output: Optional[ImagePromptOutputModel] = None
+    time_to_first_prompt_sec: Optional[float] = None
+
+
+def parse_partial_image_prompts(partial_output: str) -> List[str]:
+    """Returns all completely streamed image prompts of a partial json output"""
+    match = IMAGE_PROMPTS_START.search(partial_output)
+    if match is None:
+        return []
+    image_prompts = []
+    position = match.end()
+    while True:
+        string_match = JSON_STRING.match(partial_output, position)
+        if string_match is None:
+            return image_prompts
+        image_prompts.append(json.loads(string_match.group(1)))
+        position = string_match.end()
+
+
+def stream_midjourney_prompts(few_shot_prompts: List[str], text: str, llm: Optional["BaseLanguageModel"] = None,
+                              temperature: float = 0.7, model_name: str = DEFAULT_MODEL_NAME, use_cache: Optional[bool] = None,
+                              generation_cache: Optional[GenerationCache] = None) -> Iterator[PromptGenerationUpdate]:
+    """ Generates midjourney prompts for text and yields an update every time a new image prompt was streamed by the llm.
+    The last update contains the parsed llm output (incl. few shot styles and artists).
+    Caching behaves like in generate_midjourney_prompts_batch.
+    """
+    llm = llm or create_llm(temperature, model_name)
+    temperature = getattr(llm, "temperature", temperature)
+    model_name = get_llm_model_name(llm)
+    if use_cache is None:
+        use_cache = is_deterministic_temperature(temperature)
+    generation_cache = (generation_cache or get_generation_cache()) if use_cache else None
+    llm_output = generation_cache.get(few_shot_prompts, text, model_name, temperature) if generation_cache else None
+    if llm_output is not None:
+        yield PromptGenerationUpdate(image_prompts=llm_output.image_prompts, llm_output=llm_output, time_to_first_prompt_sec=0.0)
+        return
+
+    midjourney_prompt_gen = create_midjourney_prompt_generator(llm, few_shot_prompts)
+    messages = midjourney_prompt_gen.messages.get_chat_prompt_template().format_messages(text=text)
+    start = time.monotonic()
+    time_to_first_prompt_sec = None
+    output_content = ""
+    image_prompts: List[str] = []
+    for chunk in llm.stream(messages):
+        output_content += chunk.content
+        partial_image_prompts = parse_partial_image_prompts(output_content)
+        if len(partial_image_prompts) > len(image_prompts):
+            image_prompts = partial_image_prompts
+            if time_to_first_prompt_sec is None:
+                time_to_first_prompt_sec = time.monotonic() - start
+                logging.info(f"Time to first prompt: {time_to_first_prompt_sec:.2f}s")
+            yield PromptGenerationUpdate(image_prompts=image_prompts, time_to_first_prompt_sec=time_to_first_prompt_sec)
+    logging.info(f"Streamed prompt generation finished after {time.monotonic() - start:.2f}s")
+
+    from langchain.schema import OutputParserException
+    try:
+        llm_output = midjourney_prompt_gen.output_parser.parse(output_content)
+    except OutputParserException:
+        logging.warning("Could not parse streamed llm output to pydantic class. Retry without streaming...")
+        llm_output = midjourney_prompt_gen.generate(text=text)
+    if generation_cache:
+        generation_cache.set(few_shot_prompts, text, model_name, temperature, llm_output)
+    yield PromptGenerationUpdate(image_prompts=llm_output.image_prompts, llm_output=llm_output,
+                                 time_to_first_prompt_sec=time_to_first_prompt_sec)
@@ -1,7 +1,13 @@
 import os
+from typing import List, Optional
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.webdriver import WebDriver
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+# http timeout of a single WebDriver command, so that a hung browser does not block the crawl forever.
+# Must be larger than the page load and script timeouts of the crawls.
+COMMAND_TIMEOUT_SEC = float(os.environ.get("DRIVER_COMMAND_TIMEOUT_SEC", 120))
 
 class SeleniumBrowser():
     def __init__(self) -> None:
@@ -34,6 +40,49 @@ class SeleniumBrowser():
         self.driver = init_selenium_driver(headless=self.headless, data_dir_path=self.data_dir_path)
         self.is_ready = True
 
+    def is_alive(self) -> bool:
+        """ Cheap health check, whether the driver still responds to commands"""
+        if not self.is_ready or self.driver is None:
+            return False
+        try:
+            self.driver.execute_script("return 1;")
+            return True
+        except Exception:
+            return False
+
+    def clear_session(self):
+        """ Removes all user specific state (cookies, storage, open page), so that the driver can be reused by another user"""
+        driver = self.driver
+        # close all additionally opened tabs
+        for window_handle in driver.window_handles[1:]:
+            driver.switch_to.window(window_handle)
+            driver.close()
+        driver.switch_to.window(driver.window_handles[0])
+        # delete_all_cookies() would only delete cookies of the current domain
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        # resource blocking of the previous crawl profile
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+        driver.get("about:blank")
+
+    def rss_mb(self) -> Optional[float]:
+        """ Current memory (RSS) of chromedriver and all browser processes.
+        None if it is not available (no /proc file system or the driver is not running).
+        """
+        if not os.path.isdir("/proc") or self.driver is None:
+            return None
+        try:
+            root_pid = self.driver.service.process.pid
+        except AttributeError:
+            return None
+        rss_kb = 0
+        for pid in process_tree_pids(root_pid):
+            try:
+                rss_kb += read_proc_status_kb(pid, "VmRSS")
+            except OSError:
+                continue
+        return rss_kb / 1024
+
 def init_selenium_driver(headless=True, data_dir_path=None) -> WebDriver:
     """Instantiate a WebDriver object (in this case, using Chrome)"""
     options = Options() #either firefox or chrome options
@@ -52,9 +101,38 @@ def init_selenium_driver(headless=True, data_dir_path=None) -> WebDriver:
         options.add_argument(f'--user-data-dir={data_dir_path}')
     if headless:
         options.add_argument('--headless')
+    RemoteConnection.set_timeout(COMMAND_TIMEOUT_SEC)
     return webdriver.Chrome(options=options)
 
 
+def read_proc_status_kb(pid: int, key: str) -> int:
+    """Reads a memory value (e.g. VmRSS or VmHWM) of a process from /proc (linux only)"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1])
+    return 0
+
+
+def process_tree_pids(root_pid: int) -> List[int]:
+    """root_pid and the pids of all its descendants (linux only)"""
+    children = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # ppid is the 4th field, the 2nd field (command) is in brackets and can contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(pid))
+        except (OSError, IndexError, ValueError):
+            continue
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
 def delete_files_in_path(path):
     for root, dirs, files in os.walk(path):
         for file in files:
@@ -2,8 +2,7 @@ import os
 import streamlit as st
 
 from typing import List, Any
-from utils.data_classes import SessionState, CrawlingRequest, CrawlingData, Status
-from utils.selenium_fns import SeleniumBrowser
+from utils.data_classes import SessionState, CrawlingRequest, CrawlingData, Status, CrawlingBackend
 
 
 def booleanize(s):
@@ -14,14 +13,12 @@ def is_debug():
 
 def creat_session_state() -> SessionState:
     search_term = st.session_state["search_term"]
-    request = CrawlingRequest(search_term=search_term)
+    request = CrawlingRequest(search_term=search_term, backend=get_crawling_backend())
     crawling_data = CrawlingData()
     status = Status()
     session_id = get_session_id()
-
-    browser = SeleniumBrowser()
-    browser.setup(headless=not is_debug())
-    return SessionState(crawling_request=request, browser=browser, crawling_data=crawling_data, status=status, session_id=session_id)
+    # selenium drivers are not bound to a session anymore, but leased from the process wide driver pool per crawl
+    return SessionState(crawling_request=request, crawling_data=crawling_data, status=status, session_id=session_id)
 
 
 def get_session_id():
@@ -39,8 +36,23 @@ def update_request():
     session_state: SessionState = st.session_state["session_state"]
     request = session_state.crawling_request
     request.search_term = st.session_state["search_term"]
+    request.backend = get_crawling_backend()
 
     # Reset status
     session_state.status.page_crawled = False
     session_state.status.prompts_generated = False
 
+
+def get_crawling_backend() -> CrawlingBackend:
+    """Crawling backend selected by the user"""
+    return CrawlingBackend(st.session_state.get("crawling_backend", CrawlingBackend.SELENIUM))
+
+
+def is_crawl_force_refresh() -> bool:
+    """Whether the user wants to ignore cached crawling results"""
+    return bool(st.session_state.get("crawl_force_refresh", False))
+
+
+def is_generation_cache_bypassed() -> bool:
+    """Whether the user wants new llm generations, even if a cached generation exists"""
+    return bool(st.session_state.get("generation_cache_bypass", False))
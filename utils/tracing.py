@@ -0,0 +1,169 @@
+""" Lightweight tracing of the crawl and generation pipelines.
+Spans measure the duration of named steps and are aggregated to histograms per span name,
+which can be exported in Prometheus text format or as json.
+Tracing is disabled by default (env variable TRACING=1 enables it). Disabled spans are a shared no-op context manager.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import functools
+
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS_SEC = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+RECENT_DURATIONS = 200
+RECENT_TRACES = 20
+
+_NOOP_SPAN = nullcontext()
+
+
+@dataclass
+class SpanHistogram:
+    bucket_counts: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS_SEC) + 1))
+    count: int = 0
+    sum_sec: float = 0.0
+    recent_durations: Deque[float] = field(default_factory=lambda: deque(maxlen=RECENT_DURATIONS))
+
+    def observe(self, duration_sec: float):
+        self.bucket_counts[bisect.bisect_left(BUCKETS_SEC, duration_sec)] += 1
+        self.count += 1
+        self.sum_sec += duration_sec
+        self.recent_durations.append(duration_sec)
+
+    def percentile(self, q: float) -> float:
+        """Percentile of the most recent durations"""
+        durations = sorted(self.recent_durations)
+        return durations[min(len(durations) - 1, int(q * len(durations)))] if durations else 0.0
+
+
+@dataclass
+class FinishedSpan:
+    name: str
+    start: float
+    duration_sec: float
+    depth: int
+    error: Optional[str] = None
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+        self.depth = 0
+
+    def __enter__(self) -> "Span":
+        stack = self.tracer._stack()
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration_sec = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        stack.pop()
+        self.tracer._finish(FinishedSpan(name=self.name, start=self.start, duration_sec=duration_sec, depth=self.depth,
+                                         error=exc_type.__name__ if exc_type else None), is_root=not stack)
+        return False
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: Dict[str, SpanHistogram] = {}
+        self._recent_traces: Deque[List[FinishedSpan]] = deque(maxlen=RECENT_TRACES)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name: str):
+        """Context manager which measures the duration of the step name"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name)
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._local.trace = []
+        return stack
+
+    def _finish(self, finished_span: FinishedSpan, is_root: bool):
+        trace: List[FinishedSpan] = self._local.trace
+        trace.append(finished_span)
+        with self._lock:
+            self._histograms.setdefault(finished_span.name, SpanHistogram()).observe(finished_span.duration_sec)
+            if is_root:
+                # spans finish inside out, sorted by start the root span is the first one
+                self._recent_traces.append(sorted(trace, key=lambda finished_span: finished_span.start))
+        if is_root:
+            self._local.trace = []
+
+    def histograms(self) -> Dict[str, SpanHistogram]:
+        with self._lock:
+            return {name: SpanHistogram(list(histogram.bucket_counts), histogram.count, histogram.sum_sec, deque(histogram.recent_durations))
+                    for name, histogram in self._histograms.items()}
+
+    def recent_traces(self) -> List[List[FinishedSpan]]:
+        with self._lock:
+            return list(self._recent_traces)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._recent_traces.clear()
+
+    def export_prometheus(self) -> str:
+        lines = ["# HELP span_duration_seconds Duration of pipeline steps", "# TYPE span_duration_seconds histogram"]
+        for name, histogram in sorted(self.histograms().items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(BUCKETS_SEC + [float("inf")], histogram.bucket_counts):
+                cumulative_count += bucket_count
+                le = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+                lines.append(f'span_duration_seconds_bucket{{span="{name}",le="{le}"}} {cumulative_count}')
+            lines.append(f'span_duration_seconds_sum{{span="{name}"}} {histogram.sum_sec}')
+            lines.append(f'span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def export_json(self) -> str:
+        return json.dumps({name: {"count": histogram.count, "sum_sec": histogram.sum_sec,
+                                  "p50_sec": histogram.percentile(0.5), "p95_sec": histogram.percentile(0.95),
+                                  "buckets": dict(zip([str(upper_bound) for upper_bound in BUCKETS_SEC] + ["+Inf"], histogram.bucket_counts))}
+                           for name, histogram in sorted(self.histograms().items())}, indent=2)
+
+
+_tracer = Tracer(enabled=os.environ.get("TRACING", "0") == "1")
+
+
+def get_tracer() -> Tracer:
+    """Returns the process wide tracer"""
+    return _tracer
+
+
+def span(name: str):
+    """Measures the duration of the step name with the process wide tracer (no-op if tracing is disabled)"""
+    if not _tracer.enabled:
+        return _NOOP_SPAN
+    return Span(_tracer, name)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator which wraps every call of the function into a span (named like the function by default)"""
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return fn(*args, **kwargs)
+            with Span(_tracer, span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator